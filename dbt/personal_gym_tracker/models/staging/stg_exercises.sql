@@ -21,7 +21,10 @@ cleaned as (
         exercise_template_id,
         priority,
         created_at,
-        updated_at
+        updated_at,
+        -- Partition columns: filter on them to prune the months scanned
+        year,
+        month
     from source
 )
 
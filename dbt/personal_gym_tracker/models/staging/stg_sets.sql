@@ -22,7 +22,10 @@ cleaned as (
         round(rpe, 2) as rate_of_perceived_exertion,
         indicator as set_type,
         -- Calculate volume (weight * reps)
-        round(coalesce(weight_kg * reps, 0.0), 2) as set_volume_kg
+        round(coalesce(weight_kg * reps, 0.0), 2) as set_volume_kg,
+        -- Partition columns: filter on them to prune the months scanned
+        year,
+        month
     from source
 )
 
@@ -23,7 +23,10 @@ cleaned as (
         comment_count,
         routine_id,
         created_at,
-        updated_at
+        updated_at,
+        -- Partition columns: filter on them to prune the months scanned
+        year,
+        month
     from source
 )
 
@@ -1,12 +1,30 @@
+// Partition projection shared by the partitioned Parquet tables: files live
+// under <location>/year=YYYY/month=MM/ and Athena computes the partitions
+// instead of reading them from the catalog. Keep the year range in sync with
+// modules/lambdas/silka_common/partitioning.py.
+locals {
+  partition_projection_parameters = {
+    "projection.enabled"      = "true"
+    "projection.year.type"    = "integer"
+    "projection.year.range"   = "2018,2035"
+    "projection.month.type"   = "integer"
+    "projection.month.range"  = "1,12"
+    "projection.month.digits" = "2"
+  }
+}
+
 // Glue Catalog Table for workouts data.
-// This table is external and points to data stored in S3 in the 'sorted_workouts' folder.
+// This table is external and reads the monthly gzip-compressed NDJSON archives
+// in the 'raw_archive' folder (one workout per line, see
+// modules/lambdas/silka_common/raw_archive.py). The per-workout objects in
+// 'sorted_workouts' are kept for single-workout lookups.
 resource "aws_glue_catalog_table" "workouts_table" {
   database_name = aws_athena_database.athena_workouts_database.name // Reference to Athena DB
   name          = "workouts_${var.caller_identity_id}"              // Unique table name
   table_type    = "EXTERNAL_TABLE"
 
   storage_descriptor {
-    location      = "s3://${var.data_bucket}/sorted_workouts" // S3 location for data
+    location      = "s3://${var.data_bucket}/raw_archive" // S3 location for data
     input_format  = "org.apache.hadoop.mapred.TextInputFormat"
     output_format = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat"
 
@@ -141,6 +159,24 @@ resource "aws_glue_catalog_table" "workouts_table_parquet" {
   name          = "workouts"
   table_type    = "EXTERNAL_TABLE"
 
+  // The location is swapped to a new generation by the compaction job.
+  lifecycle {
+    ignore_changes = [storage_descriptor[0].location]
+  }
+
+  partition_keys {
+    name    = "year"
+    type    = "int"
+    comment = "Year the workout started in. Partition column, filter on it to prune"
+  }
+  partition_keys {
+    name    = "month"
+    type    = "int"
+    comment = "Month (1-12) the workout started in. Partition column, filter on it to prune"
+  }
+
+  parameters = local.partition_projection_parameters
+
   storage_descriptor {
     location      = "s3://${var.data_bucket}/sorted/workouts"
     input_format  = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat"
@@ -214,6 +250,24 @@ resource "aws_glue_catalog_table" "performed_exercises_table_parquet" {
   name          = "performed_exercises"
   table_type    = "EXTERNAL_TABLE"
 
+  // The location is swapped to a new generation by the compaction job.
+  lifecycle {
+    ignore_changes = [storage_descriptor[0].location]
+  }
+
+  partition_keys {
+    name    = "year"
+    type    = "int"
+    comment = "Year the workout started in. Partition column, filter on it to prune"
+  }
+  partition_keys {
+    name    = "month"
+    type    = "int"
+    comment = "Month (1-12) the workout started in. Partition column, filter on it to prune"
+  }
+
+  parameters = local.partition_projection_parameters
+
   storage_descriptor {
     location      = "s3://${var.data_bucket}/sorted/exercises"
     input_format  = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat"
@@ -287,6 +341,24 @@ resource "aws_glue_catalog_table" "sets_table_parquet" {
   name          = "sets"
   table_type    = "EXTERNAL_TABLE"
 
+  // The location is swapped to a new generation by the compaction job.
+  lifecycle {
+    ignore_changes = [storage_descriptor[0].location]
+  }
+
+  partition_keys {
+    name    = "year"
+    type    = "int"
+    comment = "Year the workout started in. Partition column, filter on it to prune"
+  }
+  partition_keys {
+    name    = "month"
+    type    = "int"
+    comment = "Month (1-12) the workout started in. Partition column, filter on it to prune"
+  }
+
+  parameters = local.partition_projection_parameters
+
   storage_descriptor {
     location      = "s3://${var.data_bucket}/sorted/sets"
     input_format  = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat"
@@ -29,7 +29,8 @@ resource "aws_s3_bucket" "athena_queries" {
     bucket = "${var.caller_identity_id}-athena-queries-${var.bucket_suffix}"
 }
 
-// Lifecycle policy to expire objects older than 180 days in the Athena queries bucket.
+// Lifecycle policy to expire objects older than 180 days in the Athena queries bucket,
+// and cached query results after 7 days.
 resource "aws_s3_bucket_lifecycle_configuration" "lifecycle_policy" {
     bucket = aws_s3_bucket.athena_queries.bucket
 
@@ -45,4 +46,19 @@ resource "aws_s3_bucket_lifecycle_configuration" "lifecycle_policy" {
             days = 180
         }
     }
+
+    // Cached query results (see silka_common/result_cache.py) are keyed by
+    // data version; entries of old versions are never read again.
+    rule {
+        id     = "result_cache_7_days"
+        status = "Enabled"
+
+        filter {
+          prefix = "result-cache/"
+        }
+
+        expiration {
+            days = 7
+        }
+    }
 }
\ No newline at end of file
@@ -27,6 +27,7 @@ resource "aws_iam_role_policy" "s3_access" {
       Action   = [
         "s3:PutObject",
         "s3:GetObject",
+        "s3:DeleteObject",
         "s3:ListBucket",
       ]
       Resource = [
@@ -49,6 +50,9 @@ resource "aws_iam_role_policy" "dynamodb_access" {
       Action   = [
         "dynamodb:DeleteItem",
         "dynamodb:PutItem",
+        "dynamodb:BatchWriteItem",
+        "dynamodb:GetItem",
+        "dynamodb:BatchGetItem",
         "dynamodb:UpdateItem",
         "dynamodb:Scan",
         "dynamodb:Query"
@@ -100,7 +104,8 @@ resource "aws_iam_role_policy" "glue_get_table_access" {
           "glue:GetDatabase",
           "glue:GetDatabases",
           "glue:GetTableVersion",
-          "glue:GetTableVersions"
+          "glue:GetTableVersions",
+          "glue:UpdateTable"
         ]
         Resource = [
           "arn:aws:glue:eu-central-1:${data.aws_caller_identity.current.account_id}:catalog",
@@ -1,6 +1,7 @@
 import os
 import json
 import requests
+from silka_agent.tools import set_deadline
 from silka_agent.workflow import run_agent
 
 
@@ -26,6 +27,7 @@ def lambda_handler(event, context):
     prompt = event.get("prompt", "")
     print(f"Received prompt: {prompt}")
 
+    set_deadline(context)
     response = run_agent(prompt)
 
     print("Final Response:")
@@ -59,6 +59,7 @@ Rules:
 15. ALWAYS use single quotes for string literals, NEVER double quotes. Double quotes are for identifiers only.
 16. LEVERAGE RELEVANT CHUNKS: When get_glue_table_schema returns "RELEVANT SIMILAR QUERIES FROM HISTORY", study these examples carefully. Use them as templates for similar query patterns, table joins, column selections, and WHERE clause structures. Adapt the SQL syntax and logic from successful historical queries that are similar to the current user request.
 17. As a response return the query result in a human-readable format, not JSON or code blocks.
+18. PARTITIONS: workouts, performed_exercises and sets are partitioned by the integer columns `year` and `month` (month the workout started). When a question is bounded in time, ALWAYS add matching predicates on year/month of EVERY partitioned table in the query (e.g. w.year = 2024 AND w.month BETWEEN 3 AND 5 AND s.year = 2024 AND s.month BETWEEN 3 AND 5) in addition to the start_time filter, so Athena only scans the months involved.
 
 CORRECT EXAMPLES:
 - WHERE LOWER(e.title) LIKE LOWER('%Squat%') AND LOWER(e.equipment_category) LIKE LOWER('%barbell%')
@@ -1,8 +1,10 @@
-import boto3
 import json
+
+from silka_common.aws_clients import get_client
+
 from .config import region
 
-lambda_client = boto3.client("lambda", region_name=region)
+lambda_client = get_client("lambda", region_name=region)
 
 
 def invoke_lambda(function_name, payload):
@@ -3,10 +3,9 @@ import uuid
 import datetime
 import lancedb
 import numpy as np
-import boto3
 import json
 from dotenv import load_dotenv
-from .sql_metadata import extract_sql_metadata_regex
+from silka_common.aws_clients import get_client
 
 load_dotenv(".env")
 
@@ -15,7 +14,7 @@ TABLE_NAME = "workout_queries"
 
 
 def titan_embed(text: str, region: str = "eu-central-1") -> np.ndarray:
-    bedrock = boto3.client("bedrock-runtime", region_name=region)
+    bedrock = get_client("bedrock-runtime", region_name=region)
     body = {"inputText": text}
     response = bedrock.invoke_model(
         modelId="amazon.titan-embed-text-v2:0",
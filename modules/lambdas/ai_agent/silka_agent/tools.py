@@ -1,10 +1,12 @@
 import os
+import time
 from langchain_core.tools import tool
 from .lambda_client import invoke_lambda
 import json
 from .config import region, model_name, model_kwargs
 from langchain_aws import ChatBedrock
 from pydantic import BaseModel
+from silka_common.athena import poll_intervals
 
 _tool_cache = {}
 
@@ -67,18 +69,51 @@ def get_glue_table_schema(input: ToolInput) -> str:
     return final_result
 
 
-@tool
-def execute_athena_query(input_data: ToolInput) -> str:
-    """Execute a SQL query on AWS Athena.
+# Time kept back from the agent's Lambda timeout for the answer after the
+# last tool call.
+ANSWER_RESERVE_SECONDS = 30
 
-    Requires both the SQL query string (`input`) and the natural language user prompt (`user_prompt`) that led to the query.
+# Longest one execute_athena_query call polls a running query.
+MAX_QUERY_WAIT_SECONDS = 90
+
+# time.monotonic() value the agent has to answer by, see set_deadline().
+_deadline = {"at": None}
+
+# Query text -> QueryExecutionId (and data version) of queries that were
+# still running when a tool call gave up waiting, collected on the next call.
+_pending_queries = {}
+
+
+def set_deadline(context) -> None:
     """
+    Sets the time the agent has to answer by from the Lambda context; no
+    deadline locally (context None).
+    """
+    if context is None:
+        _deadline["at"] = None
+        return
+    remaining = context.get_remaining_time_in_millis() / 1000
+    _deadline["at"] = time.monotonic() + remaining
+
 
-    payload = {
-        "query": input_data.input,
-        "user_prompt": input_data.user_prompt,
-    }
+def query_wait_seconds() -> float:
+    """
+    Returns:
+        float: How long a tool call may poll a query: the agent's remaining
+            time less ANSWER_RESERVE_SECONDS, at most MAX_QUERY_WAIT_SECONDS.
+    """
+    if _deadline["at"] is None:
+        return MAX_QUERY_WAIT_SECONDS
+    remaining = _deadline["at"] - time.monotonic() - ANSWER_RESERVE_SECONDS
+    return min(max(0.0, remaining), MAX_QUERY_WAIT_SECONDS)
 
+
+def invoke_athena_lambda(payload: dict) -> tuple:
+    """
+    Invokes ExecuteAthenaQuery.
+    Returns:
+        tuple: The statusCode and the body, parsed if it is a JSON string.
+    """
     response = invoke_lambda(
         "ExecuteAthenaQuery",
         json.dumps(payload).encode("utf-8"),
@@ -92,6 +127,61 @@ def execute_athena_query(input_data: ToolInput) -> str:
             body = json.loads(body)
         except Exception:
             pass
+    return status, body
+
+
+@tool
+def execute_athena_query(input_data: ToolInput) -> str:
+    """Execute a SQL query on AWS Athena.
+
+    Requires both the SQL query string (`input`) and the natural language user prompt (`user_prompt`) that led to the query.
+    """
+
+    query = input_data.input.strip()
+    pending = _pending_queries.pop(query, None)
+    if pending is None:
+        status, body = invoke_athena_lambda(
+            {
+                "action": "submit",
+                "query": input_data.input,
+                "user_prompt": input_data.user_prompt,
+            }
+        )
+    else:
+        # Asked again for a query that was still running: poll that one.
+        status, body = 202, pending
+    # 202: the query runs on Athena, poll it while the agent has time.
+    if status == 202 and isinstance(body, dict):
+        pending = {
+            "query_execution_id": body["query_execution_id"],
+            "data_version": body.get("data_version"),
+        }
+        stop = time.monotonic() + query_wait_seconds()
+        for delay in poll_intervals():
+            if time.monotonic() + delay > stop:
+                break
+            time.sleep(delay)
+            status, body = invoke_athena_lambda(
+                {
+                    "action": "fetch_result",
+                    "wait": False,
+                    "user_prompt": input_data.user_prompt,
+                    **pending,
+                }
+            )
+            if status != 202:
+                break
+        if status == 202:
+            _pending_queries[query] = pending
+            return (
+                "\n==================== ATHENA QUERY RUNNING ====================\n"
+                f"The query is still running on Athena (query_execution_id "
+                f"{pending['query_execution_id']}).\n"
+                f"FULL QUERY:\n{input_data}\n"
+                "Call execute_athena_query again with exactly the same query to "
+                "collect its result instead of starting it again.\n"
+                "==========================================================\n"
+            )
     if status != 200:
         # Error from Lambda
         error_msg = body.get("error") if isinstance(body, dict) else body
@@ -117,9 +207,14 @@ def execute_athena_query(input_data: ToolInput) -> str:
             "NO_DATA: Athena query returned no results.\n"
             f"FULL QUERY:\n{input_data}\n"
         )
-    formatted_rows = "\n".join(", ".join(row) for row in rows[1:])
+    formatted_rows = "\n".join(
+        ", ".join("" if value is None else str(value) for value in row)
+        for row in rows[1:]
+    )
     header = ", ".join(rows[0])
     data_block = f"---BEGIN DATA---\n{header}\n{formatted_rows}\n---END DATA---"
+    if body.get("truncated"):
+        data_block += f"\nNOTE: Only the first {len(rows) - 1} rows are shown."
     return (
         "\n==================== ATHENA QUERY RESULT ====================\n"
         "CRITICAL: COPY THE DATA BELOW INTO YOUR FINAL ANSWER!\n"
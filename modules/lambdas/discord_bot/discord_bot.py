@@ -4,7 +4,8 @@ from nacl.signing import VerifyKey
 from nacl.exceptions import BadSignatureError
 import os
 from pprint import pprint
-import boto3
+
+from silka_common.aws_clients import get_client
 
 # Environment variables for configuration
 PUBLIC_KEY = os.environ.get(
@@ -45,17 +46,6 @@ COMMAND_ACCEPTED = {
     ),
 }
 
-# Headers for Hevy API requests (not used in this script)
-HEVY_HEADER = {
-    "accept": "application/json, text/plain, */*",
-    "x-api-key": "klean_kanteen_insulated",
-    "auth-token": os.environ.get("HEVY_TOKEN"),
-    "Host": "api.hevyapp.com",
-    "User-Agent": "okhttp/4.9.3",
-    "Pragma": "no-cache",
-    "Cache-Control": "no-cache",
-}
-
 
 def lambda_handler(event, context):
     """
@@ -80,9 +70,19 @@ def lambda_handler(event, context):
         if totp.verify(*otp):
             command = body["data"]["name"]
 
-            if command in ["bleb", "fetch_workouts", "print_latest_workout"]:
+            if command in [
+                "bleb",
+                "print_latest_workout",
+                "compact",
+            ]:
                 # Publish generic command to SNS
                 message = {"command": command}
+            elif command == "fetch_workouts":
+                # Publish fetch_workouts command with the optional if_running
+                message = {"command": command}
+                if_running = [o["value"] for o in options if o["name"] == "if_running"]
+                if if_running:
+                    message["if_running"] = if_running[0]
             elif command == "print_workout":
                 # Publish print_workout command with date to SNS
                 date = [o["value"] for o in options if o["name"] == "date"]
@@ -91,6 +91,12 @@ def lambda_handler(event, context):
                 # Publish ask command with prompt to SNS
                 prompt = [o["value"] for o in options if o["name"] == "prompt"]
                 message = {"command": command, "prompt": prompt[0]}
+            elif command == "sync_workouts":
+                # Publish sync_workouts command with the optional lookback
+                message = {"command": command}
+                lookback = [o["value"] for o in options if o["name"] == "lookback"]
+                if lookback:
+                    message["lookback"] = lookback[0]
             publish_to_sns(message, SNS_TOPIC_ARN)
         return COMMAND_ACCEPTED
     else:
@@ -126,7 +132,7 @@ def publish_to_sns(message: dict, sns_topic_arn: str):
         message (dict): The message to publish.
         sns_topic_arn (str): The ARN of the SNS topic.
     """
-    sns = boto3.client("sns")
+    sns = get_client("sns")
     response = sns.publish(TopicArn=sns_topic_arn, Message=json.dumps(message))
 
     print(response)
@@ -2,104 +2,56 @@ import datetime
 import json
 import os
 import uuid
-import boto3
 import time
-import re
+from urllib.parse import urlparse
 
 import lancedb
 import numpy as np
 
+from silka_common.athena import (
+    FINISHED_STATES,
+    query_error,
+    start_query,
+    wait_for_query,
+)
+from silka_common.athena_results import read_results
+from silka_common.aws_clients import get_client
+from silka_common.result_cache import ResultCache, cache_version
+from silka_common.sql_metadata import extract_sql_metadata, is_volatile
+from silka_common.sql_validation import GlueCatalog, format_errors, validate_sql
+
 ATHENA_DATABASE = os.environ.get("ATHENA_DATABASE")
 ATHENA_OUTPUT = os.environ.get("ATHENA_OUTPUT")
 DB_PATH = f"s3://{os.getenv('LANCE_DB_BUCKET')}/lancedb"
 TABLE_NAME = "workout_queries"
 
-athena = boto3.client("athena")
-
-
-def extract_sql_metadata_regex(sql_query: str) -> dict:
-    """Extract tables and columns using regex patterns, excluding aliases."""
-    tables = set()
-    columns = set()
-
-    # Extract table names from FROM and JOIN clauses (excluding aliases)
-    from_pattern = r"FROM\s+([a-zA-Z_][a-zA-Z0-9_]*)"
-    join_pattern = r"JOIN\s+([a-zA-Z_][a-zA-Z0-9_]*)"
-
-    from_matches = re.findall(from_pattern, sql_query, re.IGNORECASE)
-    join_matches = re.findall(join_pattern, sql_query, re.IGNORECASE)
-
-    tables.update(from_matches)
-    tables.update(join_matches)
-
-    # Build alias mapping to exclude them
-    alias_pattern = r"FROM\s+([a-zA-Z_][a-zA-Z0-9_]*)\s+([a-zA-Z_][a-zA-Z0-9_]*)|JOIN\s+([a-zA-Z_][a-zA-Z0-9_]*)\s+([a-zA-Z_][a-zA-Z0-9_]*)"
-    alias_matches = re.findall(alias_pattern, sql_query, re.IGNORECASE)
-
-    # Create set of known aliases
-    aliases = set()
-    for match in alias_matches:
-        if match[1]:  # FROM table alias
-            aliases.add(match[1])
-        if match[3]:  # JOIN table alias
-            aliases.add(match[3])
-
-    # Extract column names from table.column patterns (excluding aliases)
-    column_pattern = r"\b([a-zA-Z_][a-zA-Z0-9_]*)\s*\.\s*([a-zA-Z_][a-zA-Z0-9_]*)"
-    table_column_matches = re.findall(column_pattern, sql_query)
-
-    for table_alias, column in table_column_matches:
-        if table_alias not in ("DATE", "FROM_UNIXTIME", "CAST", "LOWER", "SUM"):
-            # Only add the column, never add aliases to columns
-            columns.add(column)
-            # Only add table name if it's not an alias
-            if table_alias not in aliases:
-                tables.add(table_alias)
-
-    # Extract standalone column names from SELECT (excluding AS aliases and table.column patterns)
-    select_pattern = r"SELECT\s+(.*?)\s+FROM"
-    select_match = re.search(select_pattern, sql_query, re.IGNORECASE | re.DOTALL)
-    if select_match:
-        select_clause = select_match.group(1)
-
-        # Remove AS aliases from select clause
-        select_clause = re.sub(
-            r"\s+AS\s+[a-zA-Z_][a-zA-Z0-9_]*", "", select_clause, flags=re.IGNORECASE
-        )
+# Stop waiting for a query this long before the Lambda timeout and hand the
+# query_execution_id back instead.
+DEADLINE_MARGIN_MS = 5_000
 
-        # Remove table.column patterns to avoid picking up table aliases
-        select_clause = re.sub(
-            r"\b[a-zA-Z_][a-zA-Z0-9_]*\s*\.\s*[a-zA-Z_][a-zA-Z0-9_]*", "", select_clause
-        )
+# Data rows returned at most, keeping the response under the 6 MB Lambda
+# payload limit; an event can ask for fewer with "max_rows".
+MAX_RESULT_ROWS = int(os.environ.get("MAX_RESULT_ROWS", "10000"))
 
-        # Extract simple column names (standalone, not prefixed)
-        simple_columns = re.findall(r"\b([a-zA-Z_][a-zA-Z0-9_]*)\b", select_clause)
-        for col in simple_columns:
-            if (
-                col.upper()
-                not in (
-                    "DATE",
-                    "FROM_UNIXTIME",
-                    "CAST",
-                    "AS",
-                    "DOUBLE",
-                    "SUM",
-                    "LOWER",
-                    "TOTAL_VOLUME",
-                )
-                and col not in aliases  # Exclude known aliases
-            ):
-                columns.add(col)
+# Set to "off" to run every query against Athena.
+RESULT_CACHE = os.environ.get("RESULT_CACHE", "on")
 
-    return {
-        "tables_used": list(tables),
-        "columns_used": list(columns),
-        "query_type": ["SELECT"],
-    }
+# Set to "off" to send queries to Athena without the pre-flight checks.
+SQL_VALIDATION = os.environ.get("SQL_VALIDATION", "on")
+
+athena = get_client("athena")
+s3 = get_client("s3")
+ssm = get_client("ssm")
+glue_catalog = GlueCatalog(get_client("glue"), ATHENA_DATABASE)
+
+# Results are cached next to the query results Athena writes.
+result_cache = None
+if RESULT_CACHE != "off" and ATHENA_OUTPUT:
+    result_cache = ResultCache(s3, urlparse(ATHENA_OUTPUT).netloc)
 
 
 def titan_embed(text: str, region: str = "eu-central-1") -> np.ndarray:
-    bedrock = boto3.client("bedrock-runtime", region_name=region)
+    bedrock = get_client("bedrock-runtime", region_name=region)
     body = {"inputText": text}
     response = bedrock.invoke_model(
         modelId="amazon.titan-embed-text-v2:0",
@@ -119,7 +71,7 @@ def add_successful_query_to_lancedb(
 ):
 
     # Extract metadata from the SQL query
-    query_metadata = extract_sql_metadata_regex(sql_query)
+    query_metadata = extract_sql_metadata(sql_query)
     tables_used = query_metadata.get("tables_used", [])
     columns_used = query_metadata.get("columns_used", [])
     query_type = query_metadata.get("query_type", ["SELECT"])
@@ -160,7 +112,167 @@ def add_successful_query_to_lancedb(
     print(f"✅ Successfully added query {query_id} to LanceDB.")
 
 
+def lambda_deadline(context) -> float | None:
+    """
+    Returns:
+        float | None: The time.monotonic() value to stop waiting for a query
+            at, DEADLINE_MARGIN_MS before the Lambda timeout; None locally.
+    """
+    if context is None:
+        return None
+    remaining_ms = context.get_remaining_time_in_millis() - DEADLINE_MARGIN_MS
+    return time.monotonic() + max(0, remaining_ms) / 1000
+
+
+def max_rows(event) -> int:
+    """
+    Returns:
+        int: The row cap of the request, at most MAX_RESULT_ROWS.
+    """
+    return min(int(event.get("max_rows", MAX_RESULT_ROWS)), MAX_RESULT_ROWS)
+
+
+def query_response(
+    execution: dict,
+    user_prompt: str | None,
+    max_rows: int = MAX_RESULT_ROWS,
+    data_version: str | None = None,
+) -> dict:
+    """
+    Builds the handler response for a query execution: 202 with the
+    QueryExecutionId while it runs, 500 if it failed, 200 with the rows
+    (header row first), the column types and whether max_rows cut them off.
+    A result is cached under the data version read before the query ran.
+    """
+    execution_id = execution["QueryExecutionId"]
+    state = execution["Status"]["State"]
+    if state not in FINISHED_STATES:
+        return {
+            "statusCode": 202,
+            "body": {
+                "query_execution_id": execution_id,
+                "state": state,
+                "data_version": data_version,
+            },
+        }
+    error_message = query_error(execution)
+    if error_message:
+        return {"statusCode": 500, "body": {"error": error_message}}
+
+    result = read_results(athena, s3, execution, max_rows)
+    returned_rows = len(result.rows)
+
+    if user_prompt:
+        add_successful_query_to_lancedb(
+            user_prompt,
+            execution["Query"],
+            returned_rows,
+            region="eu-central-1",
+        )
+
+    body = {
+        "query": execution["Query"],
+        "rows": [result.header()] + result.rows,
+        "columns": result.columns,
+        "truncated": result.truncated,
+        "query_execution_id": execution_id,
+    }
+    if result_cache is not None and data_version is not None:
+        result_cache.put(execution["Query"], data_version, body, max_rows)
+    return {"statusCode": 200, "body": {**body, "cached": False}}
+
+
+def preflight(query: str) -> dict | None:
+    """
+    Checks a query against the banned functions and the cached Glue
+    catalog before it costs an Athena round-trip.
+    Returns:
+        dict | None: The 400 response listing the problems, None if none.
+    """
+    try:
+        catalog = glue_catalog.tables()
+    except Exception as e:
+        print(f"Glue catalog unavailable, checking functions only: {e}")
+        catalog = None
+    errors = validate_sql(query, catalog)
+    if any(error.code == "unknown_table" for error in errors):
+        # The table may be newer than the cached catalog.
+        errors = validate_sql(query, glue_catalog.tables(reload=True))
+    if not errors:
+        return None
+    print(f"Query rejected by the pre-flight checks:\n{format_errors(errors)}")
+    return {
+        "statusCode": 400,
+        "body": {
+            "error": "Query rejected before running it:\n" + format_errors(errors),
+            "validation_errors": [error.to_dict() for error in errors],
+        },
+    }
+
+
+def cached_response(query: str, max_rows: int, data_version: str) -> dict | None:
+    """
+    Returns:
+        dict | None: The 200 response of a cached result, None on a miss.
+            Hits are not added to LanceDB: only queries that ran on Athena
+            go into the similar-query history.
+    """
+    body = result_cache.get(query, data_version, max_rows)
+    if body is None:
+        return None
+    print(f"Result cache hit at version {data_version}.")
+    return {"statusCode": 200, "body": {**body, "cached": True}}
+
+
+def fetch_result(event, context) -> dict:
+    """
+    The fetch_result action: waits for a submitted query (at most until
+    the Lambda deadline, or not at all with "wait": false) and returns its
+    result like the run action.
+    """
+    execution_id = event.get("query_execution_id")
+    if not execution_id:
+        return {"statusCode": 400, "body": "Missing 'query_execution_id' in event."}
+    deadline = lambda_deadline(context) if event.get("wait", True) else 0.0
+    execution = wait_for_query(athena, execution_id, deadline)
+    return query_response(
+        execution,
+        event.get("user_prompt"),
+        max_rows(event),
+        event.get("data_version"),
+    )
+
+
 def lambda_handler(event, context):
+    """
+    Actions (event["action"]):
+    - "run" (default): submits the query and waits for it with adaptive
+      polling; returns 202 with the query_execution_id if it is still
+      running near the Lambda timeout.
+    - "submit": submits the query and returns its query_execution_id at once.
+    - "fetch_result": returns the result of a submitted query.
+    "run" and "fetch_result" return at most event["max_rows"] data rows.
+    "run" and "submit" answer from the result cache (200 with "cached": true)
+    while the data has not changed and on the same UTC day, unless
+    event["cache"] is false or the query uses the current time, and
+    reject SQL that fails the pre-flight checks with 400 and
+    "validation_errors", unless event["validate"] is false.
+    """
+    try:
+        return handle(event, context)
+    finally:
+        if result_cache is not None:
+            result_cache.log_metrics()
+
+
+def handle(event, context) -> dict:
+    """
+    Runs the action of an event, see lambda_handler.
+    """
+    action = event.get("action", "run")
+    if action == "fetch_result":
+        return fetch_result(event, context)
+
     query = event.get("query")
     user_prompt = event.get("user_prompt")
     if not query:
@@ -170,45 +282,31 @@ def lambda_handler(event, context):
     print(f"ATHENA_OUTPUT = {ATHENA_OUTPUT}")
     print(f"Query = {query}")
 
-    # Start Athena query execution
-    response = athena.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={"Database": ATHENA_DATABASE},
-        ResultConfiguration={"OutputLocation": ATHENA_OUTPUT},
-    )
-    execution_id = response["QueryExecutionId"]
-
-    # Wait for the query to finish
-    while True:
-        result = athena.get_query_execution(QueryExecutionId=execution_id)
-        state = result["QueryExecution"]["Status"]["State"]
-        if state in ["SUCCEEDED", "FAILED", "CANCELLED"]:
-            break
-        time.sleep(1)
-
-    if state != "SUCCEEDED":
-        # Get the error message from Athena if available
-        error_message = f"Athena query failed with state: {state}"
-        if state == "FAILED":
-            status_info = result["QueryExecution"]["Status"]
-            if "StateChangeReason" in status_info:
-                error_message += f" - {status_info['StateChangeReason']}"
-        return {"statusCode": 500, "body": {"error": error_message}}
-
-    # Fetch results
-    results = athena.get_query_results(QueryExecutionId=execution_id)
-    rows = []
-    for row in results["ResultSet"]["Rows"]:
-        rows.append([col.get("VarCharValue", "") for col in row["Data"]])
-
-        # here will be the logic to insert the query into LanceDB
-    returned_rows = len(rows) - 1  # Exclude header row
-
-    add_successful_query_to_lancedb(
-        user_prompt,
-        query,
-        returned_rows,
-        region="eu-central-1",
-    )
-
-    return {"statusCode": 200, "body": {"query": query, "rows": rows}}
+    if SQL_VALIDATION != "off" and event.get("validate", True):
+        response = preflight(query)
+        if response is not None:
+            return response
+
+    # The cache version (data version and UTC date) read before the query
+    # runs; None leaves the result uncached. Results of queries using the
+    # current time or randomness are never cached.
+    data_version = None
+    if result_cache is not None and event.get("cache", True) and not is_volatile(query):
+        data_version = cache_version(ssm)
+        response = cached_response(query, max_rows(event), data_version)
+        if response is not None:
+            return response
+
+    execution_id = start_query(athena, query, ATHENA_DATABASE, ATHENA_OUTPUT)
+    if action == "submit":
+        return {
+            "statusCode": 202,
+            "body": {
+                "query_execution_id": execution_id,
+                "state": "QUEUED",
+                "data_version": data_version,
+            },
+        }
+
+    execution = wait_for_query(athena, execution_id, lambda_deadline(context))
+    return query_response(execution, user_prompt, max_rows(event), data_version)
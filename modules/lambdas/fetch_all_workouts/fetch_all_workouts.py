@@ -1,321 +1,266 @@
-import json
-import requests
-import boto3
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, takewhile
+from typing import Iterable, Iterator
 import os
-import pandas as pd
-import pyarrow as pa
-import pyarrow.parquet as pq
-import io
 
+from silka_common.aws_clients import format_client_stats, get_client
+from silka_common.backfill import DEFAULT_CHECKPOINT_EVERY, run_backfill
+from silka_common.fanout import (
+    DEFAULT_SHARDS,
+    LambdaInvoker,
+    LocalInvoker,
+    run_shard,
+    start_fanout,
+)
+from silka_common.hevy_client import BATCH_SIZE, HevyClient, get_hevy_client
+from silka_common.memory import PeakMemoryTracker
+from silka_common.metadata import read_backfill_cursor
 
-def upload_file_to_s3(file_path, bucket_name, body):
+# Default size of the worker pool used by the concurrent backfill.
+DEFAULT_MAX_WORKERS = 8
+
+# Pages each worker may fetch ahead of the consumer when streaming.
+PREFETCH_PAGES_PER_WORKER = 2
+
+# This function, as invoked by fan-out workers started outside of Lambda.
+FUNCTION_NAME = "FetchAllWorkoutsFromHevy"
+
+
+def plan_batch_indexes(workout_count: int, start_index: int = 0) -> list[int]:
     """
-    Uploads a file to the specified S3 bucket.
+    Plans the start index of every workouts_batch page, assuming the index
+    space is dense (0..workout_count - 1).
     Args:
-        file_path (str): The S3 key (path) for the file.
-        bucket_name (str): The S3 bucket name.
-        body (bytes): The file content as bytes.
+        workout_count (int): The number of workouts reported by /workout_count.
+        start_index (int): The workout index the first page starts at.
+    Returns:
+        list[int]: The start index of each page, in ascending order.
     """
-    s3 = boto3.client("s3")
-    s3.put_object(Bucket=bucket_name, Key=file_path, Body=body)
+    return list(range(start_index, max(workout_count, start_index + 1), BATCH_SIZE))
 
 
-def register_file_in_dynamodb(table_name: str, item: dict) -> None:
+def find_first_gap(pages: list[list[dict]], starts: list[int]) -> int | None:
     """
-    Registers a workout file in DynamoDB.
+    Finds the first planned page whose workouts do not carry the contiguous
+    indexes the plan expected, i.e. where the index space is sparse.
     Args:
-        table_name (str): The DynamoDB table name.
-        item (dict): The item to put in the table.
+        pages (list[list[dict]]): The fetched pages, in plan order.
+        starts (list[int]): The planned start index of each page.
+    Returns:
+        int | None: The position of the first page with a gap, or None.
     """
-    dynamodb = boto3.client("dynamodb")
-    dynamodb.put_item(TableName=table_name, Item=item)
-
-
-def update_latest_workout_parameter_store(table_name: str) -> None:
+    for position, (start, page) in enumerate(zip(starts, pages)):
+        indexes = [w["index"] for w in page]
+        if indexes != list(range(start, start + len(indexes))):
+            return position
+        # A short page before the end of the plan means workouts are missing.
+        if len(page) < BATCH_SIZE and position < len(starts) - 1:
+            return position
+    return None
+
+
+def iter_workouts_concurrently(
+    client: HevyClient,
+    workout_count: int,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    start_index: int = 0,
+    end_index: int | None = None,
+) -> Iterator[dict]:
     """
-    Scans DynamoDB for the highest workout index and updates SSM Parameter Store.
+    Fetches every workout by planning the page indexes from the workout count
+    up front and requesting the pages through a bounded worker pool.
+
+    Pages are yielded in index order as soon as they and every page before
+    them have arrived; at most PREFETCH_PAGES_PER_WORKER pages per worker are
+    requested ahead of the consumer, so memory does not grow with the
+    history. The tail page is probed first: if its indexes do not line up
+    with the plan the index space is sparse (deleted workouts) and the serial
+    cursor walk is used instead. A gap found along the way is repaired by
+    resuming the cursor walk from the last contiguous index. With an
+    end_index (a fan-out shard) nothing at or above it is fetched or yielded,
+    beyond the page that crosses it.
     Args:
-        table_name (str): The DynamoDB table name.
+        client (HevyClient): The Hevy API client.
+        workout_count (int): The number of workouts reported by /workout_count.
+        max_workers (int): The maximum number of pages fetched in parallel.
+        start_index (int): The workout index to start at.
+        end_index (int, optional): The first workout index not to yield.
+    Yields:
+        dict: Every workout with start_index <= index < end_index, in index
+            order.
     """
-    dynamodb = boto3.client("dynamodb")
-
-    scan_params = {
-        "TableName": table_name,
-        "ProjectionExpression": "#Index",
-        "ExpressionAttributeNames": {"#Index": "index"},
-    }
-
-    response = dynamodb.scan(**scan_params)
-    items = response.get("Items", [])
 
-    indexes = []
-    for item in items:
-        indexes.append(int(item["index"]["S"]))
-
-    latest_workout_index = max(indexes)
+    def bounded(workouts: Iterable[dict]) -> Iterable[dict]:
+        if end_index is None:
+            return workouts
+        return takewhile(lambda workout: workout["index"] < end_index, workouts)
+
+    if end_index is not None:
+        workout_count = min(workout_count, end_index)
+    starts = plan_batch_indexes(workout_count, start_index)
+
+    tail_page = client.workouts_batch(starts[-1])
+    if find_first_gap([tail_page], starts[-1:]) is not None:
+        print("Workout index space is sparse, falling back to the serial walk.")
+        yield from bounded(client.iter_workouts(start_index))
+        return
+
+    resume_index = start_index
+    max_workers = max(1, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        planned = iter(starts[:-1])
+        in_flight = deque()
+        for start in islice(planned, max_workers * PREFETCH_PAGES_PER_WORKER):
+            in_flight.append((start, executor.submit(client.workouts_batch, start)))
+
+        while in_flight:
+            start, future = in_flight.popleft()
+            page = future.result()
+            # Every page before the tail must be full and contiguous.
+            indexes = [w["index"] for w in page]
+            if indexes != list(range(start, start + BATCH_SIZE)):
+                print(
+                    f"Gap detected at page starting at index {start}, resuming serially."
+                )
+                for _, pending in in_flight:
+                    pending.cancel()
+                yield from bounded(client.iter_workouts(resume_index))
+                return
+            yield from page
+            resume_index = start + BATCH_SIZE
+            for start in islice(planned, 1):
+                in_flight.append((start, executor.submit(client.workouts_batch, start)))
+
+    yield from bounded(tail_page)
+    # Resume the cursor walk when the last planned page was full because
+    # workouts were added after /workout_count was called.
+    if len(tail_page) == BATCH_SIZE and end_index is None:
+        yield from client.iter_workouts(tail_page[-1]["index"] + 1)
+
+
+def fanout_invoker(event: dict, context):
+    """
+    Picks how the fan-out workers are started: "lambda" (the default) sends
+    asynchronous invocations of this function, "local" runs them on threads
+    of this process.
+    """
+    if event.get("invoker", "lambda") == "local":
+        return LocalInvoker(lambda_handler, int(event.get("shards", DEFAULT_SHARDS)))
+    function_name = context.invoked_function_arn if context else FUNCTION_NAME
+    return LambdaInvoker(function_name)
 
-    ssm = boto3.client("ssm")
 
-    ssm.put_parameter(
-        Name="/926728314305/latest-workout-index",
-        Value=str(latest_workout_index),
-        Type="String",
-        Overwrite=True,
+def ingest_shard(task: dict, context) -> dict:
+    """
+    Fan-out worker: ingests the workouts of one shard of the index space with
+    a client limited to the shard's share of the Hevy API rate (task["rate"]
+    and task["burst"], see start_fanout).
+    Args:
+        task (dict): The shard task sent by the coordinator.
+        context: The Lambda context, None when run by a LocalInvoker.
+    Returns:
+        dict: The run summary after the shard committed, or the task of its
+            continuation.
+    """
+    # Not the shared client: its token bucket allows the whole rate, and the
+    # shards run side by side.
+    client = HevyClient.from_env(rate=task.get("rate"), burst=task.get("burst"))
+    max_workers = int(task.get("max_workers", DEFAULT_MAX_WORKERS))
+    result = run_shard(
+        os.environ.get("BUCKET_NAME"),
+        os.environ.get("DYNAMODB_TABLE_NAME"),
+        task,
+        lambda start: iter_workouts_concurrently(
+            client, task["workout_count"], max_workers, start, task["end_index"]
+        ),
+        remaining_ms=context.get_remaining_time_in_millis if context else None,
+        invoker=LambdaInvoker(context.invoked_function_arn) if context else None,
     )
-
-
-def normalize_workout_star_schema(workout):
-    # Discard logic (same as in normalize_workout_to_sets)
-    discard_workout = {
-        "media",
-        "user_id",
-        "username",
-        "comments",
-        "short_id",
-        "verified",
-        "image_urls",
-        "description",
-        "like_images",
-        "profile_image",
-        "is_liked_by_user",
-        "apple_watch",
-        "wearos_watch",
-        "is_private",
-        "like_count",
-        "preview_workout_likes",
-    }
-    discard_exercise = {
-        "url",
-        "notes",
-        "de_title",
-        "es_title",
-        "fr_title",
-        "it_title",
-        "ja_title",
-        "ko_title",
-        "pt_title",
-        "ru_title",
-        "tr_title",
-        "media_type",
-        "other_muscles",
-        "prs",
-        "personalRecords",
-        "superset_id",
-        "zh_cn_title",
-        "zh_tw_title",
-        "thumbnail_url",
-        "custom_exercise_image_url",
-        "custom_exercise_image_thumbnail_url",
-        "volume_doubling_enabled",
-    }
-    discard_set = {
-        "prs",
-        "personalRecords",
-        "custom_metric",
-        "completed_at",
-    }
-
-    # Workout table: one row per workout
-    workout_row = {
-        k: v
-        for k, v in workout.items()
-        if k != "exercises" and k not in discard_workout
-    }
-    workouts = [workout_row]
-
-    exercises = []
-    sets = []
-
-    for exercise in workout.get("exercises", []):
-        exercise_id = exercise.get("id")
-        # Exercise table: one row per exercise, with workout_id as FK
-        exercise_row = {
-            k: v
-            for k, v in exercise.items()
-            if k != "sets"
-            and not (k.endswith("title") and k != "title")
-            and k not in discard_exercise
-        }
-        exercise_row["workout_id"] = workout["id"]
-        exercises.append(exercise_row)
-
-        for s in exercise.get("sets", []):
-            set_row = {k: v for k, v in s.items() if k not in discard_set}
-            set_row["exercise_id"] = exercise_id
-            set_row["workout_id"] = workout["id"]
-            sets.append(set_row)
-
-    return workouts, exercises, sets
-
-
-def enforce_types(df, table: str):
-    # Define the target types for columns, based on your Glue schema:
-    dtype_map = {
-        "workout": {
-            "id": "string",
-            "name": "string",
-            "index": "Int64",
-            "end_time": "Int64",
-            "created_at": "string",
-            "routine_id": "string",
-            "start_time": "Int64",
-            "updated_at": "string",
-            "nth_workout": "Int64",
-            "comment_count": "Int64",
-            "estimated_volume_kg": "float64",
-        },
-        "exercise": {
-            "id": "string",
-            "title": "string",
-            "index": "Int64",
-            "workout_id": "string",
-            "created_at": "string",
-            "updated_at": "string",
-            "exercise_type": "string",
-            "equipment_category": "string",
-            "exercise_template_id": "string",
-            "priority": "Int64",
-            "muscle_group": "string",
-        },
-        "set": {
-            "id": "string",
-            "rpe": "float64",
-            "reps": "Int64",
-            "index": "Int64",
-            "indicator": "string",
-            "weight_kg": "float64",
-            "distance_meters": "float64",
-            "duration_seconds": "Int64",
-            "exercise_id": "string",
-            "workout_id": "string",
-        },
-    }
-
-    for col, dtype in dtype_map[table].items():
-        if col in df.columns:
-            if dtype == "string":
-                # Convert to string, filling missing with None
-                df[col] = df[col].astype(str).replace({"nan": None, "None": None})
-            elif dtype == "Int64":
-                # Nullable integer type, convert safely
-                df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
-            elif dtype == "float64":
-                df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
-    return df
+    print(client.format_stats())
+    return result
 
 
 def lambda_handler(event, context):
-    all_workouts = []
-
-    headers = {
-        "accept": "application/json, text/plain, */*",
-        "x-api-key": "klean_kanteen_insulated",
-        "auth-token": os.environ.get("HEVY_TOKEN"),
-        "Host": "api.hevyapp.com",
-        "User-Agent": "okhttp/4.9.3",
-        "Pragma": "no-cache",
-        "Cache-Control": "no-cache",
-    }
-
-    response = requests.get("https://api.hevyapp.com/workout_count", headers=headers)
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch workout count: {response.text}")
-    workout_count = response.json()["workout_count"]
-
-    response = requests.get("https://api.hevyapp.com/workouts_batch/0", headers=headers)
-    workouts = response.json()
-    all_workouts += workouts
+    # A fan-out worker only looks at its own shard (see silka_common/fanout.py).
+    if "shard" in event:
+        return ingest_shard(event["shard"], context)
 
+    # Shared across warm invocations: pooled connections, rate limit, retries.
+    # Its stats start over so that the result reports this run only.
+    client = get_hevy_client()
+    client.reset_stats()
+
+    workout_count = client.workout_count()
     bucket_name = os.environ.get("BUCKET_NAME")
     table_name = os.environ.get("DYNAMODB_TABLE_NAME")
 
-    while len(workouts) == 10:
-        response = requests.get(
-            "https://api.hevyapp.com/workouts_batch/" + str(workouts[-1]["index"] + 1),
-            headers=headers,
-        )
-        workouts = response.json()
-        all_workouts += workouts
-
-    all_workouts.sort(key=lambda x: x["start_time"], reverse=True)
-
-    count = 0
-    for w in all_workouts:
-        workout_id = w["id"]
-        timestamp = str(datetime.fromtimestamp(w["start_time"]))
-        year, month, day = timestamp.split(" ")[0].split("-")
-
-        file_path = f"sorted_workouts/{year}/{month}/{day}/{workout_id}.json"
-        body = bytes(json.dumps(w).encode("UTF-8"))
-        upload_file_to_s3(file_path, bucket_name, body)
-
-        file_path_parquet_workouts = (
-            f"sorted/workouts/{year}/{month}/{day}/{workout_id}.parquet"
+    # "fanout" splits the index space into shards ingested in parallel by
+    # worker invocations; the high-water mark moves once all have committed.
+    if event.get("mode") == "fanout":
+        options = {
+            key: event[key]
+            for key in ("dry_run", "checkpoint_every", "max_workers")
+            if key in event
+        }
+        return start_fanout(
+            table_name,
+            workout_count,
+            fanout_invoker(event, context),
+            int(event.get("shards", DEFAULT_SHARDS)),
+            options,
+            rate=client.bucket.rate,
+            burst=client.bucket.burst,
         )
 
-        file_path_parquet_exercises = (
-            f"sorted/exercises/{year}/{month}/{day}/{workout_id}.parquet"
+    # A previous run that stopped early left a cursor; resume there unless
+    # the event asks for a restart. A dry run always looks at everything.
+    dry_run = bool(event.get("dry_run", False))
+    start_index = 0
+    if not dry_run and not event.get("restart", False):
+        start_index = read_backfill_cursor(get_client("dynamodb"), table_name) or 0
+    if start_index:
+        print(f"Resuming the backfill at workout index {start_index}.")
+
+    # "concurrent" plans the page indexes from the workout count and fetches
+    # them in parallel; "serial" keeps the original cursor walk. Streaming
+    # (the default) hands workouts to the backfill as pages arrive instead of
+    # loading the whole history first; "stream": false restores the latter.
+    mode = event.get("mode", "concurrent")
+    if mode == "serial":
+        workouts = client.iter_workouts(start_index)
+    else:
+        max_workers = int(event.get("max_workers", DEFAULT_MAX_WORKERS))
+        workouts = iter_workouts_concurrently(
+            client, workout_count, max_workers, start_index
         )
 
-        file_path_parquet_sets = (
-            f"sorted/sets/{year}/{month}/{day}/{workout_id}.parquet"
+    # Peak memory over fetching and storing, to size the Lambda's memory. The
+    # Arrow pool peak and RSS are always reported; tracemalloc slows every
+    # allocation down, so the Python heap peak only with "trace_memory": true.
+    with PeakMemoryTracker(enabled=event.get("trace_memory", False)) as tracker:
+        if not event.get("stream", True):
+            workouts = list(workouts)
+
+        # Ingests in index order, skipping unchanged workouts and checkpointing
+        # the cursor; the ingestor also advances the latest-workout-index counter.
+        result = run_backfill(
+            bucket_name,
+            table_name,
+            workouts,
+            dry_run=dry_run,
+            checkpoint_every=int(
+                event.get("checkpoint_every", DEFAULT_CHECKPOINT_EVERY)
+            ),
+            remaining_ms=context.get_remaining_time_in_millis if context else None,
+            start_index=start_index,
         )
-
-        workout, exercises, sets = normalize_workout_star_schema(w)
-        if workout:
-            df = pd.DataFrame(workout)
-            df = enforce_types(df, "workout")
-            table = pa.Table.from_pandas(df)
-            parquet_buffer = io.BytesIO()
-            pq.write_table(table, parquet_buffer)
-            parquet_buffer.seek(0)
-            upload_file_to_s3(
-                file_path_parquet_workouts, bucket_name, parquet_buffer.read()
-            )
-
-        if exercises:
-            df = pd.DataFrame(exercises)
-            df = enforce_types(df, "exercise")
-            table = pa.Table.from_pandas(df)
-            parquet_buffer = io.BytesIO()
-            pq.write_table(table, parquet_buffer)
-            parquet_buffer.seek(0)
-            upload_file_to_s3(
-                file_path_parquet_exercises, bucket_name, parquet_buffer.read()
-            )
-
-        if sets:
-            df = pd.DataFrame(sets)
-            df = enforce_types(df, "set")
-            table = pa.Table.from_pandas(df)
-            parquet_buffer = io.BytesIO()
-            pq.write_table(table, parquet_buffer)
-            parquet_buffer.seek(0)
-            upload_file_to_s3(
-                file_path_parquet_sets, bucket_name, parquet_buffer.read()
-            )
-
-        item = {
-            "index": {"S": str(w["index"])},
-            "name": {"S": str(w["name"])},
-            "id": {"S": str(w["id"])},
-            "nth_workout": {"N": str(w["nth_workout"])},
-            "start_time": {"N": str(w["start_time"])},
-            "bucket_name": {"S": str(bucket_name)},
-            "key": {"S": str(file_path)},
-            "workout_day": {
-                "S": datetime.fromtimestamp(w["start_time"]).strftime("%Y-%m-%d")
-            },
-        }
-
-        register_file_in_dynamodb(table_name, item)
-        count += 1
-        print(
-            f"Processed workout {count}/{workout_count}: {w['name']} (ID: {workout_id})"
-        )
-
-    update_latest_workout_parameter_store(table_name)
+    result["memory"] = tracker.report()
+    result["hevy_api"] = client.stats()
+    print(tracker.format())
+    print(client.format_stats())
+    print(format_client_stats())
+    return result
 
 
 if __name__ == "__main__":
@@ -1,16 +1,17 @@
 import json
 import os
-import boto3
 import lancedb
 import numpy as np
 import datetime
 
+from silka_common.aws_clients import get_client
+
 DB_PATH = f"s3://{os.getenv('BUCKET_NAME')}/lancedb"
 TABLE_NAME = "workout_queries"
 
 
 def titan_embed(text: str, region: str = "eu-central-1") -> np.ndarray:
-    bedrock = boto3.client("bedrock-runtime", region_name=region)
+    bedrock = get_client("bedrock-runtime", region_name=region)
     body = {"inputText": text}
     response = bedrock.invoke_model(
         modelId="amazon.titan-embed-text-v2:0",
@@ -58,19 +59,21 @@ def retrieve_relevant_chunks(user_query: str, k: int = 3) -> list[dict]:
 
 def lambda_handler(event, context):
     # Fetch AWS account ID dynamically
-    sts = boto3.client("sts")
+    sts = get_client("sts")
     account_id = sts.get_caller_identity()["Account"]
 
     database_name = f"{account_id}_workouts_database"
 
-    glue = boto3.client("glue")
+    glue = get_client("glue")
 
     # Fetch the schema for all four tables
     table_names = ["workouts", "performed_exercises", "sets", "exercise_catalog"]
     schemas = {}
     for table_name in table_names:
         response = glue.get_table(DatabaseName=database_name, Name=table_name)
-        columns = response["Table"]["StorageDescriptor"]["Columns"]
+        table = response["Table"]
+        # Partition keys (year/month) are queryable columns too.
+        columns = table["StorageDescriptor"]["Columns"] + table.get("PartitionKeys", [])
         schemas[table_name] = {
             "table_name": table_name,
             "columns": [
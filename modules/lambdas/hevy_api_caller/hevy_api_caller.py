@@ -1,26 +1,30 @@
 import requests
 import os
-import boto3
-from datetime import datetime
 import json
-import pandas as pd
-import pyarrow as pa
-import pyarrow.parquet as pq
-import io
+
+from silka_common.aws_clients import format_client_stats, get_client
+from silka_common.hevy_client import get_hevy_client
+from silka_common.metadata import LATEST_WORKOUT_INDEX_PARAMETER
+
+# Heavy modules (pyarrow through the ingestion and compaction code) each
+# command needs. They are imported inside the command functions, so the
+# other commands do not pay for them on a cold start; keep this map in sync
+# with those imports, side-scripts/benchmarks/cold_start.py profiles it.
+COMMAND_MODULES = {
+    "bleb": (),
+    "fetch_workouts": ("silka_common.ingestion", "silka_common.compaction"),
+    "print_latest_workout": (),
+    "print_workout": (),
+    "ask": (),
+    "compact": ("silka_common.compaction",),
+    "sync_workouts": ("silka_common.sync",),
+}
 
 # Discord webhook URL for sending notifications
 DISCORD_WEBHOOK = os.environ.get("DISCORD_WEBHOOK")
 
-# Headers for authenticating with the Hevy API
-HEVY_HEADER = {
-    "accept": "application/json, text/plain, */*",
-    "x-api-key": "klean_kanteen_insulated",
-    "auth-token": os.environ.get("HEVY_TOKEN"),
-    "Host": "api.hevyapp.com",
-    "User-Agent": "okhttp/4.9.3",
-    "Pragma": "no-cache",
-    "Cache-Control": "no-cache",
-}
+# Lease serializing fetch_workouts runs (see silka_common/lease.py).
+FETCH_LEASE = "fetch-workouts"
 
 
 def lambda_handler(event, context):
@@ -30,6 +34,8 @@ def lambda_handler(event, context):
     """
     received_message = event["Records"][0]["Sns"]["Message"]
     command_handler(received_message)
+    # Clients live across warm invocations; this shows how much is reused.
+    print(format_client_stats())
 
 
 def send_message(message: str, webhook_url: str) -> None:
@@ -62,7 +68,7 @@ def command_handler(message: str):
         )
         print("bleb")
     elif command == "fetch_workouts":
-        fetch_recent_workouts()
+        fetch_recent_workouts(message.get("if_running"))
     elif command == "print_latest_workout":
         print_latest_workout()
     elif command == "print_workout":
@@ -70,30 +76,45 @@ def command_handler(message: str):
         print_workout(date)
     elif command == "ask":
         ask_ai_agent(message["prompt"])
+    elif command == "compact":
+        compact_parquet_tables()
+    elif command == "sync_workouts":
+        sync_edited_workouts(message.get("lookback"))
     else:
         print("no bleb")
 
 
-def fetch_recent_workouts() -> None:
+def fetch_recent_workouts(if_running: str | None = None) -> None:
     """
     Fetches recent workouts from the Hevy API, uploads them to S3,
     registers them in DynamoDB, and updates the latest workout index in SSM.
     Sends notifications to Discord on completion or error.
-    """
-    ssm = boto3.client("ssm")
-    response = ssm.get_parameter(Name="/926728314305/latest-workout-index")
 
-    latest_workout_index = int(response["Parameter"]["Value"])
+    The fetch runs under the FETCH_LEASE lease, so concurrent commands never
+    ingest the same workouts twice. A command finding a fetch running waits
+    for it ("wait"), has it fetch once more when it is done ("coalesce", the
+    default) or exits ("exit").
+    Args:
+        if_running (str, optional): What to do if a fetch is running; the
+            INGEST_LEASE_MODE variable or "coalesce" if omitted.
+    """
+    from silka_common.ingestion import WorkoutIngestor
+    from silka_common.lease import run_exclusively
 
     bucket_name = os.environ.get("BUCKET_NAME")
     table_name = os.environ.get("DYNAMODB_TABLE_NAME")
+    loaded = []
 
-    try:
-        response = requests.get(
-            f"https://api.hevyapp.com/workouts_batch/{str(latest_workout_index + 1)}",
-            headers=HEVY_HEADER,
-        )
-        workouts = response.json()
+    def fetch(lease) -> None:
+        ssm = get_client("ssm")
+        response = ssm.get_parameter(Name=LATEST_WORKOUT_INDEX_PARAMETER)
+
+        latest_workout_index = int(response["Parameter"]["Value"])
+
+        hevy = get_hevy_client()
+        hevy.reset_stats()
+        workouts = hevy.workouts_batch(latest_workout_index + 1)
+        print(hevy.format_stats())
 
         if len(workouts) == 0:
             print("No workouts to fetch since the last update.")
@@ -103,86 +124,44 @@ def fetch_recent_workouts() -> None:
                 webhook_url=DISCORD_WEBHOOK,
             )
         else:
-            for w in workouts:
-                workout_id = w["id"]
-                timestamp = str(datetime.fromtimestamp(w["start_time"]))
-                year, month, day = timestamp.split(" ")[0].split("-")
-
-                file_path = f"sorted_workouts/{year}/{month}/{day}/{workout_id}.json"
-                body = bytes(json.dumps(w).encode("UTF-8"))
-
-                upload_file_to_s3(file_path, bucket_name, body)
-
-                # Process parquet files
-                file_path_parquet_workouts = (
-                    f"sorted/workouts/{year}/{month}/{day}/{workout_id}.parquet"
-                )
-
-                file_path_parquet_exercises = (
-                    f"sorted/exercises/{year}/{month}/{day}/{workout_id}.parquet"
-                )
-
-                file_path_parquet_sets = (
-                    f"sorted/sets/{year}/{month}/{day}/{workout_id}.parquet"
-                )
-
-                workout, exercises, sets = normalize_workout_star_schema(w)
-                if workout:
-                    df = pd.DataFrame(workout)
-                    df = enforce_types(df, "workout")
-                    table = pa.Table.from_pandas(df)
-                    parquet_buffer = io.BytesIO()
-                    pq.write_table(table, parquet_buffer)
-                    parquet_buffer.seek(0)
-                    upload_file_to_s3(
-                        file_path_parquet_workouts, bucket_name, parquet_buffer.read()
-                    )
-
-                if exercises:
-                    df = pd.DataFrame(exercises)
-                    df = enforce_types(df, "exercise")
-                    table = pa.Table.from_pandas(df)
-                    parquet_buffer = io.BytesIO()
-                    pq.write_table(table, parquet_buffer)
-                    parquet_buffer.seek(0)
-                    upload_file_to_s3(
-                        file_path_parquet_exercises, bucket_name, parquet_buffer.read()
-                    )
-
-                if sets:
-                    df = pd.DataFrame(sets)
-                    df = enforce_types(df, "set")
-                    table = pa.Table.from_pandas(df)
-                    parquet_buffer = io.BytesIO()
-                    pq.write_table(table, parquet_buffer)
-                    parquet_buffer.seek(0)
-                    upload_file_to_s3(
-                        file_path_parquet_sets, bucket_name, parquet_buffer.read()
-                    )
-
-                item = {
-                    "index": {"S": str(w["index"])},
-                    "name": {"S": w["name"]},
-                    "id": {"S": w["id"]},
-                    "nth_workout": {"N": str(w["nth_workout"])},
-                    "start_time": {"N": str(w["start_time"])},
-                    "bucket_name": {"S": bucket_name},
-                    "key": {"S": file_path},
-                    "workout_day": {
-                        "S": datetime.fromtimestamp(w["start_time"]).strftime(
-                            "%Y-%m-%d"
-                        )
-                    },
-                }
-
-                register_file_in_dynamodb(table_name, item)
-
-            update_latest_workout_parameter_store(workouts[-1]["index"])
+            # Also advances the latest-workout-index counter and its SSM copy;
+            # a replaced lease holder stops before its next write.
+            ingestor = WorkoutIngestor(bucket_name, table_name, lease=lease)
+            ingestor.ingest(workouts, total=len(workouts))
+            loaded.extend(workouts)
 
             send_message(
                 message="All missing workouts loaded.", webhook_url=DISCORD_WEBHOOK
             )
 
+    try:
+        outcome = run_exclusively(
+            get_client("dynamodb"),
+            table_name,
+            FETCH_LEASE,
+            fetch,
+            mode=if_running or os.environ.get("INGEST_LEASE_MODE", "coalesce"),
+        )
+        if outcome["status"] == "busy":
+            send_message(
+                message="Already syncing, try again once the running fetch is done.",
+                webhook_url=DISCORD_WEBHOOK,
+            )
+        elif outcome["status"] == "lost":
+            send_message(
+                message="Another fetch took over, this one stopped.",
+                webhook_url=DISCORD_WEBHOOK,
+            )
+        elif outcome["status"] == "coalesced":
+            send_message(
+                message="Already syncing, the running fetch will pick this up.",
+                webhook_url=DISCORD_WEBHOOK,
+            )
+        elif (
+            loaded and os.environ.get("COMPACT_AFTER_FETCH", "false").lower() == "true"
+        ):
+            compact_parquet_tables()
+
     except Exception as e:
         send_message(
             message=f"Looks like something went wrong:\n\n{e}",
@@ -195,7 +174,7 @@ def print_latest_workout() -> None:
     Retrieves and sends the latest workout to Discord.
     """
     try:
-        latest_workout_index = get_parameter("/926728314305/latest-workout-index")
+        latest_workout_index = get_parameter(LATEST_WORKOUT_INDEX_PARAMETER)
         item = query_dynamodb("index", latest_workout_index)
 
         workout_json = get_s3_object(item["bucket_name"]["S"], item["key"]["S"])
@@ -231,198 +210,77 @@ def print_workout(date: str) -> None:
         )
 
 
-def ask_ai_agent(prompt: str) -> None:
-    lambda_client = boto3.client("lambda")
-    payload = {"prompt": prompt}
-    response = lambda_client.invoke(
-        FunctionName="AIAgent",
-        InvocationType="RequestResponse",
-        Payload=json.dumps(payload),
-    )
-
-    if response["StatusCode"] == 200:
-        print("AI Agent response:", response["Payload"].read())
-    else:
-        print("Error invoking AI Agent:", response)
-
-
-def upload_file_to_s3(file_path, bucket_name, body):
+def compact_parquet_tables() -> None:
     """
-    Uploads a file to the specified S3 bucket.
-    Args:
-        file_path (str): The S3 key (path) for the file.
-        bucket_name (str): The S3 bucket name.
-        body (bytes): The file content as bytes.
+    Merges the small per-workout Parquet files of the workouts, exercises and
+    sets tables into one file per month and reports the object counts.
     """
-    s3 = boto3.client("s3")
-    s3.put_object(Bucket=bucket_name, Key=file_path, Body=body)
+    from silka_common.compaction import compact_tables, format_report
+
+    try:
+        reports = compact_tables()
+        send_message(
+            message=f"Compaction finished:\n{format_report(reports)}",
+            webhook_url=DISCORD_WEBHOOK,
+        )
+    except Exception as e:
+        send_message(
+            message=f"Looks like something went wrong:\n\n{e}",
+            webhook_url=DISCORD_WEBHOOK,
+        )
 
 
-def register_file_in_dynamodb(table_name: str, item: dict) -> None:
+def sync_edited_workouts(lookback: int | str | None = None) -> None:
     """
-    Registers a workout file in DynamoDB.
+    Re-reads the most recent workouts from the Hevy API and rewrites the ones
+    edited since the last sync (JSON, Parquet and DynamoDB records).
     Args:
-        table_name (str): The DynamoDB table name.
-        item (dict): The item to put in the table.
+        lookback (int | str, optional): How many recent workouts to re-read,
+            "all" for the whole history. Defaults to DEFAULT_LOOKBACK_WORKOUTS.
     """
-    dynamodb = boto3.client("dynamodb")
-    dynamodb.put_item(TableName=table_name, Item=item)
+    from silka_common.sync import sync_start_index, sync_workouts
 
+    bucket_name = os.environ.get("BUCKET_NAME")
+    table_name = os.environ.get("DYNAMODB_TABLE_NAME")
 
-def update_latest_workout_parameter_store(latest_workout_index: int) -> None:
-    """
-    Updates the latest workout index in AWS SSM Parameter Store.
-    Args:
-        latest_workout_index (int): The latest workout index to store.
-    """
-    ssm = boto3.client("ssm")
+    try:
+        latest_workout_index = int(get_parameter(LATEST_WORKOUT_INDEX_PARAMETER))
+        index = sync_start_index(latest_workout_index, lookback)
 
-    ssm.put_parameter(
-        Name="/926728314305/latest-workout-index",
-        Value=str(latest_workout_index),
-        Type="String",
-        Overwrite=True,
-    )
+        hevy = get_hevy_client()
+        hevy.reset_stats()
+        workouts = list(hevy.iter_workouts(index))
+        print(hevy.format_stats())
 
+        result = sync_workouts(bucket_name, table_name, workouts)
+        send_message(
+            message=(
+                f"Sync finished: {result['changed']} new or edited workouts written "
+                f"({result['moved']} moved to another day), "
+                f"{result['unchanged']} unchanged."
+            ),
+            webhook_url=DISCORD_WEBHOOK,
+        )
+    except Exception as e:
+        send_message(
+            message=f"Looks like something went wrong:\n\n{e}",
+            webhook_url=DISCORD_WEBHOOK,
+        )
 
-def normalize_workout_star_schema(workout):
-    # Discard logic (same as in normalize_workout_to_sets)
-    discard_workout = {
-        "media",
-        "user_id",
-        "username",
-        "comments",
-        "short_id",
-        "verified",
-        "image_urls",
-        "description",
-        "like_images",
-        "profile_image",
-        "is_liked_by_user",
-        "apple_watch",
-        "wearos_watch",
-        "is_private",
-        "like_count",
-        "preview_workout_likes",
-    }
-    discard_exercise = {
-        "url",
-        "notes",
-        "de_title",
-        "es_title",
-        "fr_title",
-        "it_title",
-        "ja_title",
-        "ko_title",
-        "pt_title",
-        "ru_title",
-        "tr_title",
-        "media_type",
-        "other_muscles",
-        "prs",
-        "personalRecords",
-        "superset_id",
-        "zh_cn_title",
-        "zh_tw_title",
-        "thumbnail_url",
-        "custom_exercise_image_url",
-        "custom_exercise_image_thumbnail_url",
-        "volume_doubling_enabled",
-    }
-    discard_set = {
-        "prs",
-        "personalRecords",
-        "custom_metric",
-        "completed_at",
-    }
 
-    # Workout table: one row per workout
-    workout_row = {
-        k: v
-        for k, v in workout.items()
-        if k != "exercises" and k not in discard_workout
-    }
-    workouts = [workout_row]
-
-    exercises = []
-    sets = []
-
-    for exercise in workout.get("exercises", []):
-        exercise_id = exercise.get("id")
-        # Exercise table: one row per exercise, with workout_id as FK
-        exercise_row = {
-            k: v
-            for k, v in exercise.items()
-            if k != "sets"
-            and not (k.endswith("title") and k != "title")
-            and k not in discard_exercise
-        }
-        exercise_row["workout_id"] = workout["id"]
-        exercises.append(exercise_row)
-
-        for s in exercise.get("sets", []):
-            set_row = {k: v for k, v in s.items() if k not in discard_set}
-            set_row["exercise_id"] = exercise_id
-            set_row["workout_id"] = workout["id"]
-            sets.append(set_row)
-
-    return workouts, exercises, sets
-
-
-def enforce_types(df, table: str):
-    # Define the target types for columns, based on your Glue schema:
-    dtype_map = {
-        "workout": {
-            "id": "string",
-            "name": "string",
-            "index": "Int64",
-            "end_time": "Int64",
-            "created_at": "string",
-            "routine_id": "string",
-            "start_time": "Int64",
-            "updated_at": "string",
-            "nth_workout": "Int64",
-            "comment_count": "Int64",
-            "estimated_volume_kg": "float64",
-        },
-        "exercise": {
-            "id": "string",
-            "title": "string",
-            "index": "Int64",
-            "workout_id": "string",
-            "created_at": "string",
-            "updated_at": "string",
-            "exercise_type": "string",
-            "equipment_category": "string",
-            "exercise_template_id": "string",
-            "priority": "Int64",
-            "muscle_group": "string",
-        },
-        "set": {
-            "id": "string",
-            "rpe": "float64",
-            "reps": "Int64",
-            "index": "Int64",
-            "indicator": "string",
-            "weight_kg": "float64",
-            "distance_meters": "float64",
-            "duration_seconds": "Int64",
-            "exercise_id": "string",
-            "workout_id": "string",
-        },
-    }
+def ask_ai_agent(prompt: str) -> None:
+    lambda_client = get_client("lambda")
+    payload = {"prompt": prompt}
+    response = lambda_client.invoke(
+        FunctionName="AIAgent",
+        InvocationType="RequestResponse",
+        Payload=json.dumps(payload),
+    )
 
-    for col, dtype in dtype_map[table].items():
-        if col in df.columns:
-            if dtype == "string":
-                # Convert to string, filling missing with None
-                df[col] = df[col].astype(str).replace({"nan": None, "None": None})
-            elif dtype == "Int64":
-                # Nullable integer type, convert safely
-                df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
-            elif dtype == "float64":
-                df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
-    return df
+    if response["StatusCode"] == 200:
+        print("AI Agent response:", response["Payload"].read())
+    else:
+        print("Error invoking AI Agent:", response)
 
 
 def get_parameter(name: str) -> str:
@@ -433,7 +291,7 @@ def get_parameter(name: str) -> str:
     Returns:
         str: The parameter value.
     """
-    ssm = boto3.client("ssm")
+    ssm = get_client("ssm")
     response = ssm.get_parameter(Name=name)
     return str(response["Parameter"]["Value"])
 
@@ -456,7 +314,7 @@ def query_dynamodb(column_name: str, value: str, index_name: str = None) -> dict
         },
     }
 
-    dynamodb = boto3.client("dynamodb")
+    dynamodb = get_client("dynamodb")
     if index_name:
         response = dynamodb.query(
             TableName=os.environ.get("DYNAMODB_TABLE_NAME"),
@@ -489,7 +347,7 @@ def get_s3_object(bucket_name: str, key: str) -> dict:
     Returns:
         dict: The parsed JSON object.
     """
-    s3 = boto3.client("s3")
+    s3 = get_client("s3")
     response = s3.get_object(Bucket=bucket_name, Key=key)
     body = response["Body"].read().decode("utf-8")
     return json.loads(body)
@@ -12,6 +12,9 @@ resource "aws_lambda_function" "fetching_from_hevy" {
       HEVY_TOKEN         = var.local_envs["HEVY_TOKEN"]
       BUCKET_NAME        = var.upload_bucket_name,
       DYNAMODB_TABLE_NAME = var.dynamo_workouts_table_name
+      PARQUET_LAYOUT     = var.parquet_layout
+      PARQUET_PROFILE    = var.parquet_profile
+      ATHENA_DATABASE    = var.athena_database_name
     }
   }
 }
@@ -49,6 +52,10 @@ resource "aws_lambda_function" "hevy_api_caller" {
       HEVY_TOKEN           = var.local_envs["HEVY_TOKEN"]
       BUCKET_NAME          = var.upload_bucket_name
       DYNAMODB_TABLE_NAME  = var.dynamo_workouts_table_name
+      PARQUET_LAYOUT       = var.parquet_layout
+      PARQUET_PROFILE      = var.parquet_profile
+      ATHENA_DATABASE      = var.athena_database_name
+      COMPACT_AFTER_FETCH  = var.compact_after_fetch
     }
   }
 }
@@ -91,7 +98,7 @@ resource "aws_lambda_function" "ai_agent" {
   role          = var.lambda_role_arn
   package_type  = "Image"
   image_uri     = "${data.aws_ecr_repository.ai_agent_repo.repository_url}:latest"
-  timeout       = 120
+  timeout       = 300
   source_code_hash = split(":", data.aws_ecr_image.ai_agent_latest_image.id)[1]
 
   environment {
@@ -30,6 +30,12 @@ build {
     destination = "/var/task/"
   }
 
+  // Copy the shared silka_common package next to the Lambda handler.
+  provisioner "file" {
+    source      = "./silka_common"
+    destination = "/var/task/"
+  }
+
   // Install Python dependencies into the Lambda task root.
   provisioner "shell" {
     inline = [
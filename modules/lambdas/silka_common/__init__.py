@@ -0,0 +1,7 @@
+"""
+Code shared by the Lambda functions under modules/lambdas/.
+
+The Packer template copies this package next to each Lambda handler, so it is
+importable as ``silka_common`` inside every image. For local runs add
+``modules/lambdas`` to ``PYTHONPATH``.
+"""
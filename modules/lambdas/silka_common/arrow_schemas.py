@@ -0,0 +1,152 @@
+"""
+Arrow schemas of the star-schema Parquet tables and the builder that turns
+normalized rows into typed Arrow tables without going through pandas.
+
+The schemas mirror the Glue tables in modules/athena/glue.tf: string columns
+are Arrow strings, bigint columns int64 and double columns float64. Keep the
+two in sync when a column is added.
+"""
+
+import math
+
+import pyarrow as pa
+
+TABLE_SCHEMAS = {
+    "workout": pa.schema(
+        [
+            ("id", pa.string()),
+            ("name", pa.string()),
+            ("index", pa.int64()),
+            ("end_time", pa.int64()),
+            ("created_at", pa.string()),
+            ("routine_id", pa.string()),
+            ("start_time", pa.int64()),
+            ("updated_at", pa.string()),
+            ("nth_workout", pa.int64()),
+            ("comment_count", pa.int64()),
+            ("estimated_volume_kg", pa.float64()),
+        ]
+    ),
+    "exercise": pa.schema(
+        [
+            ("id", pa.string()),
+            ("title", pa.string()),
+            ("index", pa.int64()),
+            ("workout_id", pa.string()),
+            ("created_at", pa.string()),
+            ("updated_at", pa.string()),
+            ("exercise_type", pa.string()),
+            ("equipment_category", pa.string()),
+            ("exercise_template_id", pa.string()),
+            ("priority", pa.int64()),
+            ("muscle_group", pa.string()),
+        ]
+    ),
+    "set": pa.schema(
+        [
+            ("id", pa.string()),
+            ("rpe", pa.float64()),
+            ("reps", pa.int64()),
+            ("index", pa.int64()),
+            ("indicator", pa.string()),
+            ("weight_kg", pa.float64()),
+            ("distance_meters", pa.float64()),
+            ("duration_seconds", pa.int64()),
+            ("exercise_id", pa.string()),
+            ("workout_id", pa.string()),
+        ]
+    ),
+}
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _to_string(value):
+    if type(value) is str:
+        return value
+    if _is_missing(value):
+        return None
+    return str(value)
+
+
+def _to_int(value):
+    if type(value) is int:
+        return value
+    if _is_missing(value):
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    # Like pd.to_numeric(errors="coerce"): anything that is not a whole
+    # number becomes null instead of failing the whole table.
+    if not number.is_integer():
+        return None
+    return int(value) if isinstance(value, int) else int(number)
+
+
+def _to_float(value):
+    if type(value) is float:
+        return value
+    if _is_missing(value):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+_CONVERTERS = {
+    pa.string(): _to_string,
+    pa.int64(): _to_int,
+    pa.float64(): _to_float,
+}
+
+
+def build_arrow_table(rows: list[dict], table: str) -> pa.Table:
+    """
+    Builds an Arrow table from the rows of a star-schema table, with the
+    column types of the Glue schema.
+    Args:
+        rows (list[dict]): The normalized rows.
+        table (str): One of "workout", "exercise" or "set".
+    Returns:
+        pa.Table: The typed table.
+    """
+    columns = {
+        name: [row.get(name) for row in rows] for name in TABLE_SCHEMAS[table].names
+    }
+    return build_arrow_table_from_columns(columns, len(rows), table)
+
+
+def build_arrow_table_from_columns(
+    columns: dict[str, list], num_rows: int, table: str
+) -> pa.Table:
+    """
+    Builds an Arrow table from column lists, with the column types of the
+    Glue schema.
+
+    Every declared column is present, null where a row lacks the key or holds
+    a value that cannot be converted. Columns outside the schema are dropped:
+    Athena only resolves the columns declared in Glue.
+    Args:
+        columns (dict[str, list]): The values of each column, num_rows long.
+        num_rows (int): The number of rows.
+        table (str): One of "workout", "exercise" or "set".
+    Returns:
+        pa.Table: The typed table.
+    """
+    schema = TABLE_SCHEMAS[table]
+    arrays = []
+    for field in schema:
+        values = columns.get(field.name)
+        if values is None:
+            arrays.append(pa.nulls(num_rows, type=field.type))
+            continue
+        convert = _CONVERTERS[field.type]
+        arrays.append(pa.array([convert(v) for v in values], type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
@@ -0,0 +1,149 @@
+"""
+Running Athena queries: submission and adaptive polling.
+
+Polling get_query_execution on a fixed one-second sleep makes a query that
+finishes in 200 ms cost a full second, and a long query cost one API call
+per second. The waits here start short and grow geometrically to a cap.
+The first wait is seeded from the engine execution times of the queries
+this execution environment ran recently (kept across warm invocations), so
+a workload of quick queries is polled quickly and a slow one is not polled
+in vain.
+
+wait_for_query() also takes a deadline: a caller running inside a Lambda
+stops waiting before its own timeout and hands the QueryExecutionId back,
+and the result is fetched later (see the submit / fetch_result actions of
+execute_athena_query).
+"""
+
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Iterator
+
+# Shortest and longest pause between two get_query_execution calls.
+POLL_INITIAL_SECONDS = 0.1
+POLL_CAP_SECONDS = 5.0
+
+# Growth factor of the pause between two polls.
+POLL_GROWTH = 1.5
+
+# The first poll waits for this share of the typical recent engine time.
+POLL_SEED_FRACTION = 0.5
+
+# How many recent engine execution times seed the first wait.
+RECENT_QUERIES = 20
+
+# Terminal states of a query execution.
+FINISHED_STATES = ("SUCCEEDED", "FAILED", "CANCELLED")
+
+_engine_times_ms = deque(maxlen=RECENT_QUERIES)
+_lock = threading.Lock()
+
+
+def record_engine_time(execution: dict) -> None:
+    """
+    Remembers the engine execution time of a finished query.
+    Args:
+        execution (dict): The QueryExecution returned by get_query_execution.
+    """
+    engine_ms = execution.get("Statistics", {}).get("EngineExecutionTimeInMillis")
+    if engine_ms is not None:
+        with _lock:
+            _engine_times_ms.append(engine_ms)
+
+
+def expected_engine_seconds() -> float | None:
+    """
+    Returns:
+        float | None: The median engine time of the recent queries, None
+            before the first query finished.
+    """
+    with _lock:
+        if not _engine_times_ms:
+            return None
+        return statistics.median(_engine_times_ms) / 1000
+
+
+def poll_intervals(expected_seconds: float | None = None) -> Iterator[float]:
+    """
+    Yields the pauses between two polls: a first one seeded from the expected
+    duration, then growing by POLL_GROWTH up to POLL_CAP_SECONDS.
+    Args:
+        expected_seconds (float, optional): The expected engine time.
+    Yields:
+        float: Seconds to wait before the next poll.
+    """
+    delay = POLL_INITIAL_SECONDS
+    if expected_seconds is not None:
+        delay = expected_seconds * POLL_SEED_FRACTION
+    delay = min(max(delay, POLL_INITIAL_SECONDS), POLL_CAP_SECONDS)
+    while True:
+        yield delay
+        delay = min(max(delay * POLL_GROWTH, POLL_INITIAL_SECONDS), POLL_CAP_SECONDS)
+
+
+def start_query(athena, query: str, database: str, output: str | None) -> str:
+    """
+    Submits a query.
+    Args:
+        athena: The Athena client.
+        query (str): The SQL.
+        database (str): The database the query runs in.
+        output (str | None): The result location, the workgroup's if None.
+    Returns:
+        str: The QueryExecutionId.
+    """
+    kwargs = {
+        "QueryString": query,
+        "QueryExecutionContext": {"Database": database},
+    }
+    if output:
+        kwargs["ResultConfiguration"] = {"OutputLocation": output}
+    return athena.start_query_execution(**kwargs)["QueryExecutionId"]
+
+
+def wait_for_query(athena, execution_id: str, deadline: float | None = None) -> dict:
+    """
+    Polls a query until it finishes or the deadline passes.
+    Args:
+        athena: The Athena client.
+        execution_id (str): The QueryExecutionId.
+        deadline (float, optional): A time.monotonic() value to stop polling
+            at; the query keeps running.
+    Returns:
+        dict: The last QueryExecution; its state is not final if the
+            deadline passed first.
+    """
+    polls = 0
+    for delay in poll_intervals(expected_engine_seconds()):
+        execution = athena.get_query_execution(QueryExecutionId=execution_id)[
+            "QueryExecution"
+        ]
+        polls += 1
+        if execution["Status"]["State"] in FINISHED_STATES:
+            record_engine_time(execution)
+            break
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            break
+        time.sleep(delay)
+    print(f"Query {execution_id} {execution['Status']['State']} after {polls} polls.")
+    return execution
+
+
+def query_error(execution: dict) -> str | None:
+    """
+    Describes why a finished query did not succeed.
+    Args:
+        execution (dict): A QueryExecution.
+    Returns:
+        str | None: The error message, None if the query succeeded or is
+            still running.
+    """
+    status = execution["Status"]
+    if status["State"] not in ("FAILED", "CANCELLED"):
+        return None
+    error_message = f"Athena query failed with state: {status['State']}"
+    if "StateChangeReason" in status:
+        error_message += f" - {status['StateChangeReason']}"
+    return error_message
@@ -0,0 +1,256 @@
+"""
+Reading the results of a finished Athena query, complete and typed.
+
+get_query_results returns at most 1,000 rows per call, every value as a
+VarCharValue string. Athena also writes the whole result as a CSV file to
+the query's OutputLocation. read_results() streams that file from S3 (one
+GET however many rows) and only falls back to paging the API with
+NextToken when there is no CSV, e.g. for DDL and SHOW statements.
+
+Values are converted with the column types of the ResultSetMetadata, so
+integers come back as int, doubles as float, booleans as bool and nulls
+as None. Dates, timestamps and decimals stay strings, the way the handler
+passes them on as JSON. Both readers stop at max_rows and say whether the
+result was truncated.
+"""
+
+import codecs
+import re
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+from urllib.parse import urlparse
+
+from botocore.exceptions import ClientError
+
+# Rows per get_query_results call, the API maximum.
+PAGE_SIZE = 1_000
+
+# Athena types converted to int, float and bool; the others stay strings.
+INTEGER_TYPES = ("tinyint", "smallint", "integer", "bigint")
+FLOAT_TYPES = ("float", "real", "double")
+BOOLEAN_TYPES = ("boolean",)
+
+# A field of an Athena result CSV: quoted (every non-null value, "" for the
+# empty string) or unquoted (empty for a null). csv.reader reads both empty
+# forms as "" before Python 3.12's QUOTE_NOTNULL, and the Lambdas run 3.11.
+_CSV_FIELD = re.compile(r'(?:^|,)(?:"((?:[^"]|"")*)"|([^,"]*))')
+
+
+@dataclass
+class QueryResult:
+    """
+    The rows of a query.
+    Attributes:
+        columns (list[dict]): name and type of every column.
+        rows (list[list]): The typed data rows, without a header row.
+        truncated (bool): True if the result had more than max_rows rows.
+        source (str): "s3" or "api", where the rows were read from.
+        api_calls (int): get_query_results calls made.
+    """
+
+    columns: list[dict]
+    rows: list[list] = field(default_factory=list)
+    truncated: bool = False
+    source: str = "api"
+    api_calls: int = 0
+
+    def header(self) -> list[str]:
+        """
+        Returns:
+            list[str]: The column names.
+        """
+        return [column["name"] for column in self.columns]
+
+
+def result_columns(result_set_metadata: dict) -> list[dict]:
+    """
+    Args:
+        result_set_metadata (dict): The ResultSetMetadata of a result page.
+    Returns:
+        list[dict]: name and (lower case) type of every column.
+    """
+    return [
+        {"name": column["Name"], "type": column["Type"].lower()}
+        for column in result_set_metadata.get("ColumnInfo", [])
+    ]
+
+
+def convert_value(value: str | None, athena_type: str) -> Any:
+    """
+    Converts a value as Athena returns it to the Python type of its column.
+    Args:
+        value (str | None): The value, None for a null.
+        athena_type (str): The column type from the ResultSetMetadata.
+    Returns:
+        Any: The converted value; None for a null, or for an empty value of
+            a non-string column.
+    """
+    if value is None:
+        return None
+    if athena_type in ("varchar", "char", "string"):
+        return value
+    if value == "":
+        return None
+    if athena_type in INTEGER_TYPES:
+        return int(value)
+    if athena_type in FLOAT_TYPES:
+        return float(value)
+    if athena_type in BOOLEAN_TYPES:
+        return value.lower() == "true"
+    return value
+
+
+def convert_row(values: list, columns: list[dict]) -> list:
+    """
+    Returns:
+        list: The row with every value converted to its column type.
+    """
+    return [
+        convert_value(value, column["type"]) for value, column in zip(values, columns)
+    ]
+
+
+def _csv_location(execution: dict) -> tuple[str, str] | None:
+    location = execution.get("ResultConfiguration", {}).get("OutputLocation", "")
+    if not location.endswith(".csv"):
+        return None
+    parsed = urlparse(location)
+    return parsed.netloc, parsed.path.lstrip("/")
+
+
+def parse_csv_record(record: str) -> list:
+    """
+    Splits a record of an Athena result CSV into its values.
+    Args:
+        record (str): The record, without its line break.
+    Returns:
+        list: The values, None for an unquoted empty field (a null).
+    """
+    return [
+        match[1].replace('""', '"') if match.lastindex == 1 else match[2] or None
+        for match in _CSV_FIELD.finditer(record)
+    ]
+
+
+def iter_csv_rows(body) -> Iterator[list]:
+    """
+    Streams the rows of an Athena result CSV, the header row first.
+    Args:
+        body: The StreamingBody of the result object.
+    Yields:
+        list: The values of a row, None for nulls.
+    """
+    record = ""
+    for line in codecs.getreader("utf-8")(body):
+        record += line
+        # An odd number of quotes: a quoted value goes on over the next line.
+        if record.count('"') % 2:
+            continue
+        record = record.rstrip("\r\n")
+        if record:
+            yield parse_csv_record(record)
+        record = ""
+    if record:
+        yield parse_csv_record(record)
+
+
+def read_results_s3(
+    athena, s3, execution: dict, max_rows: int | None = None
+) -> QueryResult | None:
+    """
+    Reads the result CSV of a finished query from S3.
+    Args:
+        athena: The Athena client, for the column types.
+        s3: The S3 client.
+        execution (dict): The QueryExecution of the finished query.
+        max_rows (int, optional): Stop after this many data rows.
+    Returns:
+        QueryResult | None: None if the query wrote no CSV result or it
+            cannot be read.
+    """
+    location = _csv_location(execution)
+    if location is None:
+        return None
+    bucket, key = location
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    except ClientError as e:
+        print(f"Cannot read s3://{bucket}/{key}, paging the API instead: {e}")
+        return None
+    # One row is enough for the column types.
+    metadata = athena.get_query_results(
+        QueryExecutionId=execution["QueryExecutionId"], MaxResults=1
+    )["ResultSet"]["ResultSetMetadata"]
+    result = QueryResult(columns=result_columns(metadata), source="s3", api_calls=1)
+    with body:
+        rows = iter_csv_rows(body)
+        next(rows, None)  # Header row
+        for values in rows:
+            if max_rows is not None and len(result.rows) >= max_rows:
+                result.truncated = True
+                break
+            result.rows.append(convert_row(values, result.columns))
+    return result
+
+
+def read_results_api(
+    athena, execution_id: str, max_rows: int | None = None
+) -> QueryResult:
+    """
+    Pages through get_query_results with NextToken.
+    Args:
+        athena: The Athena client.
+        execution_id (str): The QueryExecutionId of the finished query.
+        max_rows (int, optional): Stop after this many data rows.
+    Returns:
+        QueryResult: The rows.
+    """
+    result = None
+    kwargs = {"QueryExecutionId": execution_id, "MaxResults": PAGE_SIZE}
+    while True:
+        page = athena.get_query_results(**kwargs)
+        values = [
+            [column.get("VarCharValue") for column in row["Data"]]
+            for row in page["ResultSet"]["Rows"]
+        ]
+        if result is None:
+            result = QueryResult(
+                columns=result_columns(page["ResultSet"]["ResultSetMetadata"])
+            )
+            # SELECT results start with a header row, DDL results do not.
+            if values and values[0] == result.header():
+                values = values[1:]
+        result.api_calls += 1
+        for row in values:
+            if max_rows is not None and len(result.rows) >= max_rows:
+                result.truncated = True
+                return result
+            result.rows.append(convert_row(row, result.columns))
+        if "NextToken" not in page:
+            return result
+        kwargs["NextToken"] = page["NextToken"]
+
+
+def read_results(
+    athena, s3, execution: dict, max_rows: int | None = None
+) -> QueryResult:
+    """
+    Reads all rows (up to max_rows) of a finished query, from the result CSV
+    on S3 if there is one, from the API otherwise.
+    Args:
+        athena: The Athena client.
+        s3: The S3 client.
+        execution (dict): The QueryExecution of the finished query.
+        max_rows (int, optional): Stop after this many data rows.
+    Returns:
+        QueryResult: The rows.
+    """
+    result = read_results_s3(athena, s3, execution, max_rows)
+    if result is None:
+        result = read_results_api(athena, execution["QueryExecutionId"], max_rows)
+    print(
+        f"Read {len(result.rows)} rows from {result.source} with "
+        f"{result.api_calls} get_query_results calls"
+        + (", truncated." if result.truncated else ".")
+    )
+    return result
@@ -0,0 +1,166 @@
+"""
+Process-wide registry of boto3 clients and resources.
+
+A client is created on first use and then reused for the life of the Lambda
+execution environment, so warm invocations skip credential resolution and
+keep their pooled HTTPS connections. Every client shares one tuned botocore
+Config (pool size, timeouts, standard-mode retries, TCP keepalive), with
+per-service overrides where the defaults do not fit.
+
+client_stats() reports how many clients were created vs reused and, per
+client, how many connections were opened vs requests sent over them.
+"""
+
+import os
+import threading
+from collections import Counter
+
+import boto3
+from botocore.config import Config
+
+# Connections kept per client; the ingestion pipeline runs several upload
+# and writer threads against the same S3 / DynamoDB client.
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32"))
+
+BASE_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    connect_timeout=5,
+    read_timeout=60,
+    retries={"mode": "standard", "max_attempts": 5},
+    tcp_keepalive=True,
+)
+
+# Services whose calls legitimately take longer than BASE_CONFIG allows.
+SERVICE_CONFIGS = {
+    # The AI agent waits for other Lambdas with RequestResponse invokes.
+    "lambda": Config(read_timeout=900),
+    "bedrock-runtime": Config(read_timeout=300),
+}
+
+_clients = {}
+_resources = {}
+_created = Counter()
+_reused = Counter()
+_lock = threading.Lock()
+
+
+def _config(service: str) -> Config:
+    override = SERVICE_CONFIGS.get(service)
+    return BASE_CONFIG.merge(override) if override else BASE_CONFIG
+
+
+def get_client(service: str, region_name: str | None = None):
+    """
+    Returns the shared client of a service, creating it on first use.
+    Thread safe: creation is serialized, since building clients concurrently
+    is not.
+    Args:
+        service (str): The service name, e.g. "s3".
+        region_name (str, optional): The region, the default one if omitted.
+    Returns:
+        The boto3 client.
+    """
+    key = (service, region_name)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = boto3.client(
+                service, region_name=region_name, config=_config(service)
+            )
+            _clients[key] = client
+            _created[f"client:{service}"] += 1
+        else:
+            _reused[f"client:{service}"] += 1
+    return client
+
+
+def get_resource(service: str, region_name: str | None = None):
+    """
+    Returns the shared resource of a service, creating it on first use.
+    Args:
+        service (str): The service name, e.g. "dynamodb".
+        region_name (str, optional): The region, the default one if omitted.
+    Returns:
+        The boto3 resource.
+    """
+    key = (service, region_name)
+    with _lock:
+        resource = _resources.get(key)
+        if resource is None:
+            resource = boto3.resource(
+                service, region_name=region_name, config=_config(service)
+            )
+            _resources[key] = resource
+            _created[f"resource:{service}"] += 1
+        else:
+            _reused[f"resource:{service}"] += 1
+    return resource
+
+
+def reset_clients() -> None:
+    """
+    Drops every cached client and resource and zeroes the counters. For
+    local tools and tests that switch credentials or endpoints.
+    """
+    with _lock:
+        _clients.clear()
+        _resources.clear()
+        _created.clear()
+        _reused.clear()
+
+
+def _connection_stats(client) -> dict:
+    # botocore keeps its urllib3 PoolManager on the endpoint's HTTP session;
+    # not a public API, so report nothing rather than fail if it moves.
+    try:
+        manager = client._endpoint.http_session._manager
+        pools = [manager.pools[key] for key in manager.pools.keys()]
+    except AttributeError:
+        return {}
+    return {
+        "connections": sum(pool.num_connections for pool in pools),
+        "requests": sum(pool.num_requests for pool in pools),
+    }
+
+
+def client_stats() -> dict:
+    """
+    Reports client and connection reuse since the execution environment
+    started (or since reset_clients()).
+    Returns:
+        dict: {"created": {...}, "reused": {...}, "connections": {service:
+            {"connections": opened, "requests": sent}}}.
+    """
+    with _lock:
+        clients = dict(_clients)
+        created = dict(_created)
+        reused = dict(_reused)
+    connections = {}
+    for (service, region_name), client in clients.items():
+        name = f"{service}@{region_name}" if region_name else service
+        connections[name] = _connection_stats(client)
+    return {"created": created, "reused": reused, "connections": connections}
+
+
+def format_client_stats() -> str:
+    """
+    Formats client_stats() as one log line.
+    Returns:
+        str: e.g. "AWS clients: s3 created 1 reused 12, 3 connections / 40
+            requests; ...".
+    """
+    stats = client_stats()
+    parts = []
+    for name, connection in sorted(stats["connections"].items()):
+        service = name.split("@")[0]
+        part = (
+            f"{name} created {stats['created'].get(f'client:{service}', 0)} "
+            f"reused {stats['reused'].get(f'client:{service}', 0)}"
+        )
+        if connection:
+            part += (
+                f", {connection['connections']} connections / "
+                f"{connection['requests']} requests"
+            )
+        parts.append(part)
+    return "AWS clients: " + ("; ".join(parts) if parts else "none")
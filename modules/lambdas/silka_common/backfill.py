@@ -0,0 +1,142 @@
+"""
+Checkpointed backfill of the full workout history.
+
+Workouts are ingested in index order, in chunks. After each chunk the
+cursor in DynamoDB moves past it, so a run that times out (or is stopped
+before the Lambda deadline) resumes at the cursor instead of at index 0.
+Before a chunk is written, the content fingerprints stored on the workout
+items are compared with the payloads just fetched and unchanged workouts
+are skipped, so repeating a completed backfill writes almost nothing.
+
+The workouts may come from a generator: each chunk is pulled from it only
+when the previous one is stored, so memory holds one chunk (plus whatever
+the source prefetches) instead of the whole history.
+
+A shard of a fan-out backfill (see fanout.py) runs the same loop over its
+index range with a cursor of its own and leaves the high-water mark alone.
+"""
+
+from itertools import islice
+from typing import Callable, Iterable
+
+from .aws_clients import get_client
+from .ingestion import WorkoutIngestor
+from .metadata import (
+    BACKFILL_CURSOR_KEY,
+    clear_backfill_cursor,
+    read_fingerprints,
+    save_backfill_cursor,
+)
+from .workouts import workout_fingerprint
+
+# Workouts ingested between two cursor updates.
+DEFAULT_CHECKPOINT_EVERY = 100
+
+# Stop starting new chunks when less time than this is left before the
+# Lambda deadline, so the last chunk and its checkpoint can finish.
+DEADLINE_MARGIN_MS = 90_000
+
+
+def split_unchanged(
+    dynamodb, table_name: str, workouts: list[dict]
+) -> tuple[list[dict], list[dict]]:
+    """
+    Separates the workouts whose payload differs from the stored one.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        workouts (list[dict]): Raw Hevy workouts.
+    Returns:
+        tuple[list[dict], list[dict]]: The changed (or new) and the unchanged
+            workouts.
+    """
+    stored = read_fingerprints(dynamodb, table_name, [w["index"] for w in workouts])
+    changed, unchanged = [], []
+    for workout in workouts:
+        if stored.get(workout["index"]) == workout_fingerprint(workout):
+            unchanged.append(workout)
+        else:
+            changed.append(workout)
+    return changed, unchanged
+
+
+def run_backfill(
+    bucket_name: str,
+    table_name: str,
+    workouts: Iterable[dict],
+    dry_run: bool = False,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    remaining_ms: Callable[[], int] | None = None,
+    start_index: int = 0,
+    cursor_key: str = BACKFILL_CURSOR_KEY,
+    advance_latest: bool = True,
+) -> dict:
+    """
+    Ingests workouts chunk by chunk, skipping unchanged ones and moving the
+    resume cursor after every chunk. The cursor is cleared once the last
+    chunk is stored.
+    Args:
+        bucket_name (str): The S3 bucket.
+        table_name (str): The workouts metadata table.
+        workouts (Iterable[dict]): Raw Hevy workouts from the resume index on,
+            in index order; may be a generator.
+        dry_run (bool): Only count what would be written and skipped.
+        checkpoint_every (int): Workouts per chunk.
+        remaining_ms (Callable, optional): Returns the milliseconds left before
+            the Lambda deadline (context.get_remaining_time_in_millis).
+        start_index (int): The index the workouts start at, reported as the
+            resume point if the deadline hits before the first chunk.
+        cursor_key (str): The item the resume cursor is kept in.
+        advance_latest (bool): Whether stored chunks advance the
+            latest-workout high-water mark.
+    Returns:
+        dict: written, skipped, next_index (None when complete), last_index
+            (the highest index seen, None if none) and dry_run.
+    """
+    dynamodb = get_client("dynamodb")
+    workouts = iter(workouts)
+    checkpoint_every = max(1, checkpoint_every)
+    ingestor = None
+    if not dry_run:
+        ingestor = WorkoutIngestor(
+            bucket_name, table_name, advance_latest=advance_latest
+        )
+    written = skipped = 0
+    resume_index = start_index
+    next_index = None
+
+    while True:
+        # Checked before pulling the chunk, so a streaming source does not
+        # fetch pages that would not be stored; one workout is peeked to tell
+        # whether anything is left at all.
+        if remaining_ms is not None and remaining_ms() < DEADLINE_MARGIN_MS:
+            if next(workouts, None) is not None:
+                next_index = resume_index
+                print(f"Stopping before the deadline; resume at index {next_index}.")
+            break
+        chunk = list(islice(workouts, checkpoint_every))
+        if not chunk:
+            break
+
+        changed, unchanged = split_unchanged(dynamodb, table_name, chunk)
+        written += len(changed)
+        skipped += len(unchanged)
+        resume_index = chunk[-1]["index"] + 1
+        if dry_run:
+            continue
+        if changed:
+            ingestor.ingest(changed, total=len(changed))
+        save_backfill_cursor(dynamodb, table_name, resume_index, cursor_key)
+
+    if not dry_run and next_index is None:
+        clear_backfill_cursor(dynamodb, table_name, cursor_key)
+
+    verb = "would be written" if dry_run else "written"
+    print(f"Backfill: {written} workouts {verb}, {skipped} unchanged skipped.")
+    return {
+        "written": written,
+        "skipped": skipped,
+        "next_index": next_index,
+        "last_index": resume_index - 1 if resume_index > start_index else None,
+        "dry_run": dry_run,
+    }
@@ -0,0 +1,220 @@
+"""
+Batch-level Parquet writer: one Parquet file per star-schema table per day or
+month instead of one file per workout.
+
+Workouts are buffered per period while the ingestion pipeline runs and
+flushed once at the end, when each period is normalized in one columnar
+pass. Each period file is rewritten with read-merge-write: rows of the
+workouts being written replace their previous version, all other rows are
+kept. The write is conditional on the ETag that was read, so two concurrent
+writers never lose each other's rows; the loser re-reads and retries.
+"""
+
+import io
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+from .normalize import normalize_workouts_columnar
+from .partitioning import partition_path
+from .table_locations import STAR_SCHEMA_TABLES, table_prefix
+from .workouts import (
+    legacy_workout_parquet_key,
+    workout_date_parts,
+    workout_parquet_key,
+    write_parquet_bytes,
+)
+
+# Supported values of the PARQUET_LAYOUT setting.
+PARQUET_LAYOUTS = ("per_workout", "daily", "monthly")
+
+# Column holding the workout id in each star-schema table.
+WORKOUT_ID_COLUMNS = {"workout": "id", "exercise": "workout_id", "set": "workout_id"}
+
+# How many times a period file is re-read and merged after losing a race.
+MAX_WRITE_ATTEMPTS = 5
+
+
+def workout_period(workout: dict, layout: str) -> tuple[str, ...]:
+    """
+    Returns the period a workout belongs to in a batch layout.
+    Args:
+        workout (dict): The raw Hevy workout.
+        layout (str): "daily" or "monthly".
+    Returns:
+        tuple[str, ...]: (year, month, day) or (year, month).
+    """
+    year, month, day = workout_date_parts(workout)
+    return (year, month, day) if layout == "daily" else (year, month)
+
+
+def period_parquet_key(
+    table: str, period: tuple[str, ...], prefix: str | None = None
+) -> str:
+    """
+    Builds the S3 key of the Parquet file holding a whole period of a table.
+    Args:
+        table (str): One of "workout", "exercise" or "set".
+        period (tuple[str, ...]): The period returned by workout_period().
+        prefix (str, optional): The table prefix, the active one by default.
+    Returns:
+        str: The S3 key, e.g. sorted/sets/year=2024/month=05/part-202405.parquet.
+    """
+    prefix = prefix or table_prefix(table)
+    partition = partition_path(period[0], period[1])
+    return f"{prefix}/{partition}/part-{''.join(period)}.parquet"
+
+
+def merge_period_rows(
+    existing: pa.Table | None, new: pa.Table | None, table: str, workout_ids: list[str]
+) -> pa.Table | None:
+    """
+    Replaces the rows of the given workouts in a period table.
+    Args:
+        existing (pa.Table | None): The current content of the period file.
+        new (pa.Table | None): The rows of the workouts being written.
+        table (str): One of "workout", "exercise" or "set".
+        workout_ids (list[str]): The workouts whose rows are replaced.
+    Returns:
+        pa.Table | None: The merged table, None if there is nothing to write.
+    """
+    if existing is None or existing.num_rows == 0:
+        return new
+    column = WORKOUT_ID_COLUMNS[table]
+    kept = existing.filter(
+        pc.invert(pc.is_in(existing[column], value_set=pa.array(workout_ids)))
+    )
+    if new is None:
+        return kept
+    return pa.concat_tables([kept, new], promote_options="default")
+
+
+class BatchParquetWriter:
+    """
+    Buffers workouts per period and writes one Parquet file per table and
+    period on flush().
+    """
+
+    def __init__(self, s3, bucket_name: str, layout: str, max_workers: int = 4):
+        if layout not in ("daily", "monthly"):
+            raise ValueError(f"Unsupported batch layout: {layout}")
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.layout = layout
+        self.max_workers = max_workers
+        self._workouts = defaultdict(dict)
+        self._removed = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def add(self, workout: dict) -> None:
+        """
+        Buffers a workout; a workout added twice is written once, in its
+        latest version. Safe to call from the pipeline worker threads.
+        Args:
+            workout (dict): The raw Hevy workout.
+        """
+        period = workout_period(workout, self.layout)
+        with self._lock:
+            self._workouts[period][workout["id"]] = workout
+
+    def remove(self, workout: dict) -> None:
+        """
+        Buffers the removal of a workout's rows from its period, e.g. the
+        period it was stored under before its start time was edited.
+        Args:
+            workout (dict): The workout as it was stored; only its id and
+                start_time are used.
+        """
+        period = workout_period(workout, self.layout)
+        with self._lock:
+            self._removed[period][workout["id"]] = workout
+
+    def flush(self) -> list[str]:
+        """
+        Writes every buffered period, then removes the per-workout Parquet
+        files those workouts may have been stored under before.
+        Returns:
+            list[str]: The S3 keys of the period files written.
+        """
+        with self._lock:
+            added = dict(self._workouts)
+            removed = dict(self._removed)
+            self._workouts.clear()
+            self._removed.clear()
+
+        periods = []
+        writes = []
+        for period in sorted(set(added) | set(removed)):
+            workouts = added.get(period, {})
+            touched = {**removed.get(period, {}), **workouts}
+            periods.append((period, touched))
+            tables = normalize_workouts_columnar(workouts.values()).to_arrow()
+            for table in STAR_SCHEMA_TABLES:
+                writes.append((table, period, tables[table], list(touched)))
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            written = list(executor.map(lambda args: self._write_period(*args), writes))
+
+        stale_keys = sorted(
+            {
+                key_builder(workout, table)
+                for _, workouts in periods
+                for workout in workouts.values()
+                for table in STAR_SCHEMA_TABLES
+                for key_builder in (workout_parquet_key, legacy_workout_parquet_key)
+            }
+        )
+        self._delete_keys(stale_keys)
+        return [key for key in written if key]
+
+    def _write_period(self, table, period, new, workout_ids) -> str | None:
+        key = period_parquet_key(table, period)
+        if new.num_rows == 0:
+            new = None
+
+        for attempt in range(MAX_WRITE_ATTEMPTS):
+            existing, etag = self._read(key)
+            merged = merge_period_rows(existing, new, table, workout_ids)
+            if merged is None:
+                return None
+            conditions = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+            try:
+                self.s3.put_object(
+                    Bucket=self.bucket_name,
+                    Key=key,
+                    Body=write_parquet_bytes(merged, table),
+                    **conditions,
+                )
+                return key
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                    raise
+                print(f"Concurrent update of {key}, retrying ({attempt + 1}).")
+        raise RuntimeError(
+            f"Could not update {key} after {MAX_WRITE_ATTEMPTS} attempts"
+        )
+
+    def _read(self, key: str) -> tuple[pa.Table | None, str | None]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None, None
+            raise
+        body = response["Body"].read()
+        return pq.read_table(io.BytesIO(body)), response["ETag"]
+
+    def _delete_keys(self, keys: list[str]) -> None:
+        # delete_object semantics: deleting a missing key is not an error.
+        for start in range(0, len(keys), 1000):
+            chunk = keys[start : start + 1000]
+            self.s3.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in chunk], "Quiet": True},
+            )
@@ -0,0 +1,474 @@
+"""
+Small-file compaction for the star-schema Parquet tables.
+
+Every object of a table is merged into one Parquet file per month, written
+under a new generation prefix (sorted/generations/<table>/<generation>/) in
+the Hive-style year=/month= layout.
+Once the generation is complete the Glue table location is swapped to it in a
+single update_table call, guarded by the table VersionId, so Athena and dbt
+queries see either the old set of files or the new one, never both.
+
+Objects written to the old location between the listing and the swap, new
+keys as well as listed keys rewritten since (another ETag), are merged into
+the month files of the new generation right after the swap, their rows
+winning over the compacted ones. Generations that
+are no longer active are deleted once they are older than the retention
+period, which lets queries planned against them finish. Re-running the job is
+safe: an interrupted run leaves an inactive generation behind that the next
+run removes, and a table that is already compacted is left untouched. A table
+that is not partitioned yet is always rewritten, which is how the migration
+to the partitioned layout happens (see partitioning.py).
+
+Run locally from modules/lambdas:
+
+    python -m silka_common.compaction --bucket <bucket> --database <database>
+"""
+
+import argparse
+import io
+import os
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .aws_clients import get_client
+from .batch_writer import WORKOUT_ID_COLUMNS
+from .partitioning import (
+    PARTITION_KEYS,
+    is_partitioned,
+    partition_path,
+    projection_parameters,
+)
+from .table_locations import (
+    GLUE_TABLE_NAMES,
+    STAR_SCHEMA_TABLES,
+    refresh_table_prefixes,
+    split_s3_uri,
+)
+from .workouts import write_parquet_bytes
+
+# Root under which compacted generations of every table are written.
+GENERATIONS_PREFIX = "sorted/generations"
+
+# Inactive generations younger than this are kept for in-flight queries.
+DEFAULT_RETENTION_HOURS = 24
+
+# Marker written into a generation once the table has moved away from it.
+SUPERSEDED_MARKER = "_SUPERSEDED"
+
+# Keys of get_table()["Table"] accepted by update_table(TableInput=...).
+_TABLE_INPUT_KEYS = (
+    "Name",
+    "Description",
+    "Owner",
+    "LastAccessTime",
+    "LastAnalyzedTime",
+    "Retention",
+    "StorageDescriptor",
+    "PartitionKeys",
+    "ViewOriginalText",
+    "ViewExpandedText",
+    "TableType",
+    "Parameters",
+    "TargetTable",
+)
+
+# Position of the source object of each row while objects are merged.
+_FILE_COLUMN = "__source_object"
+
+_PERIOD_PART = re.compile(r"^(?:year=|month=)?(\d{2,4})$")
+
+
+def new_generation() -> str:
+    """
+    Returns the name of a new table generation, sortable by creation time.
+    """
+    return datetime.now(timezone.utc).strftime("g%Y%m%dT%H%M%SZ")
+
+
+def object_period(key: str, prefix: str) -> tuple[str, str] | None:
+    """
+    Extracts the (year, month) a Parquet object belongs to from its key.
+    Args:
+        key (str): The S3 key.
+        prefix (str): The table prefix the key lives under.
+    Returns:
+        tuple[str, str] | None: The period, None for keys outside the layout.
+    """
+    parts = key[len(prefix) :].strip("/").split("/")
+    if len(parts) < 3 or not key.endswith(".parquet"):
+        return None
+    year, month = (_PERIOD_PART.match(part) for part in parts[:2])
+    if not year or not month:
+        return None
+    return year.group(1), month.group(1)
+
+
+def list_objects(s3, bucket: str, prefix: str) -> list[dict]:
+    """
+    Lists every object under a prefix.
+    Args:
+        s3: The S3 client.
+        bucket (str): The bucket name.
+        prefix (str): The key prefix, without a trailing slash.
+    Returns:
+        list[dict]: The ListObjectsV2 entries (Key, Size, LastModified, ...).
+    """
+    objects = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/"):
+        objects.extend(page.get("Contents", []))
+    return objects
+
+
+def merge_objects(
+    s3,
+    bucket: str,
+    objects: list[dict],
+    table: str | None = None,
+    ordered: bool = False,
+) -> pa.Table:
+    """
+    Reads Parquet objects and merges them into one table. A workout written
+    more than once keeps only its rows from the most recently written object
+    that contains it, so exercises and sets removed from an edited workout
+    go away with the old version (rows are matched by workout, not by their
+    own id, which Hevy may leave null).
+    Args:
+        s3: The S3 client.
+        bucket (str): The bucket name.
+        objects (list[dict]): The ListObjectsV2 entries to merge.
+        table (str, optional): The star-schema table, e.g. "set"; without it
+            the rows are concatenated as they are.
+        ordered (bool): The objects are already oldest first; by default
+            they are sorted by LastModified.
+    Returns:
+        pa.Table: The merged table.
+    """
+    tables = []
+    if not ordered:
+        objects = sorted(objects, key=lambda o: (o["LastModified"], o["Key"]))
+    for position, entry in enumerate(objects):
+        body = s3.get_object(Bucket=bucket, Key=entry["Key"])["Body"].read()
+        arrow_table = pq.read_table(io.BytesIO(body))
+        tables.append(
+            arrow_table.append_column(
+                _FILE_COLUMN, pa.array([position] * arrow_table.num_rows, pa.int32())
+            )
+        )
+    merged = pa.concat_tables(tables, promote_options="permissive")
+
+    column = WORKOUT_ID_COLUMNS.get(table)
+    if column in merged.column_names:
+        newest = (
+            merged.select([column, _FILE_COLUMN])
+            .group_by(column)
+            .aggregate([(_FILE_COLUMN, "max")])
+        )
+        # The newest object of each row's workout, looked up by workout id.
+        row_newest = pc.take(
+            newest[f"{_FILE_COLUMN}_max"],
+            pc.index_in(merged[column], value_set=newest[column]),
+        )
+        merged = merged.filter(pc.equal(merged[_FILE_COLUMN], row_newest))
+    return merged.remove_column(merged.schema.get_field_index(_FILE_COLUMN))
+
+
+def write_table(
+    s3, bucket: str, key: str, arrow_table: pa.Table, table: str | None = None
+) -> int:
+    """
+    Writes a compacted Parquet file under the active storage profile.
+    Args:
+        table (str, optional): The star-schema table, e.g. "set".
+    Returns:
+        int: The number of bytes written.
+    """
+    body = write_parquet_bytes(arrow_table, table)
+    s3.put_object(Bucket=bucket, Key=key, Body=body)
+    return len(body)
+
+
+def swap_table_location(
+    glue,
+    database: str,
+    table: dict,
+    location: str,
+    parameters: dict | None = None,
+    partition_keys: list[dict] | None = None,
+) -> None:
+    """
+    Points a Glue table at a new location in one update_table call. The
+    call fails if the table changed since it was read.
+    Args:
+        glue: The Glue client.
+        database (str): The Glue database.
+        table (dict): The get_table()["Table"] the swap is based on.
+        location (str): The new s3:// location.
+        parameters (dict, optional): Table parameters to set alongside.
+        partition_keys (list[dict], optional): Partition keys to set alongside.
+    """
+    table_input = {k: v for k, v in table.items() if k in _TABLE_INPUT_KEYS}
+    table_input["StorageDescriptor"] = {
+        **table["StorageDescriptor"],
+        "Location": location,
+    }
+    if parameters:
+        table_input["Parameters"] = {**table.get("Parameters", {}), **parameters}
+    if partition_keys is not None:
+        table_input["PartitionKeys"] = partition_keys
+    kwargs = {"DatabaseName": database, "TableInput": table_input}
+    if table.get("VersionId"):
+        kwargs["VersionId"] = table["VersionId"]
+    glue.update_table(**kwargs)
+
+
+def mark_superseded(s3, bucket: str, prefix: str, new_location: str) -> None:
+    """
+    Drops a marker into a generation that is no longer active. The marker
+    name starts with an underscore, so Athena does not read it as data; its
+    timestamp starts the retention period of the generation.
+    """
+    s3.put_object(
+        Bucket=bucket, Key=f"{prefix}/{SUPERSEDED_MARKER}", Body=new_location.encode()
+    )
+
+
+def purge_inactive_generations(
+    s3, bucket: str, table: str, active_prefix: str, retention_hours: float
+) -> int:
+    """
+    Deletes generations of a table that are no longer active once they have
+    been inactive for longer than the retention period. The original
+    sorted/<table> prefix counts as a generation too. A generation without a
+    superseded marker (left behind by an interrupted run) is aged by its
+    newest object instead.
+    Returns:
+        int: The number of objects deleted.
+    """
+    name = STAR_SCHEMA_TABLES[table].rsplit("/", 1)[1]
+    generations = defaultdict(list)
+    for entry in list_objects(s3, bucket, f"{GENERATIONS_PREFIX}/{name}"):
+        generation = entry["Key"].split("/")[3]
+        generations[f"{GENERATIONS_PREFIX}/{name}/{generation}"].append(entry)
+    generations[STAR_SCHEMA_TABLES[table]] = list_objects(
+        s3, bucket, STAR_SCHEMA_TABLES[table]
+    )
+
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=retention_hours)
+    deleted = 0
+    for prefix, objects in generations.items():
+        if prefix == active_prefix or not objects:
+            continue
+        markers = [
+            entry
+            for entry in objects
+            if entry["Key"] == f"{prefix}/{SUPERSEDED_MARKER}"
+        ]
+        inactive_since = max(entry["LastModified"] for entry in markers or objects)
+        if inactive_since > cutoff:
+            continue
+        keys = [entry["Key"] for entry in objects]
+        for start in range(0, len(keys), 1000):
+            s3.delete_objects(
+                Bucket=bucket,
+                Delete={
+                    "Objects": [{"Key": key} for key in keys[start : start + 1000]],
+                    "Quiet": True,
+                },
+            )
+        deleted += len(keys)
+        print(f"Deleted inactive generation {prefix} ({len(keys)} objects).")
+    return deleted
+
+
+def compact_table(
+    table: str,
+    bucket: str,
+    database: str,
+    retention_hours: float = DEFAULT_RETENTION_HOURS,
+    s3=None,
+    glue=None,
+) -> dict:
+    """
+    Compacts one star-schema table into one Parquet file per month.
+    Args:
+        table (str): One of "workout", "exercise" or "set".
+        bucket (str): The data bucket.
+        database (str): The Glue database holding the table.
+        retention_hours (float): How long inactive generations are kept.
+    Returns:
+        dict: Object counts and bytes before and after, and the location.
+    """
+    s3 = s3 or get_client("s3")
+    glue = glue or get_client("glue")
+
+    glue_table = glue.get_table(DatabaseName=database, Name=GLUE_TABLE_NAMES[table])[
+        "Table"
+    ]
+    old_location = glue_table["StorageDescriptor"]["Location"]
+    _, old_prefix = split_s3_uri(old_location)
+    objects = list_objects(s3, bucket, old_prefix)
+
+    by_period = defaultdict(list)
+    for entry in objects:
+        period = object_period(entry["Key"], old_prefix)
+        if period is not None:
+            by_period[period].append(entry)
+
+    report = {
+        "table": GLUE_TABLE_NAMES[table],
+        "objects_before": len(objects),
+        "bytes_before": sum(entry["Size"] for entry in objects),
+    }
+
+    partitioned = is_partitioned(glue_table)
+    if (
+        partitioned
+        and all(len(entries) == 1 for entries in by_period.values())
+        and len(by_period) == len(objects)
+    ):
+        print(f"{report['table']} is already compacted.")
+        report.update(
+            objects_after=report["objects_before"],
+            bytes_after=report["bytes_before"],
+            location=old_location,
+        )
+        report["purged"] = purge_inactive_generations(
+            s3, bucket, table, old_prefix, retention_hours
+        )
+        return report
+
+    name = STAR_SCHEMA_TABLES[table].rsplit("/", 1)[1]
+    new_prefix = f"{GENERATIONS_PREFIX}/{name}/{new_generation()}"
+
+    def month_key(year: str, month: str) -> str:
+        return f"{new_prefix}/{partition_path(year, month)}/part-{year}{month}.parquet"
+
+    # Bytes of each month file of the new generation.
+    sizes = {}
+    for (year, month), entries in sorted(by_period.items()):
+        key = month_key(year, month)
+        if len(entries) == 1:
+            s3.copy_object(
+                Bucket=bucket,
+                Key=key,
+                CopySource={"Bucket": bucket, "Key": entries[0]["Key"]},
+            )
+            sizes[(year, month)] = entries[0]["Size"]
+        else:
+            sizes[(year, month)] = write_table(
+                s3, bucket, key, merge_objects(s3, bucket, entries, table), table
+            )
+
+    new_location = f"s3://{bucket}/{new_prefix}"
+    swap_table_location(
+        glue,
+        database,
+        glue_table,
+        new_location,
+        parameters=projection_parameters(),
+        partition_keys=PARTITION_KEYS,
+    )
+    mark_superseded(s3, bucket, old_prefix, new_location)
+    print(f"Swapped {report['table']} to {new_location}.")
+
+    # Objects written by ingestion runs that resolved the old location before
+    # the swap, new keys or listed ones rewritten since (period files are
+    # read-merged-written, per-workout objects re-uploaded by sync), are
+    # merged into the month files so they do not disappear from the table.
+    listed = {entry["Key"]: entry["ETag"] for entry in objects}
+    late = defaultdict(list)
+    for entry in list_objects(s3, bucket, old_prefix):
+        period = object_period(entry["Key"], old_prefix)
+        if period is not None and listed.get(entry["Key"]) != entry["ETag"]:
+            late[period].append(entry)
+    for period, entries in sorted(late.items()):
+        key = month_key(*period)
+        entries = sorted(entries, key=lambda o: (o["LastModified"], o["Key"]))
+        if period in sizes:
+            # The compacted rows are older than any late object.
+            entries = [{"Key": key}] + entries
+        sizes[period] = write_table(
+            s3,
+            bucket,
+            key,
+            merge_objects(s3, bucket, entries, table, ordered=True),
+            table,
+        )
+    if late:
+        print(
+            f"Merged {sum(len(entries) for entries in late.values())} late "
+            f"objects into {len(late)} month files."
+        )
+
+    report.update(
+        objects_after=len(sizes),
+        bytes_after=sum(sizes.values()),
+        location=new_location,
+    )
+    report["purged"] = purge_inactive_generations(
+        s3, bucket, table, new_prefix, retention_hours
+    )
+    return report
+
+
+def compact_tables(
+    bucket: str | None = None,
+    database: str | None = None,
+    retention_hours: float = DEFAULT_RETENTION_HOURS,
+) -> list[dict]:
+    """
+    Compacts the workouts, exercises and sets tables.
+    Args:
+        bucket (str, optional): The data bucket, BUCKET_NAME by default.
+        database (str, optional): The Glue database, ATHENA_DATABASE by default.
+        retention_hours (float): How long inactive generations are kept.
+    Returns:
+        list[dict]: One report per table.
+    """
+    bucket = bucket or os.environ.get("BUCKET_NAME")
+    database = database or os.environ.get("ATHENA_DATABASE")
+    s3 = get_client("s3")
+    glue = get_client("glue")
+    reports = [
+        compact_table(table, bucket, database, retention_hours, s3=s3, glue=glue)
+        for table in STAR_SCHEMA_TABLES
+    ]
+    refresh_table_prefixes(database)
+    return reports
+
+
+def format_report(reports: list[dict]) -> str:
+    """
+    Formats compaction reports as a short human-readable summary.
+    """
+    lines = []
+    for report in reports:
+        lines.append(
+            f"{report['table']}: {report['objects_before']} objects "
+            f"({report['bytes_before'] / 1024:.1f} KiB) -> "
+            f"{report['objects_after']} objects "
+            f"({report['bytes_after'] / 1024:.1f} KiB)"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bucket", default=os.environ.get("BUCKET_NAME"))
+    parser.add_argument("--database", default=os.environ.get("ATHENA_DATABASE"))
+    parser.add_argument(
+        "--retention-hours", type=float, default=DEFAULT_RETENTION_HOURS
+    )
+    args = parser.parse_args()
+    reports = compact_tables(args.bucket, args.database, args.retention_hours)
+    print(format_report(reports))
+
+
+if __name__ == "__main__":
+    main()
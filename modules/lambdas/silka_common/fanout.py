@@ -0,0 +1,413 @@
+"""
+Fan-out backfill: the workout index space split into shards that are
+ingested in parallel by separate invocations of fetch_all_workouts.
+
+The coordinator plans the shards from the workout count, records a run item
+in the workouts table and invokes one worker per shard. A worker runs the
+checkpointed backfill (backfill.py) over its index range with a cursor of
+its own, so a worker that nears the Lambda deadline re-invokes itself and
+the continuation (or an automatic retry of a failed invocation) resumes at
+its cursor. Workers never advance the latest-workout high-water mark: a
+shard above a failed one would otherwise make fetch_recent_workouts skip
+the missing range. Each worker commits its totals into the run item when
+its range is stored, and the commit that completes the run advances the
+high-water mark (and its SSM copy) once, to the highest index of all shards.
+
+Shards writing into the same period files or raw archives are safe: both
+writers merge with conditional puts and retry on conflicts.
+
+Workers are started through an invoker: LambdaInvoker sends asynchronous
+Lambda invocations, LocalInvoker runs the handler on threads of the current
+process, standing in for Lambda in local runs and tests.
+"""
+
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from math import ceil
+from typing import Callable, Iterable
+
+from .aws_clients import get_client
+from .backfill import DEFAULT_CHECKPOINT_EVERY, run_backfill
+from .hevy_client import BATCH_SIZE
+from .metadata import (
+    advance_high_water_mark,
+    publish_data_version,
+    publish_latest_workout_index,
+    read_backfill_cursor,
+)
+
+# Default number of shards of a fan-out backfill.
+DEFAULT_SHARDS = 8
+
+# Shards smaller than this are not worth an invocation of their own.
+MIN_SHARD_WORKOUTS = 500
+
+# Prefix of the run items; like the counter items they have no workout_day
+# and stay out of the day GSI.
+RUN_KEY_PREFIX = "backfill-run-"
+
+
+def plan_shards(
+    workout_count: int,
+    shard_count: int = DEFAULT_SHARDS,
+    min_shard_workouts: int = MIN_SHARD_WORKOUTS,
+) -> list[tuple[int, int | None]]:
+    """
+    Splits the workout index space into contiguous shards aligned to
+    workouts_batch pages.
+    Args:
+        workout_count (int): The number of workouts reported by /workout_count.
+        shard_count (int): The maximum number of shards.
+        min_shard_workouts (int): The minimum number of workouts per shard.
+    Returns:
+        list[tuple[int, int | None]]: The start and end index of each shard.
+            The last one is open ended (None), so workouts added during the
+            run and indexes above the count (after deletions) are covered.
+    """
+    shards = max(1, min(shard_count, ceil(workout_count / max(1, min_shard_workouts))))
+    size = ceil(ceil(workout_count / shards) / BATCH_SIZE) * BATCH_SIZE
+    starts = list(range(0, max(workout_count, 1), max(size, BATCH_SIZE)))
+    return [
+        (start, starts[position + 1] if position + 1 < len(starts) else None)
+        for position, start in enumerate(starts)
+    ]
+
+
+def run_key(run_id: str) -> str:
+    """
+    Returns:
+        str: The hash key of a run item.
+    """
+    return f"{RUN_KEY_PREFIX}{run_id}"
+
+
+def shard_cursor_key(run_id: str, shard: int) -> str:
+    """
+    Returns:
+        str: The hash key of a shard's resume cursor.
+    """
+    return f"backfill-cursor-{run_id}-{shard}"
+
+
+def create_run(dynamodb, table_name: str, shard_count: int, dry_run: bool) -> str:
+    """
+    Records a new fan-out run.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        shard_count (int): The number of shards that must commit.
+        dry_run (bool): Whether the shards only count what they would write.
+    Returns:
+        str: The run id, sortable by start time.
+    """
+    now = datetime.now(timezone.utc)
+    run_id = f"{now:%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:6]}"
+    dynamodb.put_item(
+        TableName=table_name,
+        Item={
+            "index": {"S": run_key(run_id)},
+            "shard_count": {"N": str(shard_count)},
+            "dry_run": {"BOOL": dry_run},
+            "status": {"S": "running"},
+            "started_at": {"S": now.isoformat()},
+            "shards": {"M": {}},
+        },
+        ConditionExpression="attribute_not_exists(#index)",
+        ExpressionAttributeNames={"#index": "index"},
+    )
+    return run_id
+
+
+def read_run(dynamodb, table_name: str, run_id: str) -> dict | None:
+    """
+    Reads a run item.
+    Returns:
+        dict | None: The item, None for an unknown run.
+    """
+    response = dynamodb.get_item(
+        TableName=table_name,
+        Key={"index": {"S": run_key(run_id)}},
+        ConsistentRead=True,
+    )
+    return response.get("Item")
+
+
+def summarize_run(item: dict) -> dict:
+    """
+    Aggregates the per-shard results of a run item.
+    Args:
+        item (dict): The run item.
+    Returns:
+        dict: run_id, status, shards, committed, written, skipped and
+            last_index (the highest index seen by any shard).
+    """
+    committed = item["shards"]["M"]
+    last_indexes = [
+        int(result["M"]["last_index"]["N"])
+        for result in committed.values()
+        if "N" in result["M"]["last_index"]
+    ]
+    return {
+        "run_id": item["index"]["S"][len(RUN_KEY_PREFIX) :],
+        "status": item["status"]["S"],
+        "shards": int(item["shard_count"]["N"]),
+        "committed": len(committed),
+        "written": sum(int(r["M"]["written"]["N"]) for r in committed.values()),
+        "skipped": sum(int(r["M"]["skipped"]["N"]) for r in committed.values()),
+        "last_index": max(last_indexes, default=None),
+        "dry_run": item["dry_run"]["BOOL"],
+    }
+
+
+def commit_shard(dynamodb, table_name: str, task: dict) -> dict:
+    """
+    Records the totals of a finished shard in its run. Committing a shard
+    twice (a retried invocation) overwrites its entry. The commit that
+    completes the run advances the high-water mark and marks it complete.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        task (dict): The shard task with its accumulated written, skipped
+            and last_index.
+    Returns:
+        dict: The run summary after the commit.
+    """
+    last_index = task.get("last_index")
+    result = {
+        "written": {"N": str(task.get("written", 0))},
+        "skipped": {"N": str(task.get("skipped", 0))},
+        "last_index": {"NULL": True} if last_index is None else {"N": str(last_index)},
+    }
+    response = dynamodb.update_item(
+        TableName=table_name,
+        Key={"index": {"S": run_key(task["run_id"])}},
+        UpdateExpression="SET shards.#shard = :result",
+        ConditionExpression="attribute_exists(shards)",
+        ExpressionAttributeNames={"#shard": str(task["shard"])},
+        ExpressionAttributeValues={":result": {"M": result}},
+        ReturnValues="ALL_NEW",
+    )
+    summary = summarize_run(response["Attributes"])
+    if summary["committed"] < summary["shards"]:
+        print(
+            f"Shard {task['shard']} of run {task['run_id']} committed "
+            f"({summary['committed']}/{summary['shards']})."
+        )
+        return summary
+    return finish_run(dynamodb, table_name, summary)
+
+
+def finish_run(dynamodb, table_name: str, summary: dict) -> dict:
+    """
+    Completes a run whose shards have all committed: advances the
+    high-water mark to the highest index of the run and moves the data
+    version on. Safe to repeat, the
+    mark only moves up.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        summary (dict): The run summary, every shard committed.
+    Returns:
+        dict: The summary with status complete.
+    """
+    if not summary["dry_run"] and summary["last_index"] is not None:
+        latest = advance_high_water_mark(dynamodb, table_name, summary["last_index"])
+        ssm = get_client("ssm")
+        publish_latest_workout_index(ssm, latest)
+        if summary["written"]:
+            publish_data_version(ssm, latest)
+    dynamodb.update_item(
+        TableName=table_name,
+        Key={"index": {"S": run_key(summary["run_id"])}},
+        UpdateExpression="SET #status = :complete, finished_at = :now",
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={
+            ":complete": {"S": "complete"},
+            ":now": {"S": datetime.now(timezone.utc).isoformat()},
+        },
+    )
+    summary = {**summary, "status": "complete"}
+    print(
+        f"Fan-out backfill {summary['run_id']} complete: {summary['written']} "
+        f"workouts written, {summary['skipped']} unchanged skipped across "
+        f"{summary['shards']} shards."
+    )
+    return summary
+
+
+class LambdaInvoker:
+    """
+    Starts workers as asynchronous invocations of a Lambda function.
+    """
+
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+
+    def invoke(self, event: dict) -> None:
+        get_client("lambda").invoke(
+            FunctionName=self.function_name,
+            InvocationType="Event",
+            Payload=json.dumps(event).encode("UTF-8"),
+        )
+
+    def wait(self) -> list:
+        """
+        Asynchronous invocations report through the run item only.
+        """
+        return []
+
+
+class LocalInvoker:
+    """
+    Runs workers on threads of this process, standing in for Lambda. Calls
+    the handler with no context, so workers run their shard to the end.
+    """
+
+    def __init__(self, handler: Callable[[dict, object], dict], max_workers: int):
+        self.handler = handler
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self._futures = []
+
+    def invoke(self, event: dict) -> None:
+        self._futures.append(self._executor.submit(self.handler, event, None))
+
+    def wait(self) -> list:
+        """
+        Waits for every worker; a failed worker raises here.
+        Returns:
+            list: The handler results, in invocation order.
+        """
+        try:
+            return [future.result() for future in self._futures]
+        finally:
+            self._executor.shutdown()
+
+
+def start_fanout(
+    table_name: str,
+    workout_count: int,
+    invoker,
+    shard_count: int = DEFAULT_SHARDS,
+    options: dict | None = None,
+    rate: float | None = None,
+    burst: int | None = None,
+) -> dict:
+    """
+    Plans the shards of a fan-out backfill and starts one worker per shard.
+    Args:
+        table_name (str): The workouts metadata table.
+        workout_count (int): The number of workouts reported by /workout_count.
+        invoker: A LambdaInvoker or LocalInvoker.
+        shard_count (int): The maximum number of shards.
+        options (dict, optional): Passed on to every shard task (dry_run,
+            checkpoint_every, max_workers).
+        rate (float, optional): Hevy API requests per second of the whole
+            run; every shard task gets an equal share, so the shards together
+            stay under it.
+        burst (int, optional): Burst size of the whole run, shared the same
+            way (at least 1 per shard).
+    Returns:
+        dict: The run summary once the invoker returns; with LambdaInvoker
+            that is right after the invocations were sent.
+    """
+    options = options or {}
+    dynamodb = get_client("dynamodb")
+    shards = plan_shards(workout_count, shard_count)
+    run_id = create_run(
+        dynamodb, table_name, len(shards), bool(options.get("dry_run", False))
+    )
+    print(
+        f"Fan-out backfill {run_id}: {workout_count} workouts in "
+        f"{len(shards)} shards."
+    )
+    limits = {}
+    if rate is not None:
+        limits["rate"] = rate / len(shards)
+    if burst is not None:
+        limits["burst"] = max(1, burst // len(shards))
+    for shard, (start, end) in enumerate(shards):
+        invoker.invoke(
+            {
+                "shard": {
+                    **options,
+                    **limits,
+                    "run_id": run_id,
+                    "shard": shard,
+                    "start_index": start,
+                    "end_index": end,
+                    "workout_count": workout_count,
+                }
+            }
+        )
+    invoker.wait()
+    return summarize_run(read_run(dynamodb, table_name, run_id))
+
+
+def run_shard(
+    bucket_name: str,
+    table_name: str,
+    task: dict,
+    workouts_from: Callable[[int], Iterable[dict]],
+    remaining_ms: Callable[[], int] | None = None,
+    invoker=None,
+) -> dict:
+    """
+    Ingests one shard, resuming at its cursor. A shard stopped before the
+    deadline hands the rest of its range to a new invocation, carrying its
+    totals so far in the task; a finished shard commits into the run.
+    Args:
+        bucket_name (str): The S3 bucket.
+        table_name (str): The workouts metadata table.
+        task (dict): The shard task sent by start_fanout().
+        workouts_from (Callable): Returns the shard's workouts from an index
+            on, in index order, ending before the shard's end_index.
+        remaining_ms (Callable, optional): Returns the milliseconds left before
+            the Lambda deadline.
+        invoker (optional): Starts the continuation of an unfinished shard.
+    Returns:
+        dict: The run summary after the commit, or the continuation task.
+    """
+    dynamodb = get_client("dynamodb")
+    dry_run = bool(task.get("dry_run", False))
+    cursor_key = shard_cursor_key(task["run_id"], task["shard"])
+    start_index = task["start_index"]
+    if not dry_run:
+        cursor = read_backfill_cursor(dynamodb, table_name, cursor_key)
+        start_index = start_index if cursor is None else cursor
+
+    result = run_backfill(
+        bucket_name,
+        table_name,
+        workouts_from(start_index),
+        dry_run=dry_run,
+        checkpoint_every=int(task.get("checkpoint_every", DEFAULT_CHECKPOINT_EVERY)),
+        remaining_ms=remaining_ms,
+        start_index=start_index,
+        cursor_key=cursor_key,
+        advance_latest=False,
+    )
+    last_indexes = [
+        index
+        for index in (task.get("last_index"), result["last_index"])
+        if index is not None
+    ]
+    task = {
+        **task,
+        "written": task.get("written", 0) + result["written"],
+        "skipped": task.get("skipped", 0) + result["skipped"],
+        "last_index": max(last_indexes, default=None),
+    }
+    if result["next_index"] is None:
+        return commit_shard(dynamodb, table_name, task)
+
+    if invoker is None:
+        raise RuntimeError(
+            f"Shard {task['shard']} stopped at index {result['next_index']} "
+            "with no invoker to continue it"
+        )
+    task["start_index"] = result["next_index"]
+    invoker.invoke({"shard": task})
+    print(f"Shard {task['shard']} continues at index {task['start_index']}.")
+    return task
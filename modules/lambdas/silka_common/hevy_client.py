@@ -0,0 +1,346 @@
+"""
+Client of the Hevy API endpoints used by the ingestion Lambdas.
+
+One requests Session is kept per execution environment, so warm invocations
+and the concurrent backfill reuse pooled keep-alive connections instead of
+paying a TLS handshake per page. On top of it the client:
+
+- asks for gzip responses and times out instead of hanging,
+- sends If-None-Match / If-Modified-Since when a previous response for the
+  same URL carried an ETag or Last-Modified, and serves 304s from a small
+  in-memory cache,
+- spreads its calls with a token bucket (HEVY_RATE_LIMIT requests per second,
+  bursts of HEVY_BURST) so the concurrent backfill stays under Hevy's rate
+  limit rather than provoking it,
+- retries 429s, 5xx responses and connection errors with jittered
+  exponential backoff, honouring Retry-After.
+
+stats() reports requests, retries, cache hits, throttling and latency since
+the client was created or since reset_stats(); the shared client outlives
+invocations, so a run resets it first to report its own requests.
+"""
+
+import json
+import os
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metadata import backoff_delay
+
+DEFAULT_BASE_URL = "https://api.hevyapp.com"
+
+# The workouts_batch endpoint returns at most this many workouts per page.
+BATCH_SIZE = 10
+
+# Connections kept in the session pool; the concurrent backfill fetches up to
+# DEFAULT_MAX_WORKERS pages at once.
+POOL_SIZE = 16
+
+# (connect, read) timeouts in seconds.
+TIMEOUT = (5, 30)
+
+# Attempts at a request before its error is raised.
+MAX_ATTEMPTS = 5
+
+# Base and cap, in seconds, of the backoff between two attempts.
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 20.0
+
+# Statuses worth retrying: rate limited or a transient server error.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Latencies of the most recent requests kept for the percentiles in stats().
+LATENCY_SAMPLES = 1024
+
+# URLs whose last response is kept for conditional requests. Small on
+# purpose: it serves the repeated polls of the same pages, not a backfill.
+CONDITIONAL_CACHE_SIZE = 32
+
+HEADERS = {
+    "accept": "application/json, text/plain, */*",
+    "accept-encoding": "gzip",
+    "x-api-key": "klean_kanteen_insulated",
+    "User-Agent": "okhttp/4.9.3",
+    "Pragma": "no-cache",
+    "Cache-Control": "no-cache",
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: take() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> float:
+        """
+        Takes one token, waiting for it if the bucket is empty.
+        Returns:
+            float: The number of seconds waited.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # Reserve the token now and wait outside the lock, so callers are
+            # served in arrival order without holding each other up.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class HevyClient:
+    """
+    Pooled, rate-limited and retrying client of the Hevy API. Safe to share
+    between threads.
+    """
+
+    def __init__(
+        self,
+        token: str | None = None,
+        base_url: str | None = None,
+        rate: float = 10.0,
+        burst: int = 10,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
+        self.max_attempts = max_attempts
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.session.headers["auth-token"] = token or ""
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.bucket = TokenBucket(rate, burst)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def from_env(
+        cls, rate: float | None = None, burst: int | None = None
+    ) -> "HevyClient":
+        """
+        Builds a client from HEVY_TOKEN, HEVY_API_URL, HEVY_RATE_LIMIT and
+        HEVY_BURST.
+        Args:
+            rate (float, optional): Requests per second instead of
+                HEVY_RATE_LIMIT, e.g. a fan-out shard's share of it.
+            burst (int, optional): Burst size instead of HEVY_BURST.
+        """
+        if rate is None:
+            rate = float(os.environ.get("HEVY_RATE_LIMIT", "10"))
+        if burst is None:
+            burst = int(os.environ.get("HEVY_BURST", "10"))
+        return cls(
+            token=os.environ.get("HEVY_TOKEN"),
+            base_url=os.environ.get("HEVY_API_URL"),
+            rate=rate,
+            burst=burst,
+        )
+
+    def workout_count(self) -> int:
+        """
+        Returns:
+            int: The number of workouts of the account.
+        """
+        return self._get_json("/workout_count", "workout count")["workout_count"]
+
+    def workouts_batch(self, start_index: int) -> list[dict]:
+        """
+        Fetches a single page of workouts.
+        Args:
+            start_index (int): The workout index the page starts at.
+        Returns:
+            list[dict]: Up to BATCH_SIZE workouts with index >= start_index.
+        """
+        return self._get_json(
+            f"/workouts_batch/{start_index}", f"workouts batch {start_index}"
+        )
+
+    def iter_workouts(self, start_index: int = 0) -> Iterator[dict]:
+        """
+        Walks the workouts_batch pages one at a time, using the last index of
+        each page as the cursor for the next one. Workouts are yielded as each
+        page arrives.
+        Args:
+            start_index (int): The workout index to start the walk at.
+        Yields:
+            dict: Every workout with index >= start_index, in index order.
+        """
+        workouts = self.workouts_batch(start_index)
+        yield from workouts
+        while len(workouts) == BATCH_SIZE:
+            workouts = self.workouts_batch(workouts[-1]["index"] + 1)
+            yield from workouts
+
+    def _get_json(self, path: str, what: str):
+        url = f"{self.base_url}{path}"
+        with self._lock:
+            cached = self._cache.get(url)
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        for attempt in range(self.max_attempts):
+            last = attempt == self.max_attempts - 1
+            waited = self.bucket.take()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, timeout=TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(started, waited, retried=not last)
+                if last:
+                    raise
+                time.sleep(
+                    backoff_delay(attempt, BACKOFF_BASE_SECONDS, BACKOFF_CAP_SECONDS)
+                )
+                continue
+
+            retry = response.status_code in RETRY_STATUSES and not last
+            self._record(started, waited, retried=retry)
+            if retry:
+                time.sleep(self._retry_delay(response, attempt))
+                continue
+            if response.status_code == 304 and cached:
+                with self._lock:
+                    self._counts["not_modified"] += 1
+                    self._cache.move_to_end(url)
+                return json.loads(cached["body"])
+            if response.status_code != 200:
+                raise Exception(
+                    f"Failed to fetch {what} ({response.status_code}): {response.text}"
+                )
+            self._remember(url, response)
+            return response.json()
+
+    def _retry_delay(self, response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(BACKOFF_CAP_SECONDS, float(retry_after))
+        return backoff_delay(attempt, BACKOFF_BASE_SECONDS, BACKOFF_CAP_SECONDS)
+
+    def _remember(self, url: str, response) -> None:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._cache[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "body": response.content,
+            }
+            self._cache.move_to_end(url)
+            while len(self._cache) > CONDITIONAL_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _record(self, started: float, waited: float, retried: bool) -> None:
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._counts["requests"] += 1
+            self._counts["retries"] += int(retried)
+            self._throttled += waited
+            self._latencies.append(elapsed)
+            self._max_latency = max(self._max_latency, elapsed)
+
+    def reset_stats(self) -> None:
+        """
+        Starts the counts of stats() over, e.g. at the start of an invocation.
+        """
+        with self._lock:
+            self._latencies = deque(maxlen=LATENCY_SAMPLES)
+            self._max_latency = 0.0
+            self._counts = {"requests": 0, "retries": 0, "not_modified": 0}
+            self._throttled = 0.0
+
+    def stats(self) -> dict:
+        """
+        Reports the requests made since the client was created or reset.
+        Returns:
+            dict: requests, retries, not_modified, throttled_s and the
+                latency_ms p50/p95 of the last LATENCY_SAMPLES requests and
+                max of all of them.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            longest = self._max_latency
+            stats = dict(self._counts, throttled_s=round(self._throttled, 3))
+        stats["latency_ms"] = {}
+        if latencies:
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats["latency_ms"] = {
+                "p50": round(statistics.median(latencies) * 1000, 1),
+                "p95": round(p95 * 1000, 1),
+                "max": round(longest * 1000, 1),
+            }
+        return stats
+
+    def format_stats(self) -> str:
+        """
+        Formats stats() as one log line.
+        Returns:
+            str: e.g. "Hevy API: 31 requests, 1 retries, 0 not modified,
+                throttled 0.4s, latency p50 120.3ms p95 250.0ms max 400.1ms".
+        """
+        stats = self.stats()
+        line = (
+            f"Hevy API: {stats['requests']} requests, {stats['retries']} retries, "
+            f"{stats['not_modified']} not modified, throttled {stats['throttled_s']}s"
+        )
+        if stats["latency_ms"]:
+            latency = stats["latency_ms"]
+            line += (
+                f", latency p50 {latency['p50']}ms p95 {latency['p95']}ms "
+                f"max {latency['max']}ms"
+            )
+        return line
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_hevy_client() -> HevyClient:
+    """
+    Returns the client shared by the execution environment, creating it from
+    the environment on first use.
+    Returns:
+        HevyClient: The shared client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HevyClient.from_env()
+        return _client
+
+
+def reset_hevy_client() -> None:
+    """
+    Drops the shared client. For local tools and tests that switch the
+    token or the API URL.
+    """
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,287 @@
+"""
+Workout ingestion engine shared by hevy_api_caller and fetch_all_workouts.
+
+A workout goes through four stages connected by bounded queues:
+
+    fetch -> normalize -> encode -> upload
+
+fetch is the source iterable (usually Hevy API pages), normalize builds the
+star-schema rows, encode serializes the JSON and Parquet payloads and upload
+writes them to S3 and queues the workout's DynamoDB item. The raw payloads
+are merged into the monthly compressed archives (see raw_archive.py), and
+the items are only written, in batches, once the period Parquet files and
+archives are stored: an item's fingerprint makes later runs skip the
+workout, so it must not outlive a failed or interrupted S3 flush. Then the
+latest-workout high-water mark is advanced.
+"""
+
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from .aws_clients import get_client
+from .batch_writer import PARQUET_LAYOUTS, BatchParquetWriter
+from .metadata import (
+    MetadataWriter,
+    advance_high_water_mark,
+    publish_data_version,
+    publish_latest_workout_index,
+)
+from .normalize import StarSchemaColumns, normalize_workouts_columnar
+from .pipeline import Pipeline, Stage
+from .raw_archive import RawArchiveWriter
+from .table_locations import STAR_SCHEMA_TABLES, refresh_table_prefixes
+from .workouts import (
+    build_dynamodb_item,
+    workout_json_key,
+    workout_parquet_key,
+    write_parquet_bytes,
+)
+
+
+@dataclass
+class IngestionConfig:
+    """
+    Concurrency settings of the ingestion pipeline.
+    Attributes:
+        normalize_workers (int): Threads normalizing workouts.
+        encode_workers (int): Threads serializing JSON/Parquet payloads.
+        upload_workers (int): Threads writing to S3 and DynamoDB.
+        queue_size (int): Capacity of each queue between two stages.
+        parquet_layout (str): "per_workout" writes one Parquet file per
+            workout and table; "daily" / "monthly" write one per period.
+    """
+
+    normalize_workers: int = 1
+    encode_workers: int = 2
+    upload_workers: int = 4
+    queue_size: int = 8
+    parquet_layout: str = "per_workout"
+
+    @classmethod
+    def from_env(cls) -> "IngestionConfig":
+        """
+        Reads the settings from INGEST_* environment variables.
+        Returns:
+            IngestionConfig: The configuration, defaults for unset variables.
+        """
+        defaults = cls()
+        return cls(
+            normalize_workers=int(
+                os.environ.get("INGEST_NORMALIZE_WORKERS", defaults.normalize_workers)
+            ),
+            encode_workers=int(
+                os.environ.get("INGEST_ENCODE_WORKERS", defaults.encode_workers)
+            ),
+            upload_workers=int(
+                os.environ.get("INGEST_UPLOAD_WORKERS", defaults.upload_workers)
+            ),
+            queue_size=int(os.environ.get("INGEST_QUEUE_SIZE", defaults.queue_size)),
+            parquet_layout=os.environ.get("PARQUET_LAYOUT", defaults.parquet_layout),
+        )
+
+
+@dataclass
+class PreparedWorkout:
+    """
+    A workout after the normalize stage. columns is None in the batch
+    layouts, where the batch writer normalizes a whole period at once.
+    """
+
+    workout: dict
+    json_key: str
+    columns: StarSchemaColumns | None
+
+
+@dataclass
+class EncodedWorkout:
+    """
+    A workout after the encode stage: the objects to upload and its item.
+    """
+
+    workout: dict
+    objects: list[tuple[str, bytes]] = field(default_factory=list)
+    item: dict = field(default_factory=dict)
+
+
+class WorkoutIngestor:
+    """
+    Stores workouts in S3 (raw JSON + star-schema Parquet) and registers
+    them in DynamoDB through the staged pipeline.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        table_name: str,
+        config: IngestionConfig | None = None,
+        advance_latest: bool = True,
+        lease=None,
+    ):
+        self.bucket_name = bucket_name
+        self.table_name = table_name
+        self.config = config or IngestionConfig.from_env()
+        # Fan-out shards leave the high-water mark to the run's last commit.
+        self.advance_latest = advance_latest
+        # The lease the ingestion runs under (see lease.py): checked before
+        # every write, its token fences the high-water mark update.
+        self.lease = lease
+        self.fencing_token = lease.token if lease is not None else None
+        # Shared clients from the registry, fetched once up front and then
+        # used from all the worker threads.
+        self.s3 = get_client("s3")
+        self.dynamodb = get_client("dynamodb")
+        self.ssm = get_client("ssm")
+        refresh_table_prefixes()
+        if self.config.parquet_layout not in PARQUET_LAYOUTS:
+            raise ValueError(f"Unknown PARQUET_LAYOUT: {self.config.parquet_layout}")
+        self.batch_writer = None
+        if self.config.parquet_layout != "per_workout":
+            self.batch_writer = BatchParquetWriter(
+                self.s3,
+                bucket_name,
+                self.config.parquet_layout,
+                max_workers=self.config.upload_workers,
+            )
+        self.raw_archive = RawArchiveWriter(
+            self.s3, bucket_name, max_workers=self.config.upload_workers
+        )
+        self.metadata = MetadataWriter(self.dynamodb, table_name)
+        self.latest_index = None
+        self._uploaded = 0
+        self._total = None
+        self._lock = threading.Lock()
+
+    def check_lease(self) -> None:
+        """
+        Raises LeaseLost if the ingestion runs under a lease that was lost.
+        """
+        if self.lease is not None:
+            self.lease.check()
+
+    def normalize(self, workout: dict) -> PreparedWorkout:
+        """
+        Normalize stage: splits a raw workout into the star-schema columns.
+        """
+        columns = None
+        if self.batch_writer is None:
+            columns = normalize_workouts_columnar([workout])
+        return PreparedWorkout(
+            workout=workout, json_key=workout_json_key(workout), columns=columns
+        )
+
+    def encode(self, prepared: PreparedWorkout) -> EncodedWorkout:
+        """
+        Encode stage: serializes the raw JSON and one Parquet file per table.
+        In a batch layout the workout is handed to the batch writer instead.
+        """
+        encoded = EncodedWorkout(workout=prepared.workout)
+        encoded.objects.append(
+            (prepared.json_key, json.dumps(prepared.workout).encode("UTF-8"))
+        )
+        self.raw_archive.add(prepared.workout)
+        if self.batch_writer is not None:
+            self.batch_writer.add(prepared.workout)
+        else:
+            tables = prepared.columns.to_arrow()
+            for table in STAR_SCHEMA_TABLES:
+                if tables[table].num_rows:
+                    encoded.objects.append(
+                        (
+                            workout_parquet_key(prepared.workout, table),
+                            write_parquet_bytes(tables[table], table),
+                        )
+                    )
+        encoded.item = build_dynamodb_item(
+            prepared.workout, self.bucket_name, prepared.json_key
+        )
+        return encoded
+
+    def upload(self, encoded: EncodedWorkout) -> dict:
+        """
+        Upload stage: writes the objects to S3 and queues the workout item.
+        """
+        self.check_lease()
+        for key, body in encoded.objects:
+            self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=body)
+        self.metadata.add(encoded.item)
+
+        workout = encoded.workout
+        with self._lock:
+            self._uploaded += 1
+            count = self._uploaded
+        total = f"/{self._total}" if self._total is not None else ""
+        print(
+            f"Processed workout {count}{total}: {workout['name']} (ID: {workout['id']})"
+        )
+        return {"id": workout["id"], "index": workout["index"]}
+
+    def ingest(self, workouts: Iterable[dict], total: int | None = None) -> list[dict]:
+        """
+        Runs workouts through the pipeline, then advances the latest-workout
+        high-water mark (and its SSM copy) to the highest index stored and
+        moves the data version on, unless the ingestor was created with
+        advance_latest=False.
+        Args:
+            workouts (Iterable[dict]): Raw Hevy workouts; may be a generator.
+            total (int, optional): Expected number of workouts, for progress logs.
+        Returns:
+            list[dict]: The id and index of every stored workout.
+        """
+        self._uploaded = 0
+        self._total = total
+        pipeline = Pipeline(
+            [
+                Stage(
+                    "normalize",
+                    self.normalize,
+                    self.config.normalize_workers,
+                    self.config.queue_size,
+                ),
+                Stage(
+                    "encode",
+                    self.encode,
+                    self.config.encode_workers,
+                    self.config.queue_size,
+                ),
+                Stage(
+                    "upload",
+                    self.upload,
+                    self.config.upload_workers,
+                    self.config.queue_size,
+                ),
+            ]
+        )
+        stored = pipeline.run(workouts)
+        print(pipeline.summary())
+
+        self.check_lease()
+        if self.batch_writer is not None:
+            keys = self.batch_writer.flush()
+            print(f"Wrote {len(keys)} {self.config.parquet_layout} Parquet files.")
+        keys = self.raw_archive.flush()
+        print(f"Updated {len(keys)} monthly raw JSON archives.")
+
+        # Only now that the S3 data is durable: see MetadataWriter.
+        self.check_lease()
+        self.metadata.flush()
+        print(
+            f"Registered {self.metadata.items_written} workouts in "
+            f"{self.metadata.batches_written} DynamoDB batches."
+        )
+        if self.advance_latest and self.metadata.max_index is not None:
+            self.latest_index = advance_high_water_mark(
+                self.dynamodb,
+                self.table_name,
+                self.metadata.max_index,
+                self.fencing_token,
+            )
+            # SSM has no conditional put: publish only while the lease holds.
+            self.check_lease()
+            publish_latest_workout_index(self.ssm, self.latest_index)
+        if self.advance_latest and self.metadata.items_written:
+            self.check_lease()
+            publish_data_version(self.ssm, self.latest_index)
+        return stored
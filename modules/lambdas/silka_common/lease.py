@@ -0,0 +1,337 @@
+"""
+DynamoDB-backed leases with fencing tokens, guarding critical sections
+that must not run concurrently, e.g. two fetch_workouts commands reading
+the same latest-workout-index and ingesting the same workouts twice.
+
+A lease is an item of the workouts table (lease-<name>, outside the day GSI
+like the other counter items). Acquiring it is one conditional update that
+succeeds when nobody holds it or the holder's lease has expired, and that
+increments the item's fencing token. The holder renews the expiry from a
+heartbeat thread while it works, so a crashed holder blocks the others for
+at most one TTL. A holder calls Lease.check() before its writes and stops
+with LeaseLost once the lease was taken over (or has expired unrenewed), so
+it does not keep fetching and writing next to the new holder. Writes made
+under the lease also carry the token; a holder that was paused past its
+expiry and replaced therefore cannot overwrite the newer holder's results
+(see advance_high_water_mark).
+
+A caller that finds the lease held either
+- waits for it ("wait"),
+- coalesces into the running holder ("coalesce"): it flags the lease, and
+  the holder runs its work once more before releasing, however many
+  callers flagged it, or
+- gives up at once ("exit").
+"""
+
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable
+
+from botocore.exceptions import ClientError
+
+# Hash key prefix of the lease items.
+LEASE_KEY_PREFIX = "lease-"
+
+# How long a lease lasts without a renewal.
+DEFAULT_TTL_SECONDS = 60
+
+# How long a "wait" caller waits for the lease before giving up.
+DEFAULT_WAIT_SECONDS = 300
+
+# Pause between two attempts at taking a held lease.
+POLL_SECONDS = 2
+
+# What a caller does when the lease is held.
+LEASE_MODES = ("wait", "coalesce", "exit")
+
+
+class LeaseLost(Exception):
+    """
+    Raised by Lease.check() once the lease is no longer held.
+    """
+
+
+@dataclass
+class Lease:
+    """
+    A lease held by this process.
+    Attributes:
+        name (str): The lease name.
+        owner (str): The unique id of this holder.
+        token (int): The fencing token, higher for every new holder.
+        ttl_seconds (int): How long the lease lasts without a renewal.
+        lost (bool): Set when a renewal found the lease taken over.
+        expires (float): time.monotonic() value the lease expires at unless
+            renewed before.
+    """
+
+    name: str
+    owner: str
+    token: int
+    ttl_seconds: int
+    lost: bool = False
+    expires: float = 0.0
+
+    def check(self) -> None:
+        """
+        Raises LeaseLost if the lease was taken over or has expired, e.g.
+        after the process was paused; call it before writes made under it.
+        """
+        if self.lost or time.monotonic() >= self.expires:
+            raise LeaseLost(f"Lease {self.name} (token {self.token}) was lost.")
+
+
+def lease_key(name: str) -> dict:
+    """
+    Returns:
+        dict: The DynamoDB key of a lease item.
+    """
+    return {"index": {"S": f"{LEASE_KEY_PREFIX}{name}"}}
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _conditional_check_failed(error: ClientError) -> bool:
+    return (
+        error.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+    )
+
+
+def try_acquire(
+    dynamodb, table_name: str, name: str, ttl_seconds: int = DEFAULT_TTL_SECONDS
+) -> Lease | None:
+    """
+    Takes the lease if it is free or expired.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        name (str): The lease name.
+        ttl_seconds (int): How long the lease lasts without a renewal.
+    Returns:
+        Lease | None: The lease, None if someone else holds it.
+    """
+    owner = uuid.uuid4().hex
+    now = _now_ms()
+    expires = time.monotonic() + ttl_seconds
+    try:
+        response = dynamodb.update_item(
+            TableName=table_name,
+            Key=lease_key(name),
+            UpdateExpression=(
+                "SET #owner = :owner, expires_at = :expires, acquired_at = :now "
+                "REMOVE rerun_requested ADD fencing_token :one"
+            ),
+            ConditionExpression="attribute_not_exists(#owner) OR expires_at < :now",
+            ExpressionAttributeNames={"#owner": "owner"},
+            ExpressionAttributeValues={
+                ":owner": {"S": owner},
+                ":expires": {"N": str(now + ttl_seconds * 1000)},
+                ":now": {"N": str(now)},
+                ":one": {"N": "1"},
+            },
+            ReturnValues="ALL_NEW",
+        )
+    except ClientError as e:
+        if _conditional_check_failed(e):
+            return None
+        raise
+    token = int(response["Attributes"]["fencing_token"]["N"])
+    return Lease(
+        name=name, owner=owner, token=token, ttl_seconds=ttl_seconds, expires=expires
+    )
+
+
+def renew(dynamodb, table_name: str, lease: Lease) -> bool:
+    """
+    Extends a held lease by its TTL.
+    Returns:
+        bool: False if the lease was taken over in the meantime.
+    """
+    expires = time.monotonic() + lease.ttl_seconds
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key=lease_key(lease.name),
+            UpdateExpression="SET expires_at = :expires",
+            ConditionExpression="#owner = :owner AND fencing_token = :token",
+            ExpressionAttributeNames={"#owner": "owner"},
+            ExpressionAttributeValues={
+                ":expires": {"N": str(_now_ms() + lease.ttl_seconds * 1000)},
+                ":owner": {"S": lease.owner},
+                ":token": {"N": str(lease.token)},
+            },
+        )
+        lease.expires = expires
+        return True
+    except ClientError as e:
+        if _conditional_check_failed(e):
+            return False
+        raise
+
+
+def request_rerun(dynamodb, table_name: str, name: str) -> bool:
+    """
+    Asks the current holder to run its work once more before releasing.
+    Returns:
+        bool: True if a live holder will pick the request up, False if the
+            lease is free (or expired) and the caller should take it itself.
+    """
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key=lease_key(name),
+            UpdateExpression="SET rerun_requested = :true",
+            ConditionExpression="attribute_exists(#owner) AND expires_at >= :now",
+            ExpressionAttributeNames={"#owner": "owner"},
+            ExpressionAttributeValues={
+                ":true": {"BOOL": True},
+                ":now": {"N": str(_now_ms())},
+            },
+        )
+        return True
+    except ClientError as e:
+        if _conditional_check_failed(e):
+            return False
+        raise
+
+
+def release(dynamodb, table_name: str, lease: Lease, force: bool = False) -> bool:
+    """
+    Gives the lease up, unless a rerun was requested since the work started;
+    then the request is taken (cleared) and the lease kept.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        lease (Lease): The held lease.
+        force (bool): Release even if a rerun was requested, e.g. after the
+            work failed.
+    Returns:
+        bool: True if released (or no longer ours), False if the holder has
+            to run its work again.
+    """
+    held = "#owner = :owner AND fencing_token = :token"
+    condition = held if force else f"{held} AND attribute_not_exists(rerun_requested)"
+    values = {":owner": {"S": lease.owner}, ":token": {"N": str(lease.token)}}
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key=lease_key(lease.name),
+            UpdateExpression="REMOVE #owner, expires_at, rerun_requested",
+            ConditionExpression=condition,
+            ExpressionAttributeNames={"#owner": "owner"},
+            ExpressionAttributeValues=values,
+        )
+        return True
+    except ClientError as e:
+        if not _conditional_check_failed(e):
+            raise
+    # Either a rerun was requested or the lease is someone else's by now.
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key=lease_key(lease.name),
+            UpdateExpression="REMOVE rerun_requested",
+            ConditionExpression=f"{held} AND attribute_exists(rerun_requested)",
+            ExpressionAttributeNames={"#owner": "owner"},
+            ExpressionAttributeValues=values,
+        )
+    except ClientError as e:
+        if not _conditional_check_failed(e):
+            raise
+        print(f"Lease {lease.name} was taken over before it was released.")
+        lease.lost = True
+        return True
+    return False
+
+
+class LeaseHeartbeat:
+    """
+    Renews a lease every third of its TTL from a background thread while
+    the with block runs. A failed renewal marks the lease as lost.
+    """
+
+    def __init__(self, dynamodb, table_name: str, lease: Lease):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.lease = lease
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> Lease:
+        self._thread.start()
+        return self.lease
+
+    def __exit__(self, *exc_info) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.lease.ttl_seconds / 3):
+            if not renew(self.dynamodb, self.table_name, self.lease):
+                print(f"Lease {self.lease.name} was lost, its token is stale.")
+                self.lease.lost = True
+                return
+
+
+def run_exclusively(
+    dynamodb,
+    table_name: str,
+    name: str,
+    work: Callable[[Lease], None],
+    mode: str = "coalesce",
+    wait_seconds: float = DEFAULT_WAIT_SECONDS,
+    ttl_seconds: int = DEFAULT_TTL_SECONDS,
+) -> dict:
+    """
+    Runs work under a lease, handling a held lease according to mode.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        name (str): The lease name.
+        work (Callable[[Lease], None]): The critical section; receives the
+            lease, whose token it passes on to its writes and whose check()
+            it calls between them.
+        mode (str): "wait", "coalesce" or "exit", see the module docstring.
+        wait_seconds (float): How long "wait" waits before giving up.
+        ttl_seconds (int): How long the lease lasts without a renewal.
+    Returns:
+        dict: status ("ran", "coalesced", "busy" or "lost" when the work
+            stopped on LeaseLost), runs and token.
+    """
+    if mode not in LEASE_MODES:
+        raise ValueError(f"Unknown lease mode {mode!r}, expected one of {LEASE_MODES}")
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        lease = try_acquire(dynamodb, table_name, name, ttl_seconds)
+        if lease is not None:
+            break
+        if mode == "exit":
+            return {"status": "busy", "runs": 0, "token": None}
+        # A failed request means the holder just released; take it over.
+        if mode == "coalesce" and request_rerun(dynamodb, table_name, name):
+            return {"status": "coalesced", "runs": 0, "token": None}
+        if mode == "wait" and time.monotonic() >= deadline:
+            return {"status": "busy", "runs": 0, "token": None}
+        if mode == "wait":
+            time.sleep(POLL_SECONDS)
+
+    runs = 0
+    with LeaseHeartbeat(dynamodb, table_name, lease):
+        try:
+            while True:
+                work(lease)
+                runs += 1
+                if release(dynamodb, table_name, lease):
+                    break
+                print(f"Lease {name}: a rerun was requested, running again.")
+        except LeaseLost as e:
+            print(f"{e} Stopped before any further writes.")
+            return {"status": "lost", "runs": runs, "token": lease.token}
+        except BaseException:
+            release(dynamodb, table_name, lease, force=True)
+            raise
+    return {"status": "ran", "runs": runs, "token": lease.token}
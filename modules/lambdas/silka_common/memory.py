@@ -0,0 +1,92 @@
+"""
+Peak-memory measurement, for sizing the memory setting of a Lambda.
+
+tracemalloc sees the Python heap: parsed JSON pages, normalized rows and the
+items waiting in the pipeline queues. Arrow buffers (Parquet encoding, period
+file merges) are allocated outside of it, so the high-water mark of the Arrow
+memory pool and the peak RSS of the process are reported next to it; the
+latter is what Lambda shows as "Max Memory Used".
+"""
+
+import resource
+import sys
+import tracemalloc
+
+MIB = 1024 * 1024
+
+
+class PeakMemoryTracker:
+    """
+    Context manager recording the peak traced Python memory of its block.
+    Tracing slows every allocation down, so it is off unless enabled, e.g.
+    while sizing the memory setting; report() then has the Arrow and RSS
+    peaks only.
+
+        with PeakMemoryTracker(enabled=True) as tracker:
+            run_backfill(...)
+        print(tracker.format())
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.python_peak_bytes = None
+        self._started = False
+
+    def __enter__(self) -> "PeakMemoryTracker":
+        if self.enabled:
+            self._started = not tracemalloc.is_tracing()
+            if self._started:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.enabled:
+            _, self.python_peak_bytes = tracemalloc.get_traced_memory()
+            if self._started:
+                tracemalloc.stop()
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: python_peak_mb (None when tracing was disabled),
+                arrow_peak_mb (None when pyarrow was never imported) and
+                max_rss_mb, all in MiB.
+        """
+        python_peak = (
+            None
+            if self.python_peak_bytes is None
+            else round(self.python_peak_bytes / MIB, 1)
+        )
+        arrow_peak = None
+        # Only report Arrow if something already loaded it; importing it here
+        # would add its own footprint to the figures.
+        if "pyarrow" in sys.modules:
+            pool = sys.modules["pyarrow"].default_memory_pool()
+            arrow_peak = round(pool.max_memory() / MIB, 1)
+        # ru_maxrss is in KiB on Linux.
+        max_rss = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        return {
+            "python_peak_mb": python_peak,
+            "arrow_peak_mb": arrow_peak,
+            "max_rss_mb": max_rss,
+        }
+
+    def format(self) -> str:
+        """
+        Formats report() as one log line.
+        Returns:
+            str: e.g. "Peak memory: python 12.3 MiB, arrow 40.0 MiB, RSS
+                180.2 MiB".
+        """
+        report = self.report()
+        parts = [
+            f"{label} {report[key]} MiB"
+            for label, key in (
+                ("python", "python_peak_mb"),
+                ("arrow", "arrow_peak_mb"),
+                ("RSS", "max_rss_mb"),
+            )
+            if report[key] is not None
+        ]
+        return "Peak memory: " + ", ".join(parts)
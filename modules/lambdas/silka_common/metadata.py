@@ -0,0 +1,357 @@
+"""
+Workout metadata in DynamoDB: batched item writes and the latest-workout
+high-water mark.
+
+Items are written with batch_write_item, 25 at a time, and whatever DynamoDB
+returns as unprocessed is retried with jittered exponential backoff. The
+highest workout index ingested so far lives in a counter item of the same
+table that only ever moves up (a conditional update), so finding it never
+needs a scan. SSM keeps a copy under LATEST_WORKOUT_INDEX_PARAMETER for the
+readers that look it up there, and a data version under
+DATA_VERSION_PARAMETER that changes with every ingestion that stored
+workouts, new or updated (cached query results are keyed by it).
+
+The backfill keeps its resume cursor in another such item, and reads the
+content fingerprints stored on the workout items with batch_get_item to
+skip workouts that did not change.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from .lease import LeaseLost
+
+# SSM parameter mirroring the high-water mark.
+LATEST_WORKOUT_INDEX_PARAMETER = "/926728314305/latest-workout-index"
+
+# SSM parameter changed whenever ingestion stored workouts.
+DATA_VERSION_PARAMETER = "/926728314305/data-version"
+
+# Hash key of the counter item. Workout items are keyed by their numeric
+# index, so it never collides with one; it has no workout_day and therefore
+# stays out of the day GSI.
+HIGH_WATER_MARK_KEY = "latest-workout-index"
+
+# Hash key of the item holding the backfill resume cursor.
+BACKFILL_CURSOR_KEY = "backfill-cursor"
+
+# batch_write_item accepts at most 25 put requests per call.
+BATCH_WRITE_SIZE = 25
+
+# batch_get_item accepts at most 100 keys per call.
+BATCH_GET_SIZE = 100
+
+# Attempts at writing the unprocessed items of a batch before giving up.
+MAX_BATCH_ATTEMPTS = 8
+
+# Base and cap, in seconds, of the backoff between two attempts.
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_CAP_SECONDS = 5.0
+
+
+def backoff_delay(
+    attempt: int,
+    base: float = BACKOFF_BASE_SECONDS,
+    cap: float = BACKOFF_CAP_SECONDS,
+) -> float:
+    """
+    Full-jitter exponential backoff.
+    Args:
+        attempt (int): The number of attempts made so far (0 for the first retry).
+        base (float): The upper bound of the first delay, in seconds.
+        cap (float): The upper bound of any delay, in seconds.
+    Returns:
+        float: The number of seconds to wait.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class MetadataWriter:
+    """
+    Buffers workout items and writes them with batch_write_item. Safe to
+    call from the pipeline worker threads.
+
+    Nothing is written before flush(): the items carry the content
+    fingerprints that make later runs skip a workout as unchanged, so they
+    must only land once the workout's S3 data (period Parquet files, raw
+    archives) is stored. Call flush() after those writers flushed.
+    """
+
+    def __init__(self, dynamodb, table_name: str):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.batches_written = 0
+        self.items_written = 0
+        self.max_index = None
+        # Keyed by the item index: a batch must not hold the same key twice.
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, item: dict) -> None:
+        """
+        Buffers an item until flush().
+        Args:
+            item (dict): The item in DynamoDB attribute-value format.
+        """
+        index = item["index"]["S"]
+        with self._lock:
+            self._pending[index] = item
+            if self.max_index is None or int(index) > self.max_index:
+                self.max_index = int(index)
+
+    def flush(self) -> None:
+        """
+        Writes the pending items, BATCH_WRITE_SIZE per batch_write_item call.
+        """
+        with self._lock:
+            items = list(self._pending.values())
+            self._pending = {}
+        for start in range(0, len(items), BATCH_WRITE_SIZE):
+            self._write_batch(items[start : start + BATCH_WRITE_SIZE])
+
+    def _write_batch(self, items: list[dict]) -> None:
+        requests = [{"PutRequest": {"Item": item}} for item in items]
+        for attempt in range(MAX_BATCH_ATTEMPTS):
+            response = self.dynamodb.batch_write_item(
+                RequestItems={self.table_name: requests}
+            )
+            requests = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            if not requests:
+                with self._lock:
+                    self.batches_written += 1
+                    self.items_written += len(items)
+                return
+            time.sleep(backoff_delay(attempt))
+        raise RuntimeError(
+            f"{len(requests)} items still unprocessed after "
+            f"{MAX_BATCH_ATTEMPTS} batch_write_item attempts"
+        )
+
+
+def read_high_water_mark(dynamodb, table_name: str) -> int | None:
+    """
+    Reads the highest workout index recorded so far.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+    Returns:
+        int | None: The index, None if no workout was recorded yet.
+    """
+    response = dynamodb.get_item(
+        TableName=table_name,
+        Key={"index": {"S": HIGH_WATER_MARK_KEY}},
+        ConsistentRead=True,
+    )
+    value = response.get("Item", {}).get("latest_index")
+    return int(value["N"]) if value else None
+
+
+def advance_high_water_mark(
+    dynamodb, table_name: str, index: int, fencing_token: int | None = None
+) -> int:
+    """
+    Raises the high-water mark to index unless it is already at least that
+    high. A single conditional update, so concurrent writers never move it
+    backwards.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        index (int): The highest workout index just written.
+        fencing_token (int, optional): The token of the lease the write was
+            made under (see lease.py); the update is refused once a holder
+            with a higher token has written.
+    Returns:
+        int: The high-water mark after the update.
+    Raises:
+        LeaseLost: The update was refused for a higher token, so the caller
+            must not publish anything further either.
+    """
+    condition = "(attribute_not_exists(latest_index) OR latest_index < :index)"
+    update = "SET latest_index = :index"
+    values = {":index": {"N": str(index)}}
+    if fencing_token is not None:
+        condition += (
+            " AND (attribute_not_exists(fencing_token) OR fencing_token <= :token)"
+        )
+        update += ", fencing_token = :token"
+        values[":token"] = {"N": str(fencing_token)}
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key={"index": {"S": HIGH_WATER_MARK_KEY}},
+            UpdateExpression=update,
+            ConditionExpression=condition,
+            ExpressionAttributeValues=values,
+        )
+        return index
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
+    item = dynamodb.get_item(
+        TableName=table_name,
+        Key={"index": {"S": HIGH_WATER_MARK_KEY}},
+        ConsistentRead=True,
+    ).get("Item", {})
+    if fencing_token is not None and "fencing_token" in item:
+        if int(item["fencing_token"]["N"]) > fencing_token:
+            raise LeaseLost(
+                f"Fencing token {fencing_token} is stale, "
+                f"{item['fencing_token']['N']} has written since."
+            )
+    return int(item["latest_index"]["N"])
+
+
+def publish_latest_workout_index(ssm, index: int) -> None:
+    """
+    Mirrors the high-water mark to SSM Parameter Store.
+    Args:
+        ssm: The SSM client.
+        index (int): The high-water mark.
+    """
+    ssm.put_parameter(
+        Name=LATEST_WORKOUT_INDEX_PARAMETER,
+        Value=str(index),
+        Type="String",
+        Overwrite=True,
+    )
+
+
+def publish_data_version(ssm, latest_index: int | None) -> str:
+    """
+    Moves the data version on after workouts were stored. Unlike the
+    high-water mark it also changes when only existing workouts changed.
+    Args:
+        ssm: The SSM client.
+        latest_index (int | None): The high-water mark after the ingestion.
+    Returns:
+        str: The new data version.
+    """
+    version = f"{latest_index}-{int(time.time() * 1000)}"
+    ssm.put_parameter(
+        Name=DATA_VERSION_PARAMETER,
+        Value=version,
+        Type="String",
+        Overwrite=True,
+    )
+    return version
+
+
+def read_workout_items(
+    dynamodb, table_name: str, indexes: list[int], attributes: tuple[str, ...]
+) -> dict[int, dict]:
+    """
+    Reads some attributes of many workout items with batch_get_item,
+    retrying unprocessed keys with backoff.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        indexes (list[int]): The workout indexes to look up.
+        attributes (tuple[str, ...]): The attributes to read besides index.
+    Returns:
+        dict[int, dict]: Workout index -> item, for the workouts that exist.
+    """
+    names = {f"#a{i}": name for i, name in enumerate(("index",) + attributes)}
+    items = {}
+    unique = sorted(set(indexes))
+    for start in range(0, len(unique), BATCH_GET_SIZE):
+        request = {
+            table_name: {
+                "Keys": [
+                    {"index": {"S": str(index)}}
+                    for index in unique[start : start + BATCH_GET_SIZE]
+                ],
+                "ProjectionExpression": ", ".join(names),
+                "ExpressionAttributeNames": names,
+            }
+        }
+        for attempt in range(MAX_BATCH_ATTEMPTS):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get("Responses", {}).get(table_name, []):
+                items[int(item["index"]["S"])] = item
+            request = response.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            time.sleep(backoff_delay(attempt))
+        else:
+            raise RuntimeError(
+                f"Keys still unprocessed after {MAX_BATCH_ATTEMPTS} "
+                "batch_get_item attempts"
+            )
+    return items
+
+
+def read_fingerprints(dynamodb, table_name: str, indexes: list[int]) -> dict:
+    """
+    Reads the content fingerprints stored on workout items.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        indexes (list[int]): The workout indexes to look up.
+    Returns:
+        dict: Workout index -> fingerprint, for the items that have one.
+    """
+    items = read_workout_items(dynamodb, table_name, indexes, ("fingerprint",))
+    return {
+        index: item["fingerprint"]["S"]
+        for index, item in items.items()
+        if "fingerprint" in item
+    }
+
+
+def read_backfill_cursor(
+    dynamodb, table_name: str, key: str = BACKFILL_CURSOR_KEY
+) -> int | None:
+    """
+    Reads the index the interrupted backfill should resume at.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        key (str): The cursor item, e.g. the one of a fan-out shard.
+    Returns:
+        int | None: The next workout index, None if no backfill is pending.
+    """
+    response = dynamodb.get_item(
+        TableName=table_name,
+        Key={"index": {"S": key}},
+        ConsistentRead=True,
+    )
+    value = response.get("Item", {}).get("next_index")
+    return int(value["N"]) if value else None
+
+
+def save_backfill_cursor(
+    dynamodb, table_name: str, next_index: int, key: str = BACKFILL_CURSOR_KEY
+) -> None:
+    """
+    Records that every workout below next_index is stored.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        next_index (int): The first workout index still to process.
+        key (str): The cursor item.
+    """
+    dynamodb.put_item(
+        TableName=table_name,
+        Item={
+            "index": {"S": key},
+            "next_index": {"N": str(next_index)},
+            "updated_at": {"S": datetime.now(timezone.utc).isoformat()},
+        },
+    )
+
+
+def clear_backfill_cursor(
+    dynamodb, table_name: str, key: str = BACKFILL_CURSOR_KEY
+) -> None:
+    """
+    Removes the cursor once a backfill has completed.
+    Args:
+        dynamodb: The DynamoDB client.
+        table_name (str): The workouts metadata table.
+        key (str): The cursor item.
+    """
+    dynamodb.delete_item(TableName=table_name, Key={"index": {"S": key}})
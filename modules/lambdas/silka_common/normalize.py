@@ -0,0 +1,284 @@
+"""
+Star-schema normalization of raw Hevy workouts.
+
+normalize_workout_star_schema() turns one workout into row dicts.
+StarSchemaColumns does the same for many workouts at once and keeps the rows
+column by column, which is what the Arrow builder consumes. Hevy objects of a
+given kind almost always carry the same keys in the same order, so the kept
+keys (and an itemgetter over them) are computed once per distinct key tuple
+instead of filtering every key of every row.
+"""
+
+from functools import lru_cache
+from operator import itemgetter
+from typing import Iterable
+
+import pyarrow as pa
+
+from .arrow_schemas import build_arrow_table_from_columns
+from .table_locations import STAR_SCHEMA_TABLES
+
+# Fields of the raw payloads that are not stored in the star schema.
+DISCARD_WORKOUT = frozenset(
+    {
+        "media",
+        "user_id",
+        "username",
+        "comments",
+        "short_id",
+        "verified",
+        "image_urls",
+        "description",
+        "like_images",
+        "profile_image",
+        "is_liked_by_user",
+        "apple_watch",
+        "wearos_watch",
+        "is_private",
+        "like_count",
+        "preview_workout_likes",
+    }
+)
+DISCARD_EXERCISE = frozenset(
+    {
+        "url",
+        "notes",
+        "de_title",
+        "es_title",
+        "fr_title",
+        "it_title",
+        "ja_title",
+        "ko_title",
+        "pt_title",
+        "ru_title",
+        "tr_title",
+        "media_type",
+        "other_muscles",
+        "prs",
+        "personalRecords",
+        "superset_id",
+        "zh_cn_title",
+        "zh_tw_title",
+        "thumbnail_url",
+        "custom_exercise_image_url",
+        "custom_exercise_image_thumbnail_url",
+        "volume_doubling_enabled",
+    }
+)
+DISCARD_SET = frozenset(
+    {
+        "prs",
+        "personalRecords",
+        "custom_metric",
+        "completed_at",
+    }
+)
+
+
+def normalize_workout_star_schema(workout):
+    # Workout table: one row per workout
+    workout_row = {
+        k: v
+        for k, v in workout.items()
+        if k != "exercises" and k not in DISCARD_WORKOUT
+    }
+    workouts = [workout_row]
+
+    exercises = []
+    sets = []
+
+    for exercise in workout.get("exercises", []):
+        exercise_id = exercise.get("id")
+        # Exercise table: one row per exercise, with workout_id as FK
+        exercise_row = {
+            k: v
+            for k, v in exercise.items()
+            if k != "sets"
+            and not (k.endswith("title") and k != "title")
+            and k not in DISCARD_EXERCISE
+        }
+        exercise_row["workout_id"] = workout["id"]
+        exercises.append(exercise_row)
+
+        for s in exercise.get("sets", []):
+            set_row = {k: v for k, v in s.items() if k not in DISCARD_SET}
+            set_row["exercise_id"] = exercise_id
+            set_row["workout_id"] = workout["id"]
+            sets.append(set_row)
+
+    return workouts, exercises, sets
+
+
+def _keep_workout_key(key: str) -> bool:
+    return key != "exercises" and key not in DISCARD_WORKOUT
+
+
+def _keep_exercise_key(key: str) -> bool:
+    return (
+        key != "sets"
+        and not (key.endswith("title") and key != "title")
+        and key not in DISCARD_EXERCISE
+        and key != "workout_id"
+    )
+
+
+def _keep_set_key(key: str) -> bool:
+    return key not in DISCARD_SET and key not in ("exercise_id", "workout_id")
+
+
+_KEY_FILTERS = {
+    "workout": _keep_workout_key,
+    "exercise": _keep_exercise_key,
+    "set": _keep_set_key,
+}
+
+
+@lru_cache(maxsize=1024)
+def kept_keys(table: str, keys: tuple[str, ...]) -> tuple[str, ...]:
+    """
+    Filters the keys of a raw Hevy object down to the star-schema columns.
+    Cached per key tuple, so the filter runs once per payload shape.
+    Args:
+        table (str): One of "workout", "exercise" or "set".
+        keys (tuple[str, ...]): The keys of the raw object, in order.
+    Returns:
+        tuple[str, ...]: The kept keys, foreign keys excluded.
+    """
+    keep_key = _KEY_FILTERS[table]
+    return tuple(key for key in keys if keep_key(key))
+
+
+def _value_getter(keys: tuple[str, ...]):
+    # itemgetter returns a bare value for one key and needs at least one.
+    if not keys:
+        return lambda source: ()
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda source: (source[key],)
+    return itemgetter(*keys)
+
+
+class ColumnBuffer:
+    """
+    The rows of one star-schema table, collected for a columnar build.
+
+    Rows are appended as value tuples pulled with a precomputed itemgetter,
+    grouped in runs of objects sharing the same keys, and transposed into
+    one list per column by columns(). A column that only some rows carry is
+    padded with None for the others.
+    """
+
+    def __init__(self, table: str, foreign_keys: tuple[str, ...] = ()):
+        self.num_rows = 0
+        self._table = table
+        self._foreign_keys = foreign_keys
+        # Runs of rows read with the same keys: (column names, value tuples).
+        self._runs = []
+        self._run_keys = None
+        self._getter = None
+        self._rows = None
+
+    def append(self, source: dict, *foreign_values) -> None:
+        """
+        Appends one row.
+        Args:
+            source (dict): The raw Hevy object; its kept keys become columns.
+            *foreign_values: The values of the foreign-key columns, in the
+                order given to the constructor.
+        """
+        keys = tuple(source)
+        if keys != self._run_keys:
+            kept = kept_keys(self._table, keys)
+            self._run_keys = keys
+            self._getter = _value_getter(kept)
+            self._rows = []
+            self._runs.append((kept + self._foreign_keys, self._rows))
+        self._rows.append(self._getter(source) + foreign_values)
+        self.num_rows += 1
+
+    def columns(self) -> dict[str, list]:
+        """
+        Transposes the buffered rows.
+        Returns:
+            dict[str, list]: The values of each column, num_rows long.
+        """
+        columns = {}
+        filled = 0
+        for names, rows in self._runs:
+            for name, values in zip(names, zip(*rows)):
+                column = columns.get(name)
+                if column is None:
+                    column = columns[name] = [None] * filled
+                column.extend(values)
+            filled += len(rows)
+            for column in columns.values():
+                if len(column) < filled:
+                    column.extend([None] * (filled - len(column)))
+        return columns
+
+
+class StarSchemaColumns:
+    """
+    Columnar buffers of the workout, exercise and set tables for a batch of
+    workouts, filled in one pass over the raw payloads.
+    """
+
+    def __init__(self):
+        self.workout = ColumnBuffer("workout")
+        self.exercise = ColumnBuffer("exercise", ("workout_id",))
+        self.set = ColumnBuffer("set", ("exercise_id", "workout_id"))
+        self.workout_ids: list[str] = []
+
+    def add(self, workout: dict) -> None:
+        """
+        Appends the rows of one raw Hevy workout.
+        Args:
+            workout (dict): The raw workout.
+        """
+        workout_id = workout["id"]
+        self.workout_ids.append(workout_id)
+        self.workout.append(workout)
+        exercise_buffer = self.exercise
+        set_buffer = self.set
+        for exercise in workout.get("exercises", []):
+            exercise_buffer.append(exercise, workout_id)
+            exercise_id = exercise.get("id")
+            for s in exercise.get("sets", []):
+                set_buffer.append(s, exercise_id, workout_id)
+
+    def buffer(self, table: str) -> ColumnBuffer:
+        """
+        Returns the buffer of a star-schema table.
+        Args:
+            table (str): One of "workout", "exercise" or "set".
+        Returns:
+            ColumnBuffer: The buffer.
+        """
+        return getattr(self, table)
+
+    def to_arrow(self) -> dict[str, pa.Table]:
+        """
+        Builds the typed Arrow tables of the batch.
+        Returns:
+            dict[str, pa.Table]: One table per star-schema table.
+        """
+        return {
+            table: build_arrow_table_from_columns(
+                self.buffer(table).columns(), self.buffer(table).num_rows, table
+            )
+            for table in STAR_SCHEMA_TABLES
+        }
+
+
+def normalize_workouts_columnar(workouts: Iterable[dict]) -> StarSchemaColumns:
+    """
+    Normalizes many raw Hevy workouts into columnar star-schema buffers.
+    Args:
+        workouts (Iterable[dict]): Raw workouts; may be a generator.
+    Returns:
+        StarSchemaColumns: The buffers of the three tables.
+    """
+    batch = StarSchemaColumns()
+    for workout in workouts:
+        batch.add(workout)
+    return batch
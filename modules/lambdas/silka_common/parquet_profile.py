@@ -0,0 +1,177 @@
+"""
+Named storage profiles for the star-schema Parquet files.
+
+A profile fixes how every Parquet writer (per-workout files, the batch
+writer's period files, compaction and reprocessing) lays a table out: the
+compression codec, which columns are dictionary encoded, the order the rows
+are sorted in before writing and the row-group size. Sorting matters for
+Athena: it skips row groups and files whose min/max statistics cannot match
+a predicate, and those statistics are only narrow when rows with close
+values are stored together.
+
+The profile is picked by the PARQUET_PROFILE environment variable:
+
+- "athena" (default): zstd, dictionaries only for repeated values, rows
+  sorted by start time, template and workout, sorting recorded in the file.
+- "legacy": pyarrow's defaults, the layout written before profiles existed.
+
+Files written under different profiles read the same; switching profiles
+takes effect for the files written from then on, and `make
+reprocess-parquet` rewrites the history under the active one.
+"""
+
+import io
+import os
+from dataclasses import dataclass, field
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Profile used when PARQUET_PROFILE is not set.
+DEFAULT_PROFILE = "athena"
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """
+    How the Parquet files of the star-schema tables are written.
+    Attributes:
+        name (str): The profile name.
+        compression (str): The codec, e.g. "snappy" or "zstd".
+        compression_level (int | None): The codec level, its default if None.
+        dictionary_columns (dict[str, tuple[str, ...]] | None): Columns to
+            dictionary encode per table; None encodes every column.
+        sort_keys (dict[str, tuple[str, ...]]): Columns the rows of each
+            table are sorted by, ascending; tables not listed keep their order.
+        row_group_rows (int | None): Rows per row group, pyarrow's default
+            if None.
+        write_statistics (bool): Whether min/max statistics are written.
+    """
+
+    name: str
+    compression: str = "snappy"
+    compression_level: int | None = None
+    dictionary_columns: dict[str, tuple[str, ...]] | None = None
+    sort_keys: dict[str, tuple[str, ...]] = field(default_factory=dict)
+    row_group_rows: int | None = None
+    write_statistics: bool = True
+
+    def sort(self, arrow_table: pa.Table, table: str | None) -> pa.Table:
+        """
+        Sorts the rows of a table by the profile's sort keys.
+        Args:
+            arrow_table (pa.Table): The rows to write.
+            table (str | None): The star-schema table, e.g. "set".
+        Returns:
+            pa.Table: The sorted rows; unchanged without sort keys.
+        """
+        keys = self._sort_keys(arrow_table, table)
+        if not keys or arrow_table.num_rows < 2:
+            return arrow_table
+        return arrow_table.sort_by([(key, "ascending") for key in keys])
+
+    def write_options(self, arrow_table: pa.Table, table: str | None) -> dict:
+        """
+        Builds the pq.write_table() keyword arguments for a table.
+        Args:
+            arrow_table (pa.Table): The rows to write, already sorted.
+            table (str | None): The star-schema table, e.g. "set".
+        Returns:
+            dict: The keyword arguments.
+        """
+        options = {
+            "compression": self.compression,
+            "compression_level": self.compression_level,
+            "write_statistics": self.write_statistics,
+            "row_group_size": self.row_group_rows,
+        }
+        if self.dictionary_columns is not None:
+            columns = self.dictionary_columns.get(table, ())
+            options["use_dictionary"] = [
+                column for column in columns if column in arrow_table.column_names
+            ]
+        keys = self._sort_keys(arrow_table, table)
+        if keys:
+            options["sorting_columns"] = [
+                pq.SortingColumn(arrow_table.column_names.index(key)) for key in keys
+            ]
+        return options
+
+    def _sort_keys(self, arrow_table: pa.Table, table: str | None) -> list[str]:
+        # Files written before a column existed may lack it; sort by a prefix.
+        keys = []
+        for key in self.sort_keys.get(table, ()):
+            if key not in arrow_table.column_names:
+                break
+            keys.append(key)
+        return keys
+
+
+PROFILES = {
+    "legacy": StorageProfile(name="legacy"),
+    "athena": StorageProfile(
+        name="athena",
+        compression="zstd",
+        compression_level=3,
+        # Ids that are unique per row only grow a dictionary that pyarrow
+        # then abandons; values that repeat within a file are encoded.
+        dictionary_columns={
+            "workout": ("name", "routine_id"),
+            "exercise": (
+                "title",
+                "workout_id",
+                "exercise_type",
+                "equipment_category",
+                "exercise_template_id",
+                "muscle_group",
+            ),
+            "set": ("indicator", "workout_id", "exercise_id"),
+        },
+        sort_keys={
+            "workout": ("start_time",),
+            "exercise": ("exercise_template_id", "workout_id", "index"),
+            "set": ("workout_id", "exercise_id", "index"),
+        },
+        row_group_rows=128 * 1024,
+    ),
+}
+
+
+def get_profile(name: str | None = None) -> StorageProfile:
+    """
+    Looks up a storage profile.
+    Args:
+        name (str, optional): The profile name; PARQUET_PROFILE, or the
+            default profile, if omitted.
+    Returns:
+        StorageProfile: The profile.
+    """
+    name = name or os.environ.get("PARQUET_PROFILE") or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(
+            f"Unknown Parquet profile {name!r}, expected one of {sorted(PROFILES)}"
+        )
+    return PROFILES[name]
+
+
+def write_parquet(
+    arrow_table: pa.Table,
+    table: str | None = None,
+    profile: StorageProfile | None = None,
+) -> bytes:
+    """
+    Serializes a star-schema table as a Parquet file under a storage profile.
+    Args:
+        arrow_table (pa.Table): The rows to write.
+        table (str, optional): The star-schema table, e.g. "set"; picks the
+            sort keys and dictionary columns.
+        profile (StorageProfile, optional): The profile, the active one if
+            omitted.
+    Returns:
+        bytes: The Parquet file content.
+    """
+    profile = profile or get_profile()
+    arrow_table = profile.sort(arrow_table, table)
+    buffer = io.BytesIO()
+    pq.write_table(arrow_table, buffer, **profile.write_options(arrow_table, table))
+    return buffer.getvalue()
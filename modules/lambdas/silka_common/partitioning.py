@@ -0,0 +1,86 @@
+"""
+Hive-style partitioning of the star-schema tables.
+
+Files live under <table location>/year=YYYY/month=MM/ and the Glue tables
+declare year and month as partition keys resolved through partition
+projection, so Athena prunes to the months a query filters on without any
+partition metadata in the catalog.
+
+Existing tables are migrated by rewriting them into a new, partitioned
+generation and swapping the table location and partition keys together
+(see compaction.py). Run the migration from modules/lambdas before applying
+the Terraform change that declares the partition keys:
+
+    python -m silka_common.partitioning --bucket <bucket> --database <database>
+"""
+
+# Partition keys of the workouts, performed_exercises and sets tables.
+PARTITION_KEYS = [
+    {
+        "Name": "year",
+        "Type": "int",
+        "Comment": "Year the workout started in. Partition column, filter on it to prune",
+    },
+    {
+        "Name": "month",
+        "Type": "int",
+        "Comment": "Month (1-12) the workout started in. Partition column, filter on it to prune",
+    },
+]
+
+# Years covered by partition projection; keep in sync with modules/athena.
+PROJECTION_YEAR_RANGE = "2018,2035"
+
+
+def partition_path(year: str, month: str) -> str:
+    """
+    Builds the Hive-style partition path of a month.
+    Args:
+        year (str): The four-digit year.
+        month (str): The two-digit month.
+    Returns:
+        str: e.g. year=2024/month=05
+    """
+    return f"year={year}/month={month}"
+
+
+def projection_parameters() -> dict[str, str]:
+    """
+    Returns the Glue table parameters enabling partition projection on year
+    and month. Without storage.location.template Athena resolves partitions
+    Hive-style under the table location, which keeps working when the
+    location is swapped to a new generation.
+    """
+    return {
+        "projection.enabled": "true",
+        "projection.year.type": "integer",
+        "projection.year.range": PROJECTION_YEAR_RANGE,
+        "projection.month.type": "integer",
+        "projection.month.range": "1,12",
+        "projection.month.digits": "2",
+    }
+
+
+def is_partitioned(glue_table: dict) -> bool:
+    """
+    Checks whether a Glue table already uses the year/month partitioning.
+    Args:
+        glue_table (dict): The get_table()["Table"] response.
+    Returns:
+        bool: True when the partition keys and projection are in place.
+    """
+    keys = [key["Name"] for key in glue_table.get("PartitionKeys", [])]
+    parameters = glue_table.get("Parameters", {})
+    return keys == ["year", "month"] and parameters.get("projection.enabled") == "true"
+
+
+def main() -> None:
+    from .compaction import main as compaction_main
+
+    # Compaction rewrites any table that is not partitioned yet into a
+    # partitioned generation, so the migration is a compaction run.
+    compaction_main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Staged pipeline with bounded queues between the stages.
+
+Each stage runs in its own pool of worker threads and hands items to the next
+stage through a bounded queue. A slow stage (usually the S3 upload) therefore
+applies backpressure to the stages before it instead of letting work pile up
+in memory, while network I/O for one item overlaps with CPU work on the next.
+"""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+
+# Marker passed down a queue once the upstream stage has no more items.
+_STOP = object()
+
+# How long blocked queue operations wait before re-checking for an abort.
+_POLL_SECONDS = 0.1
+
+
+@dataclass
+class Stage:
+    """
+    A pipeline stage.
+    Attributes:
+        name (str): The stage name, used in stats and thread names.
+        func (Callable): Called once per item. Returning None drops the item.
+        workers (int): The number of threads running the stage.
+        queue_size (int): The capacity of the queue feeding the stage.
+    """
+
+    name: str
+    func: Callable[[Any], Any]
+    workers: int = 1
+    queue_size: int = 8
+
+
+@dataclass
+class StageStats:
+    """
+    Counters collected for a stage while the pipeline runs.
+    """
+
+    processed: int = 0
+    busy_seconds: float = 0.0
+
+
+class Pipeline:
+    """
+    Runs items from a source iterable through a list of stages.
+
+    The source is consumed by its own thread (the "fetch" stage), so a
+    generator that performs network calls overlaps with the downstream work.
+    The first exception raised by any stage stops the pipeline and is
+    re-raised from run().
+    """
+
+    def __init__(self, stages: list[Stage], source_name: str = "fetch"):
+        self.stages = stages
+        self.source_name = source_name
+        self.stats = {source_name: StageStats()}
+        self.stats.update({stage.name: StageStats() for stage in stages})
+        self._abort = threading.Event()
+        self._error = None
+        self._lock = threading.Lock()
+
+    def run(self, source: Iterable) -> list:
+        """
+        Runs the pipeline to completion.
+        Args:
+            source (Iterable): The items fed into the first stage.
+        Returns:
+            list: The non-None results of the last stage, in completion order.
+        """
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        results = []
+        remaining_workers = [stage.workers for stage in self.stages]
+        threads = [
+            threading.Thread(
+                target=self._produce,
+                args=(source, queues[0], self.stages[0].workers),
+                name=f"pipeline-{self.source_name}",
+                daemon=True,
+            )
+        ]
+
+        for position, stage in enumerate(self.stages):
+            is_last = position == len(self.stages) - 1
+            for worker in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=self._work,
+                        args=(
+                            position,
+                            queues[position],
+                            None if is_last else queues[position + 1],
+                            results,
+                            remaining_workers,
+                        ),
+                        name=f"pipeline-{stage.name}-{worker}",
+                        daemon=True,
+                    )
+                )
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+        return results
+
+    def summary(self) -> str:
+        """
+        Formats the per-stage counters collected by the last run.
+        Returns:
+            str: One line per stage with item count and busy time.
+        """
+        return "\n".join(
+            f"{name}: {stats.processed} items, {stats.busy_seconds:.2f}s busy"
+            for name, stats in self.stats.items()
+        )
+
+    def _fail(self, error: BaseException) -> None:
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._abort.set()
+
+    def _put(self, target: queue.Queue, item: Any) -> bool:
+        while not self._abort.is_set():
+            try:
+                target.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue) -> Any:
+        while not self._abort.is_set():
+            try:
+                return source.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _produce(self, source: Iterable, target: queue.Queue, consumers: int):
+        stats = self.stats[self.source_name]
+        try:
+            iterator = iter(source)
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                stats.busy_seconds += time.perf_counter() - started
+                stats.processed += 1
+                if not self._put(target, item):
+                    return
+        except BaseException as e:
+            self._fail(e)
+            return
+
+        for _ in range(consumers):
+            self._put(target, _STOP)
+
+    def _work(self, position, source, target, results, remaining_workers):
+        stage = self.stages[position]
+        stats = self.stats[stage.name]
+        try:
+            while True:
+                item = self._get(source)
+                if item is _STOP:
+                    break
+                started = time.perf_counter()
+                output = stage.func(item)
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    stats.processed += 1
+                    stats.busy_seconds += elapsed
+                if output is None:
+                    continue
+                if target is None:
+                    with self._lock:
+                        results.append(output)
+                elif not self._put(target, output):
+                    return
+        except BaseException as e:
+            self._fail(e)
+            return
+
+        # The last worker of a stage to finish tells the next stage to stop.
+        with self._lock:
+            remaining_workers[position] -= 1
+            last_worker = remaining_workers[position] == 0
+        if last_worker and target is not None:
+            for _ in range(self.stages[position + 1].workers):
+                self._put(target, _STOP)
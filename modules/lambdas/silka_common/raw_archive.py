@@ -0,0 +1,224 @@
+"""
+Monthly, gzip-compressed NDJSON archive of the raw workout payloads.
+
+The per-workout objects under sorted_workouts/ stay the source the Lambdas
+read single workouts from, but scanning them through the JsonSerDe table
+means one small uncompressed object per workout. Ingestion therefore also
+keeps one archive per month, raw_archive/workouts-<yyyymm>.json.gz, holding
+one workout per line ordered by start time, and the raw Glue table reads
+those. Athena decompresses gzip text files by their .gz extension.
+
+An archive is updated with read-merge-write: a workout written again
+replaces its previous line. The write is conditional on the ETag that was
+read, so concurrent writers never drop each other's lines; the loser re-reads
+and retries. Archives whose content did not change are not rewritten.
+
+Existing history is converted from modules/lambdas with:
+
+    python -m silka_common.raw_archive --bucket <bucket> [--start 2024-01-01]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from botocore.exceptions import ClientError
+
+from .aws_clients import get_client
+from .workouts import workout_date_parts
+
+# Prefix of the archives; the raw Glue table location.
+RAW_ARCHIVE_PREFIX = "raw_archive"
+
+# How many times an archive is re-read and merged after losing a race.
+MAX_WRITE_ATTEMPTS = 5
+
+
+def archive_key(period: tuple[str, str]) -> str:
+    """
+    Builds the S3 key of a monthly archive.
+    Args:
+        period (tuple[str, str]): The zero-padded year and month.
+    Returns:
+        str: e.g. raw_archive/workouts-202405.json.gz.
+    """
+    return f"{RAW_ARCHIVE_PREFIX}/workouts-{''.join(period)}.json.gz"
+
+
+def encode_archive(workouts: list[dict]) -> bytes:
+    """
+    Serializes workouts as gzip-compressed NDJSON, ordered by start time.
+    The gzip header carries no timestamp, so equal content gives equal bytes.
+    Args:
+        workouts (list[dict]): Raw Hevy workouts.
+    Returns:
+        bytes: The archive body.
+    """
+    ordered = sorted(workouts, key=lambda w: (w["start_time"], w["id"]))
+    lines = "".join(json.dumps(workout) + "\n" for workout in ordered)
+    return gzip.compress(lines.encode("UTF-8"), mtime=0)
+
+
+def decode_archive(body: bytes) -> list[dict]:
+    """
+    Parses an archive body.
+    Args:
+        body (bytes): The gzip-compressed NDJSON.
+    Returns:
+        list[dict]: The workouts.
+    """
+    text = gzip.decompress(body).decode("UTF-8")
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+class RawArchiveWriter:
+    """
+    Buffers workouts per month and merges them into the monthly archives on
+    flush(). Safe to call add() and remove() from the pipeline threads.
+    """
+
+    def __init__(self, s3, bucket_name: str, max_workers: int = 4):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.max_workers = max_workers
+        self._added = defaultdict(dict)
+        self._removed = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def add(self, workout: dict) -> None:
+        """
+        Buffers a workout; its line replaces any previous one.
+        Args:
+            workout (dict): The raw Hevy workout.
+        """
+        period = workout_date_parts(workout)[:2]
+        with self._lock:
+            self._added[period][workout["id"]] = workout
+
+    def remove(self, workout: dict) -> None:
+        """
+        Buffers the removal of a workout's line from the month it was stored
+        under, e.g. before its start time was edited.
+        Args:
+            workout (dict): The workout as it was stored; only its id and
+                start_time are used.
+        """
+        period = workout_date_parts(workout)[:2]
+        with self._lock:
+            self._removed[period].add(workout["id"])
+
+    def flush(self) -> list[str]:
+        """
+        Merges every buffered month into its archive.
+        Returns:
+            list[str]: The keys of the archives rewritten.
+        """
+        with self._lock:
+            added = dict(self._added)
+            removed = dict(self._removed)
+            self._added.clear()
+            self._removed.clear()
+
+        writes = [
+            (period, added.get(period, {}), removed.get(period, set()))
+            for period in sorted(set(added) | set(removed))
+        ]
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            written = list(executor.map(lambda args: self._write_month(*args), writes))
+        return [key for key in written if key]
+
+    def _write_month(self, period, added: dict, removed: set) -> str | None:
+        key = archive_key(period)
+        for attempt in range(MAX_WRITE_ATTEMPTS):
+            body, etag = self._read(key)
+            workouts = {w["id"]: w for w in decode_archive(body)} if body else {}
+            for workout_id in removed:
+                workouts.pop(workout_id, None)
+            workouts.update(added)
+            merged = encode_archive(list(workouts.values()))
+            if merged == body or (body is None and not workouts):
+                return None
+            conditions = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+            try:
+                self.s3.put_object(
+                    Bucket=self.bucket_name,
+                    Key=key,
+                    Body=merged,
+                    **conditions,
+                )
+                return key
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                    raise
+                print(f"Concurrent update of {key}, retrying ({attempt + 1}).")
+        raise RuntimeError(
+            f"Could not update {key} after {MAX_WRITE_ATTEMPTS} attempts"
+        )
+
+    def _read(self, key: str) -> tuple[bytes | None, str | None]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None, None
+            raise
+        return response["Body"].read(), response["ETag"]
+
+
+def convert_history(
+    bucket: str, start: date | None = None, end: date | None = None
+) -> dict:
+    """
+    Builds the monthly archives from the per-workout JSON objects, one month
+    at a time. Safe to re-run: unchanged archives are not rewritten.
+    Args:
+        bucket (str): The data bucket.
+        start (date, optional): The first day, the whole history if omitted.
+        end (date, optional): The last day.
+    Returns:
+        dict: workouts read and archives written.
+    """
+    # Imported here: reprocess pulls in the Parquet writer.
+    from .reprocess import list_raw_keys
+
+    s3 = get_client("s3")
+    writer = RawArchiveWriter(s3, bucket)
+    report = {"workouts": 0, "archives": 0}
+
+    def read(key: str) -> dict:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for (year, month), keys in sorted(
+            list_raw_keys(s3, bucket, start, end).items()
+        ):
+            for workout in executor.map(read, keys):
+                writer.add(workout)
+            written = writer.flush()
+            report["workouts"] += len(keys)
+            report["archives"] += len(written)
+            print(f"{year:04d}-{month:02d}: {len(keys)} workouts")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bucket", default=os.environ.get("BUCKET_NAME"))
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    args = parser.parse_args()
+    report = convert_history(args.bucket, args.start, args.end)
+    print(
+        f"{report['workouts']} workouts archived, "
+        f"{report['archives']} monthly archives written."
+    )
+
+
+if __name__ == "__main__":
+    main()
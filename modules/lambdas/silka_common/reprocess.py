@@ -0,0 +1,221 @@
+"""
+Rebuilds the star-schema Parquet tables from the raw JSON archive.
+
+Every workout's payload is kept under sorted_workouts/<y>/<m>/<d>/<id>.json,
+so a change to the normalizer, the Arrow schemas or the discard lists can be
+rolled out by re-deriving the Parquet files from there instead of fetching
+the history from Hevy again. The archive is listed (only the months of the
+requested date range), and every month is re-derived by a worker of a
+process pool: normalization and Parquet encoding are CPU bound, so processes
+rather than threads. A month is handled by one worker and written through
+BatchParquetWriter, which replaces the rows of the reprocessed workouts in
+the period files (and removes their per-workout files), so the result is
+the same compacted layout whatever the table held before.
+
+Process pools need /dev/shm, which Lambda does not provide, so this runs
+locally, from modules/lambdas:
+
+    python -m silka_common.reprocess --bucket <bucket> --database <database> \
+        [--start 2024-01-01] [--end 2024-06-30] [--workers 8] [--dry-run]
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date
+
+from .aws_clients import get_client, reset_clients
+from .batch_writer import BatchParquetWriter
+from .table_locations import refresh_table_prefixes
+
+# Root of the raw JSON archive.
+RAW_PREFIX = "sorted_workouts"
+
+# Threads reading raw objects inside each worker process.
+READ_THREADS = 8
+
+
+def month_prefixes(start: date | None, end: date | None) -> list[str]:
+    """
+    Lists the archive prefixes to scan for a date range.
+    Args:
+        start (date | None): The first day, None for the whole archive.
+        end (date | None): The last day, None for up to today.
+    Returns:
+        list[str]: One prefix per month, or the archive root without a start.
+    """
+    if start is None:
+        return [f"{RAW_PREFIX}/"]
+    end = end or date.today()
+    prefixes = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        prefixes.append(f"{RAW_PREFIX}/{year:04d}/{month:02d}/")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return prefixes
+
+
+def key_date(key: str) -> date | None:
+    """
+    Parses the workout day from a raw archive key.
+    Args:
+        key (str): e.g. sorted_workouts/2024/05/17/<id>.json.
+    Returns:
+        date | None: The day, None for keys outside the layout.
+    """
+    parts = key.split("/")
+    if len(parts) != 5 or not key.endswith(".json"):
+        return None
+    try:
+        return date(int(parts[1]), int(parts[2]), int(parts[3]))
+    except ValueError:
+        return None
+
+
+def list_raw_keys(
+    s3, bucket: str, start: date | None = None, end: date | None = None
+) -> dict[tuple[int, int], list[str]]:
+    """
+    Lists the raw workout JSON keys in a date range, grouped by month.
+    Args:
+        s3: The S3 client.
+        bucket (str): The data bucket.
+        start (date, optional): The first day to include.
+        end (date, optional): The last day to include.
+    Returns:
+        dict[tuple[int, int], list[str]]: (year, month) -> keys.
+    """
+    months = defaultdict(list)
+    paginator = s3.get_paginator("list_objects_v2")
+    for prefix in month_prefixes(start, end):
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                day = key_date(obj["Key"])
+                if day is None:
+                    continue
+                if (start and day < start) or (end and day > end):
+                    continue
+                months[(day.year, day.month)].append(obj["Key"])
+    return dict(months)
+
+
+def _init_worker(database: str | None) -> None:
+    # Clients inherited from the parent must not be shared across processes.
+    reset_clients()
+    refresh_table_prefixes(database)
+
+
+def reprocess_month(bucket: str, keys: list[str], layout: str) -> dict:
+    """
+    Re-derives the Parquet rows of the workouts of one month. Runs in a
+    worker process.
+    Args:
+        bucket (str): The data bucket.
+        keys (list[str]): The raw JSON keys of the month.
+        layout (str): "daily" or "monthly".
+    Returns:
+        dict: The number of workouts read and Parquet files written.
+    """
+    s3 = get_client("s3")
+
+    def read(key: str) -> dict:
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+        return json.loads(body)
+
+    with ThreadPoolExecutor(max_workers=READ_THREADS) as executor:
+        workouts = list(executor.map(read, keys))
+
+    writer = BatchParquetWriter(s3, bucket, layout)
+    for workout in workouts:
+        writer.add(workout)
+    return {"workouts": len(workouts), "files": len(writer.flush())}
+
+
+def reprocess(
+    bucket: str,
+    database: str | None = None,
+    start: date | None = None,
+    end: date | None = None,
+    layout: str = "monthly",
+    workers: int | None = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Rebuilds the Parquet rows of every archived workout in a date range.
+    Args:
+        bucket (str): The data bucket.
+        database (str, optional): The Glue database the table locations are
+            read from.
+        start (date, optional): The first day, the whole archive if omitted.
+        end (date, optional): The last day.
+        layout (str): "daily" or "monthly" period files.
+        workers (int, optional): Worker processes, the CPU count by default.
+        dry_run (bool): Only list what would be reprocessed.
+    Returns:
+        dict: months, workouts and files counts.
+    """
+    months = list_raw_keys(get_client("s3"), bucket, start, end)
+    report = {
+        "months": len(months),
+        "workouts": sum(len(keys) for keys in months.values()),
+        "files": 0,
+    }
+    if dry_run or not months:
+        return report
+
+    report["workouts"] = 0
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(database,),
+    ) as executor:
+        futures = {
+            executor.submit(reprocess_month, bucket, keys, layout): month
+            for month, keys in sorted(months.items())
+        }
+        for future in as_completed(futures):
+            year, month = futures[future]
+            result = future.result()
+            report["workouts"] += result["workouts"]
+            report["files"] += result["files"]
+            print(
+                f"{year:04d}-{month:02d}: {result['workouts']} workouts, "
+                f"{result['files']} files"
+            )
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bucket", default=os.environ.get("BUCKET_NAME"))
+    parser.add_argument("--database", default=os.environ.get("ATHENA_DATABASE"))
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    parser.add_argument(
+        "--layout",
+        choices=("daily", "monthly"),
+        default=("daily" if os.environ.get("PARQUET_LAYOUT") == "daily" else "monthly"),
+    )
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    report = reprocess(
+        args.bucket,
+        args.database,
+        args.start,
+        args.end,
+        args.layout,
+        args.workers,
+        args.dry_run,
+    )
+    verb = "would be reprocessed" if args.dry_run else "reprocessed"
+    print(
+        f"{report['workouts']} workouts in {report['months']} months {verb}, "
+        f"{report['files']} Parquet files written."
+    )
+
+
+if __name__ == "__main__":
+    main()
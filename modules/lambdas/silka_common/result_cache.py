@@ -0,0 +1,247 @@
+"""
+A cache of Athena query results in front of execute_athena_query.
+
+The agent often asks the same question twice, and every Athena query pays
+queueing, execution and scan cost although the data only changes when
+workouts are ingested. Results are cached under
+
+    <prefix>/<data version>/<fingerprint>.json.gz
+
+where the fingerprint hashes the SQL after normalization (comments and
+whitespace removed, lower case outside quotes, see sql_metadata.py) and
+the row cap, and the version (cache_version) is the SSM
+DATA_VERSION_PARAMETER that every ingestion moves on (see metadata.py)
+followed by the UTC date. A new version therefore invalidates every entry
+at once: nothing is deleted, the old keys are simply never read again and
+the bucket's lifecycle rule on the prefix expires them. The date makes
+entries expire at midnight, since views such as staleness count days up to
+current_date; queries that call current_date, now() and the like
+themselves are not cached at all (see sql_metadata.is_volatile).
+
+A warm Lambda also keeps recent entries in memory, bounded by
+MEMORY_CACHE_BYTES and evicted least recently used first. Results over
+MAX_ENTRY_BYTES are not cached. Hits, misses and stores are counted and
+logged in CloudWatch embedded metric format, so they show up as metrics
+without any PutMetricData calls.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from .metadata import DATA_VERSION_PARAMETER, LATEST_WORKOUT_INDEX_PARAMETER
+from .sql_metadata import normalize_sql
+
+# Key prefix of the cached results in the Athena results bucket; the
+# bucket's lifecycle rule expires objects under it.
+CACHE_PREFIX = "result-cache"
+
+# Largest compressed result that is cached.
+MAX_ENTRY_BYTES = 4 * 2**20
+
+# Compressed bytes of results kept in memory by a warm Lambda.
+MEMORY_CACHE_BYTES = 32 * 2**20
+
+# CloudWatch namespace of the cache metrics.
+METRICS_NAMESPACE = "Silka/ResultCache"
+
+
+def fingerprint(query: str, max_rows: int | None = None) -> str:
+    """
+    Returns:
+        str: The hash of the normalized query and the row cap.
+    """
+    key = f"{normalize_sql(query)}\n{max_rows}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def read_data_version(ssm) -> str:
+    """
+    Reads the data version, falling back to the latest workout index
+    before the first ingestion published a version.
+    Args:
+        ssm: The SSM client.
+    Returns:
+        str: The data version.
+    """
+    for name in (DATA_VERSION_PARAMETER, LATEST_WORKOUT_INDEX_PARAMETER):
+        try:
+            return ssm.get_parameter(Name=name)["Parameter"]["Value"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ParameterNotFound":
+                raise
+    return "none"
+
+
+def cache_version(ssm, today: date | None = None) -> str:
+    """
+    Returns:
+        str: The version results are cached under: the data version and the
+            UTC date (today, by default the current one).
+    """
+    today = today or datetime.now(timezone.utc).date()
+    return f"{read_data_version(ssm)}/{today.isoformat()}"
+
+
+class ResultCache:
+    """
+    Query results in S3 with an in-memory LRU in front. Safe to share
+    between threads.
+    """
+
+    def __init__(
+        self,
+        s3,
+        bucket: str,
+        prefix: str = CACHE_PREFIX,
+        max_entry_bytes: int = MAX_ENTRY_BYTES,
+        memory_bytes: int = MEMORY_CACHE_BYTES,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_entry_bytes = max_entry_bytes
+        self.memory_bytes = memory_bytes
+        self.stats = {
+            "hits_memory": 0,
+            "hits_s3": 0,
+            "misses": 0,
+            "stores": 0,
+            "too_large": 0,
+            "evictions": 0,
+        }
+        # (version, fingerprint) -> compressed entry, least recent first.
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._logged = {}
+        self._lock = threading.Lock()
+
+    def key(self, version: str, entry_fingerprint: str) -> str:
+        """
+        Returns:
+            str: The S3 key of an entry.
+        """
+        return f"{self.prefix}/{version}/{entry_fingerprint}.json.gz"
+
+    def get(self, query: str, version: str, max_rows: int | None = None):
+        """
+        Looks a result up.
+        Args:
+            query (str): The SQL.
+            version (str): The current data version.
+            max_rows (int, optional): The row cap the result was read with.
+        Returns:
+            dict | None: The cached result, None on a miss.
+        """
+        memory_key = (version, fingerprint(query, max_rows))
+        with self._lock:
+            payload = self._memory.get(memory_key)
+            if payload is not None:
+                self._memory.move_to_end(memory_key)
+                self.stats["hits_memory"] += 1
+                return json.loads(gzip.decompress(payload))
+        try:
+            payload = self.s3.get_object(Bucket=self.bucket, Key=self.key(*memory_key))[
+                "Body"
+            ].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                raise
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits_s3"] += 1
+        self._remember(memory_key, version, payload)
+        return json.loads(gzip.decompress(payload))
+
+    def put(
+        self, query: str, version: str, result: dict, max_rows: int | None = None
+    ) -> bool:
+        """
+        Stores a result, unless it is larger than max_entry_bytes compressed.
+        Args:
+            query (str): The SQL.
+            version (str): The data version the result was computed at.
+            result (dict): The JSON-serializable result.
+            max_rows (int, optional): The row cap the result was read with.
+        Returns:
+            bool: True if stored.
+        """
+        payload = gzip.compress(json.dumps(result).encode("utf-8"))
+        if len(payload) > self.max_entry_bytes:
+            with self._lock:
+                self.stats["too_large"] += 1
+            return False
+        memory_key = (version, fingerprint(query, max_rows))
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=self.key(*memory_key),
+            Body=payload,
+            ContentType="application/gzip",
+        )
+        with self._lock:
+            self.stats["stores"] += 1
+        self._remember(memory_key, version, payload)
+        return True
+
+    def _remember(self, memory_key: tuple, version: str, payload: bytes) -> None:
+        if len(payload) > self.memory_bytes:
+            return
+        with self._lock:
+            # Entries of older data versions can never hit again.
+            for stale in [key for key in self._memory if key[0] != version]:
+                self._drop(stale)
+            if memory_key in self._memory:
+                self._drop(memory_key)
+            self._memory[memory_key] = payload
+            self._memory_size += len(payload)
+            while self._memory_size > self.memory_bytes:
+                self._drop(next(iter(self._memory)))
+                self.stats["evictions"] += 1
+
+    def _drop(self, memory_key: tuple) -> None:
+        self._memory_size -= len(self._memory.pop(memory_key))
+
+    def log_metrics(self, **dimensions) -> None:
+        """
+        Prints the counts since the last call as a CloudWatch embedded
+        metric format record.
+        """
+        with self._lock:
+            since = {
+                name: count - self._logged.get(name, 0)
+                for name, count in self.stats.items()
+            }
+            self._logged = dict(self.stats)
+        metrics = {
+            "Hits": since["hits_memory"] + since["hits_s3"],
+            "Misses": since["misses"],
+            "Stores": since["stores"],
+            "TooLarge": since["too_large"],
+            "Evictions": since["evictions"],
+        }
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [list(dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": "Count"} for name in metrics
+                        ],
+                    }
+                ],
+            },
+            **dimensions,
+            **metrics,
+            "MemoryBytes": self._memory_size,
+        }
+        print(json.dumps(record))
@@ -0,0 +1,194 @@
+"""
+What a SQL query touches: the tables, columns and kind of statement stored
+with every successful agent query in LanceDB (tables_used, columns_used,
+query_type).
+
+The query is parsed with sqlglot's Athena (Trino) dialect and walked scope
+by scope, so CTE names and subquery aliases are not mistaken for tables,
+table aliases and select aliases not for columns, and function names never
+show up as either. A column is attributed to the catalog table it comes
+from; one whose source cannot be told (unqualified, several tables joined)
+still counts as a column.
+
+Agent queries repeat a lot, so the results are memoized in an LRU keyed by
+the normalized SQL (see normalize_sql), the same fingerprint the result
+cache uses. is_volatile() tells the result cache which queries it must not
+serve: those calling current_date, now(), rand() and the like.
+"""
+
+import hashlib
+import re
+from functools import lru_cache
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.scope import Scope, traverse_scope
+
+# sqlglot dialect of Athena engine v3 (Trino).
+DIALECT = "athena"
+
+# Queries whose metadata is kept in memory.
+METADATA_CACHE_SIZE = 1024
+
+# Quoted literals and identifiers, comments, whitespace runs.
+_SQL_TOKENS = re.compile(
+    r"""('(?:[^']|'')*')|("(?:[^"]|"")*")|(--[^\n]*|/\*.*?\*/)|(\s+)""",
+    re.DOTALL,
+)
+
+# Statement kinds, by sqlglot expression.
+_STATEMENT_TYPES = {
+    exp.Select: "SELECT",
+    exp.Union: "UNION",
+    exp.Intersect: "INTERSECT",
+    exp.Except: "EXCEPT",
+    exp.Insert: "INSERT",
+    exp.Create: "CREATE",
+    exp.Describe: "DESCRIBE",
+}
+
+# Query features recorded after the statement kind.
+_FEATURES = {
+    "CTE": exp.With,
+    "JOIN": exp.Join,
+    "GROUP BY": exp.Group,
+    "WINDOW": exp.Window,
+    "SUBQUERY": exp.Subquery,
+}
+
+# Functions whose value changes from one run of a query to the next.
+_VOLATILE_FUNCTIONS = (
+    exp.CurrentDate,
+    exp.CurrentTime,
+    exp.CurrentTimestamp,
+    exp.CurrentDatetime,
+    exp.Localtime,
+    exp.Localtimestamp,
+    exp.Rand,
+    exp.Randn,
+    exp.Uuid,
+)
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalizes a query so that formatting differences compare equal: drops
+    comments and a trailing semicolon, collapses whitespace and lower-cases
+    everything but quoted strings and identifiers.
+    Args:
+        query (str): The SQL.
+    Returns:
+        str: The normalized SQL.
+    """
+    parts = []
+    position = 0
+    for match in _SQL_TOKENS.finditer(query):
+        parts.append(query[position : match.start()].lower())
+        literal, identifier, _comment, _space = match.groups()
+        parts.append(literal or identifier or " ")
+        position = match.end()
+    parts.append(query[position:].lower())
+    normalized = re.sub(r"\s+", " ", "".join(parts)).strip()
+    return normalized.rstrip(";").strip()
+
+
+def query_fingerprint(query: str) -> str:
+    """
+    Returns:
+        str: The hash of the normalized query.
+    """
+    return hashlib.sha256(normalize_sql(query).encode("utf-8")).hexdigest()
+
+
+def _query_type(expression: exp.Expression) -> list[str]:
+    statement = _STATEMENT_TYPES.get(type(expression), expression.key.upper())
+    return [statement] + [
+        feature for feature, node in _FEATURES.items() if expression.find(node)
+    ]
+
+
+def _scope_metadata(scope: Scope, tables: set, columns: set) -> None:
+    catalog_sources = {
+        alias: source.name.lower()
+        for alias, source in scope.sources.items()
+        if isinstance(source, exp.Table)
+    }
+    tables.update(catalog_sources.values())
+    aliases = {
+        select.alias.lower()
+        for select in getattr(scope.expression, "selects", [])
+        if isinstance(select, exp.Alias)
+    }
+    for column in scope.columns:
+        name = column.name.lower()
+        if not name or isinstance(column.this, exp.Star):
+            continue
+        if column.table:
+            # Columns of CTEs and subqueries come from the scope they select.
+            if column.table in catalog_sources:
+                columns.add(name)
+        elif name not in aliases and catalog_sources:
+            columns.add(name)
+
+
+@lru_cache(maxsize=METADATA_CACHE_SIZE)
+def _extract(normalized: str) -> tuple[tuple, tuple, tuple]:
+    try:
+        expression = sqlglot.parse_one(normalized, read=DIALECT)
+    except SqlglotError as e:
+        print(f"Cannot parse the query for its metadata: {e}")
+        return (), (), ("UNKNOWN",)
+    tables, columns = set(), set()
+    for scope in traverse_scope(expression):
+        _scope_metadata(scope, tables, columns)
+    return tuple(sorted(tables)), tuple(sorted(columns)), tuple(_query_type(expression))
+
+
+def extract_sql_metadata(sql_query: str) -> dict:
+    """
+    Lists what a query touches, memoized by its normalized SQL.
+    Args:
+        sql_query (str): The SQL.
+    Returns:
+        dict: tables_used (catalog tables, lower case), columns_used (their
+            columns, lower case) and query_type (the statement kind, then
+            CTE, JOIN, GROUP BY, WINDOW, SUBQUERY where present; UNKNOWN if
+            the SQL does not parse).
+    """
+    tables, columns, query_type = _extract(normalize_sql(sql_query))
+    return {
+        "tables_used": list(tables),
+        "columns_used": list(columns),
+        "query_type": list(query_type),
+    }
+
+
+@lru_cache(maxsize=METADATA_CACHE_SIZE)
+def _volatile(normalized: str) -> bool:
+    try:
+        expression = sqlglot.parse_one(normalized, read=DIALECT)
+    except SqlglotError:
+        return True
+    return expression.find(*_VOLATILE_FUNCTIONS) is not None
+
+
+def is_volatile(sql_query: str) -> bool:
+    """
+    Tells whether a query's result depends on when it runs (current_date,
+    now(), current_timestamp, localtimestamp, ...) or is random (rand(),
+    uuid()), memoized by its normalized SQL.
+    Args:
+        sql_query (str): The SQL.
+    Returns:
+        bool: True for such a query, and for SQL that does not parse.
+    """
+    return _volatile(normalize_sql(sql_query))
+
+
+def cache_info():
+    """
+    Returns:
+        The hits, misses and size of the metadata LRU.
+    """
+    return _extract.cache_info()
@@ -0,0 +1,288 @@
+"""
+Pre-flight checks of agent SQL before it is sent to Athena.
+
+Many agent iterations are Athena round-trips that fail on a column that
+does not exist, a MySQL function Trino lacks or an ESCAPE clause, which the
+agent's system prompt forbids but nothing enforced. validate_sql() parses
+the query with sqlglot's Athena (Trino) dialect and reports, in a few
+milliseconds and without any AWS call:
+
+- banned_function: a function from BANNED_FUNCTIONS,
+- escape_clause: LIKE ... ESCAPE,
+- unknown_table: a table or view missing from the Glue catalog,
+- unknown_column: a column none of the query's sources has.
+
+The catalog is a cached copy of the Glue database (GlueCatalog), reloaded
+after CATALOG_TTL_SECONDS or when a query names a table it does not know.
+SQL that sqlglot cannot parse is passed on to Athena rather than rejected,
+since the parser may not know every Trino construct.
+"""
+
+import difflib
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.scope import Scope, traverse_scope
+from sqlglot.tokens import TokenType
+
+from .sql_metadata import DIALECT
+
+# Functions the agent must not use -> what to use instead.
+BANNED_FUNCTIONS = {
+    "date_format": "use format_datetime(from_unixtime(column), 'yyyy-MM-dd')",
+    "unix_timestamp": "use to_unixtime(timestamp)",
+    "str_to_date": "use date_parse(string, format)",
+    "datediff": "use date_diff('day', start, end)",
+    "ifnull": "use coalesce(value, default)",
+}
+
+# Schemas Athena provides besides the Glue database, not checked.
+SYSTEM_SCHEMAS = ("information_schema",)
+
+# How long the cached Glue catalog is used before it is reloaded.
+CATALOG_TTL_SECONDS = 600
+
+# An unknown table reloads the catalog at most this often.
+CATALOG_MIN_RELOAD_SECONDS = 60
+
+
+@dataclass
+class ValidationError:
+    """
+    A problem found in a query.
+    Attributes:
+        code (str): banned_function, escape_clause, unknown_table or
+            unknown_column.
+        message (str): What is wrong.
+        hint (str | None): How to fix it.
+    """
+
+    code: str
+    message: str
+    hint: str | None = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class GlueCatalog:
+    """
+    The table and column names of a Glue database, loaded with get_tables
+    and kept for CATALOG_TTL_SECONDS. Safe to share between threads.
+    """
+
+    def __init__(self, glue, database: str, ttl_seconds: int = CATALOG_TTL_SECONDS):
+        self.glue = glue
+        self.database = database
+        self.ttl_seconds = ttl_seconds
+        self._tables = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def tables(self, reload: bool = False) -> dict[str, set[str]]:
+        """
+        Args:
+            reload (bool): Reload unless the copy is younger than
+                CATALOG_MIN_RELOAD_SECONDS, e.g. for a table not found.
+        Returns:
+            dict[str, set[str]]: Table name -> column names (lower case),
+                partition keys included.
+        """
+        with self._lock:
+            age = time.monotonic() - self._loaded_at
+            stale = self._tables is None or age > self.ttl_seconds
+            if stale or (reload and age > CATALOG_MIN_RELOAD_SECONDS):
+                self._tables = self._load()
+                self._loaded_at = time.monotonic()
+            return self._tables
+
+    def _load(self) -> dict[str, set[str]]:
+        tables = {}
+        paginator = self.glue.get_paginator("get_tables")
+        for page in paginator.paginate(DatabaseName=self.database):
+            for table in page["TableList"]:
+                columns = table.get("StorageDescriptor", {}).get("Columns", [])
+                columns = columns + table.get("PartitionKeys", [])
+                tables[table["Name"].lower()] = {
+                    column["Name"].lower() for column in columns
+                }
+        print(f"Loaded {len(tables)} tables of {self.database} from Glue.")
+        return tables
+
+
+def _suggest(name: str, candidates) -> str | None:
+    matches = difflib.get_close_matches(name, sorted(candidates), n=3)
+    return f"did you mean {', '.join(matches)}?" if matches else None
+
+
+def check_tokens(query: str) -> list[ValidationError]:
+    """
+    Finds banned functions and ESCAPE clauses. Works on the tokens, since
+    the parser rewrites some functions (DATE_FORMAT into its own node).
+    """
+    errors = []
+    tokens = sqlglot.tokenize(query, read=DIALECT)
+    for token, following in zip(tokens, tokens[1:] + [None]):
+        name = token.text.lower()
+        if (
+            token.token_type == TokenType.VAR
+            and name in BANNED_FUNCTIONS
+            and following is not None
+            and following.token_type == TokenType.L_PAREN
+        ):
+            errors.append(
+                ValidationError(
+                    "banned_function",
+                    f"{token.text}() is not a Trino function.",
+                    BANNED_FUNCTIONS[name],
+                )
+            )
+        elif token.token_type == TokenType.ESCAPE:
+            errors.append(
+                ValidationError(
+                    "escape_clause",
+                    "LIKE ... ESCAPE is not supported.",
+                    "use LIKE with wildcards or regexp_like()",
+                )
+            )
+    return errors
+
+
+def _scope_columns(scope: Scope, catalog: dict[str, set[str]]) -> dict:
+    """
+    Returns:
+        dict: Source alias -> its column names, None when unknown (a star,
+            an UNNEST, a table missing from the catalog).
+    """
+    columns = {}
+    for alias, source in scope.sources.items():
+        if isinstance(source, exp.Table):
+            columns[alias] = catalog.get(source.name.lower())
+        elif isinstance(source, Scope) and not source.expression.is_star:
+            selects = getattr(source.expression, "named_selects", None)
+            columns[alias] = {name.lower() for name in selects or []} or None
+        else:
+            columns[alias] = None
+    return columns
+
+
+def _lambda_variable(column: exp.Column) -> bool:
+    function = column.find_ancestor(exp.Lambda)
+    return function is not None and column.name in {
+        variable.name for variable in function.expressions
+    }
+
+
+def check_names(
+    expression: exp.Expression, catalog: dict[str, set[str]]
+) -> list[ValidationError]:
+    """
+    Checks the tables and columns of a parsed query against the catalog.
+    """
+    errors = []
+    reported = set()
+
+    def report(error: ValidationError) -> None:
+        if error.message not in reported:
+            reported.add(error.message)
+            errors.append(error)
+
+    for scope in traverse_scope(expression):
+        for source in scope.sources.values():
+            if (
+                isinstance(source, exp.Table)
+                and source.db.lower() not in SYSTEM_SCHEMAS
+                and source.name.lower() not in catalog
+            ):
+                report(
+                    ValidationError(
+                        "unknown_table",
+                        f"Table {source.name} does not exist.",
+                        _suggest(source.name.lower(), catalog),
+                    )
+                )
+        sources = _scope_columns(scope, catalog)
+        if any(names is None for names in sources.values()):
+            known = None
+        else:
+            known = set().union(*sources.values())
+        # ORDER BY may name the select aliases.
+        aliases = {
+            select.alias.lower()
+            for select in getattr(scope.expression, "selects", [])
+            if isinstance(select, exp.Alias)
+        }
+        for column in scope.columns:
+            name = column.name.lower()
+            if not name or _lambda_variable(column):
+                continue
+            if column.table:
+                names = sources.get(column.table)
+                if column.table not in sources:
+                    # A correlated reference to an outer query.
+                    continue
+                if names is not None and name not in names:
+                    report(
+                        ValidationError(
+                            "unknown_column",
+                            f"Column {column.table}.{column.name} does not exist.",
+                            _suggest(name, names),
+                        )
+                    )
+            elif known is not None and name not in known | aliases:
+                hint = _suggest(name, known)
+                if column.this.quoted:
+                    hint = "string literals take single quotes, not double quotes"
+                report(
+                    ValidationError(
+                        "unknown_column",
+                        f"Column {column.name} does not exist in "
+                        f"{', '.join(sorted(sources))}.",
+                        hint,
+                    )
+                )
+    return errors
+
+
+def validate_sql(
+    query: str, catalog: dict[str, set[str]] | None = None
+) -> list[ValidationError]:
+    """
+    Checks a query before it is run.
+    Args:
+        query (str): The SQL.
+        catalog (dict[str, set[str]], optional): Table -> column names, see
+            GlueCatalog.tables(); without it tables and columns are not
+            checked.
+    Returns:
+        list[ValidationError]: The problems found, empty if none. Only the
+            banned functions are checked in SQL that sqlglot cannot parse.
+    """
+    try:
+        errors = check_tokens(query)
+    except SqlglotError as e:
+        print(f"Cannot tokenize the query, leaving it to Athena: {e}")
+        return []
+    try:
+        expression = sqlglot.parse_one(query, read=DIALECT)
+    except SqlglotError as e:
+        print(f"Cannot parse the query, leaving it to Athena: {e}")
+        return errors
+    if catalog is not None:
+        errors += check_names(expression, catalog)
+    return errors
+
+
+def format_errors(errors: list[ValidationError]) -> str:
+    """
+    Returns:
+        str: One line per error, for the agent to read.
+    """
+    return "\n".join(
+        f"- {error.message}" + (f" Hint: {error.hint}" if error.hint else "")
+        for error in errors
+    )
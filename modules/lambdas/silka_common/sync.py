@@ -0,0 +1,214 @@
+"""
+Incremental sync of edited workouts (change data capture on updated_at).
+
+fetch_recent_workouts only looks at indexes above the latest one, so a
+workout edited after ingestion is never refreshed. The sync re-reads a
+window of recent workouts (or all of them), keeps those whose updated_at is
+newer than the stored sync watermark and whose content fingerprint differs
+from the stored one, and rewrites only those: their raw JSON, Parquet rows
+and DynamoDB item. A workout whose start time was edited moves to another
+day/month, so its previous JSON object, per-workout Parquet files and rows
+in period or compacted files are removed first.
+"""
+
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from .aws_clients import get_client
+from .batch_writer import BatchParquetWriter
+from .ingestion import WorkoutIngestor
+from .metadata import read_workout_items
+from .raw_archive import RawArchiveWriter
+from .workouts import workout_fingerprint, workout_json_key
+
+# SSM parameter holding the newest updated_at the sync has seen.
+SYNC_WATERMARK_PARAMETER = "/926728314305/workouts-sync-watermark"
+
+# How many of the most recent workout indexes a sync re-reads by default.
+DEFAULT_LOOKBACK_WORKOUTS = 200
+
+
+def parse_updated_at(value) -> datetime | None:
+    """
+    Parses a Hevy updated_at timestamp.
+    Args:
+        value: The raw value, e.g. "2024-05-01T18:02:11.123Z".
+    Returns:
+        datetime | None: The timestamp, None if missing or unparseable.
+    """
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def read_sync_watermark(ssm) -> datetime | None:
+    """
+    Reads the sync watermark.
+    Args:
+        ssm: The SSM client.
+    Returns:
+        datetime | None: The watermark, None before the first sync.
+    """
+    try:
+        response = ssm.get_parameter(Name=SYNC_WATERMARK_PARAMETER)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ParameterNotFound":
+            return None
+        raise
+    return parse_updated_at(response["Parameter"]["Value"])
+
+
+def write_sync_watermark(ssm, watermark: datetime) -> None:
+    """
+    Stores the sync watermark.
+    Args:
+        ssm: The SSM client.
+        watermark (datetime): The newest updated_at synced.
+    """
+    ssm.put_parameter(
+        Name=SYNC_WATERMARK_PARAMETER,
+        Value=watermark.isoformat(),
+        Type="String",
+        Overwrite=True,
+    )
+
+
+def sync_start_index(latest_index: int, lookback: int | str | None) -> int:
+    """
+    Computes the first workout index a sync re-reads.
+    Args:
+        latest_index (int): The latest ingested workout index.
+        lookback (int | str | None): Number of recent workouts to re-read,
+            "all" for the whole history, None for DEFAULT_LOOKBACK_WORKOUTS.
+    Returns:
+        int: The start index.
+    """
+    if lookback == "all":
+        return 0
+    lookback = DEFAULT_LOOKBACK_WORKOUTS if lookback is None else int(lookback)
+    return max(0, latest_index - lookback + 1)
+
+
+def select_updated(workouts: list[dict], watermark: datetime | None) -> list[dict]:
+    """
+    Keeps the workouts updated after the watermark. Without a watermark, or
+    without a parseable updated_at, a workout is kept.
+    Args:
+        workouts (list[dict]): Raw Hevy workouts.
+        watermark (datetime | None): The sync watermark.
+    Returns:
+        list[dict]: The candidate workouts.
+    """
+    if watermark is None:
+        return list(workouts)
+    selected = []
+    for workout in workouts:
+        updated_at = parse_updated_at(workout.get("updated_at"))
+        if updated_at is None or updated_at > watermark:
+            selected.append(workout)
+    return selected
+
+
+def remove_previous_versions(
+    s3, bucket_name: str, changed: list[dict], stored: dict[int, dict]
+) -> int:
+    """
+    Removes what the previous version of each changed workout left behind:
+    its rows in the daily and monthly period (or compacted) files of the day
+    it was stored under, its per-workout Parquet files and its line in the
+    monthly raw archive, plus the raw JSON when the start time moved it to
+    another key.
+    Args:
+        s3: The S3 client.
+        bucket_name (str): The S3 bucket.
+        changed (list[dict]): The new versions of the workouts.
+        stored (dict[int, dict]): The stored DynamoDB items, by index.
+    Returns:
+        int: The number of workouts whose keys moved.
+    """
+    previous = []
+    moved_keys = []
+    for workout in changed:
+        item = stored.get(workout["index"])
+        if item is None:
+            continue
+        previous.append(
+            {"id": item["id"]["S"], "start_time": int(item["start_time"]["N"])}
+        )
+        if item["key"]["S"] != workout_json_key(workout):
+            moved_keys.append(item["key"]["S"])
+
+    for layout in ("daily", "monthly"):
+        writer = BatchParquetWriter(s3, bucket_name, layout)
+        for workout in previous:
+            writer.remove(workout)
+        writer.flush()
+    archive = RawArchiveWriter(s3, bucket_name)
+    for workout in previous:
+        archive.remove(workout)
+    archive.flush()
+
+    for start in range(0, len(moved_keys), 1000):
+        s3.delete_objects(
+            Bucket=bucket_name,
+            Delete={
+                "Objects": [{"Key": key} for key in moved_keys[start : start + 1000]],
+                "Quiet": True,
+            },
+        )
+    return len(moved_keys)
+
+
+def sync_workouts(bucket_name: str, table_name: str, workouts: list[dict]) -> dict:
+    """
+    Rewrites the workouts that changed since the last sync and advances the
+    watermark to the newest updated_at seen.
+    Args:
+        bucket_name (str): The S3 bucket.
+        table_name (str): The workouts metadata table.
+        workouts (list[dict]): The raw workouts of the sync window.
+    Returns:
+        dict: fetched, changed, moved and unchanged counts.
+    """
+    ssm = get_client("ssm")
+    dynamodb = get_client("dynamodb")
+    watermark = read_sync_watermark(ssm)
+
+    candidates = select_updated(workouts, watermark)
+    stored = read_workout_items(
+        dynamodb,
+        table_name,
+        [w["index"] for w in candidates],
+        ("id", "start_time", "key", "fingerprint"),
+    )
+    changed = [
+        w
+        for w in candidates
+        if stored.get(w["index"], {}).get("fingerprint", {}).get("S")
+        != workout_fingerprint(w)
+    ]
+
+    moved = 0
+    if changed:
+        # The ingestor resolves the active table prefixes the cleanup uses.
+        ingestor = WorkoutIngestor(bucket_name, table_name)
+        moved = remove_previous_versions(ingestor.s3, bucket_name, changed, stored)
+        ingestor.ingest(changed, total=len(changed))
+
+    seen = [parse_updated_at(w.get("updated_at")) for w in workouts]
+    newest = max([ts for ts in seen if ts is not None], default=None)
+    if newest is not None and (watermark is None or newest > watermark):
+        write_sync_watermark(ssm, newest)
+
+    print(
+        f"Sync: {len(workouts)} workouts read, {len(changed)} rewritten "
+        f"({moved} moved), {len(workouts) - len(changed)} unchanged."
+    )
+    return {
+        "fetched": len(workouts),
+        "changed": len(changed),
+        "moved": moved,
+        "unchanged": len(workouts) - len(changed),
+    }
@@ -0,0 +1,82 @@
+"""
+Resolves the S3 prefix each star-schema table is currently read from.
+
+The Glue table location is the source of truth: compaction (and later
+rewrites) build a new generation of a table under a fresh prefix and swap the
+Glue location in a single update_table call, which is the only change Athena
+observes atomically. Writers therefore look the location up instead of
+hard-coding it. Without ATHENA_DATABASE (local runs) the original
+sorted/<table> prefixes are used.
+"""
+
+import os
+import threading
+
+from .aws_clients import get_client
+
+# Star-schema tables and the S3 prefix each one was originally written under.
+STAR_SCHEMA_TABLES = {
+    "workout": "sorted/workouts",
+    "exercise": "sorted/exercises",
+    "set": "sorted/sets",
+}
+
+# Glue table backing each star-schema table.
+GLUE_TABLE_NAMES = {
+    "workout": "workouts",
+    "exercise": "performed_exercises",
+    "set": "sets",
+}
+
+_prefixes = {}
+_lock = threading.Lock()
+
+
+def split_s3_uri(uri: str) -> tuple[str, str]:
+    """
+    Splits an s3:// URI into bucket and key prefix.
+    Args:
+        uri (str): e.g. s3://bucket/sorted/sets/
+    Returns:
+        tuple[str, str]: The bucket and the prefix without slashes around it.
+    """
+    path = uri.removeprefix("s3://")
+    bucket, _, prefix = path.partition("/")
+    return bucket, prefix.strip("/")
+
+
+def refresh_table_prefixes(database: str | None = None) -> dict[str, str]:
+    """
+    Reads the current location of every star-schema table from Glue.
+    Called once per ingestion run so warm Lambdas pick up a swapped location.
+    Args:
+        database (str, optional): The Glue database, ATHENA_DATABASE by default.
+    Returns:
+        dict[str, str]: The S3 key prefix per star-schema table.
+    """
+    database = database or os.environ.get("ATHENA_DATABASE")
+    prefixes = dict(STAR_SCHEMA_TABLES)
+    if database:
+        glue = get_client("glue")
+        for table, glue_name in GLUE_TABLE_NAMES.items():
+            response = glue.get_table(DatabaseName=database, Name=glue_name)
+            location = response["Table"]["StorageDescriptor"]["Location"]
+            prefixes[table] = split_s3_uri(location)[1]
+    with _lock:
+        _prefixes.clear()
+        _prefixes.update(prefixes)
+    return prefixes
+
+
+def table_prefix(table: str) -> str:
+    """
+    Returns the S3 key prefix new files of a star-schema table go under.
+    Args:
+        table (str): One of "workout", "exercise" or "set".
+    Returns:
+        str: The prefix, e.g. sorted/sets.
+    """
+    with _lock:
+        if table in _prefixes:
+            return _prefixes[table]
+    return STAR_SCHEMA_TABLES[table]
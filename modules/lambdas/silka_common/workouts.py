@@ -0,0 +1,121 @@
+"""
+Per-workout helpers shared by the ingestion Lambdas: the S3 keys and
+DynamoDB item a workout is stored under, its content fingerprint and the
+Parquet serialization.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+import pyarrow as pa
+
+from .parquet_profile import write_parquet
+from .partitioning import partition_path
+from .table_locations import table_prefix
+
+
+def workout_date_parts(workout: dict) -> tuple[str, str, str]:
+    """
+    Splits the workout start time into zero-padded date parts.
+    Args:
+        workout (dict): The raw Hevy workout.
+    Returns:
+        tuple[str, str, str]: The year, month and day of the workout.
+    """
+    timestamp = str(datetime.fromtimestamp(workout["start_time"]))
+    year, month, day = timestamp.split(" ")[0].split("-")
+    return year, month, day
+
+
+def workout_json_key(workout: dict) -> str:
+    """
+    Builds the S3 key of the raw workout JSON.
+    Args:
+        workout (dict): The raw Hevy workout.
+    Returns:
+        str: The S3 key.
+    """
+    year, month, day = workout_date_parts(workout)
+    return f"sorted_workouts/{year}/{month}/{day}/{workout['id']}.json"
+
+
+def workout_parquet_key(workout: dict, table: str) -> str:
+    """
+    Builds the S3 key of the per-workout Parquet file of a star-schema table,
+    inside the Hive-style year=/month= partition of the workout.
+    Args:
+        workout (dict): The raw Hevy workout.
+        table (str): One of "workout", "exercise" or "set".
+    Returns:
+        str: The S3 key.
+    """
+    year, month, _ = workout_date_parts(workout)
+    return (
+        f"{table_prefix(table)}/{partition_path(year, month)}/{workout['id']}.parquet"
+    )
+
+
+def legacy_workout_parquet_key(workout: dict, table: str) -> str:
+    """
+    Builds the pre-partitioning key (<prefix>/yyyy/mm/dd/<id>.parquet) a
+    workout may still be stored under.
+    Args:
+        workout (dict): The raw Hevy workout.
+        table (str): One of "workout", "exercise" or "set".
+    Returns:
+        str: The S3 key.
+    """
+    year, month, day = workout_date_parts(workout)
+    return f"{table_prefix(table)}/{year}/{month}/{day}/{workout['id']}.parquet"
+
+
+def workout_fingerprint(workout: dict) -> str:
+    """
+    Hashes the content of a workout payload, independently of key order.
+    Args:
+        workout (dict): The raw Hevy workout.
+    Returns:
+        str: The SHA-256 hex digest of the canonical JSON.
+    """
+    canonical = json.dumps(workout, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("UTF-8")).hexdigest()
+
+
+def build_dynamodb_item(workout: dict, bucket_name: str, key: str) -> dict:
+    """
+    Builds the DynamoDB metadata item registered for a workout.
+    Args:
+        workout (dict): The raw Hevy workout.
+        bucket_name (str): The S3 bucket holding the workout JSON.
+        key (str): The S3 key of the workout JSON.
+    Returns:
+        dict: The item in DynamoDB attribute-value format.
+    """
+    return {
+        "index": {"S": str(workout["index"])},
+        "name": {"S": str(workout["name"])},
+        "id": {"S": str(workout["id"])},
+        "nth_workout": {"N": str(workout["nth_workout"])},
+        "start_time": {"N": str(workout["start_time"])},
+        "bucket_name": {"S": str(bucket_name)},
+        "key": {"S": str(key)},
+        "workout_day": {
+            "S": datetime.fromtimestamp(workout["start_time"]).strftime("%Y-%m-%d")
+        },
+        "fingerprint": {"S": workout_fingerprint(workout)},
+    }
+
+
+def write_parquet_bytes(arrow_table: pa.Table, table: str | None = None) -> bytes:
+    """
+    Serializes an Arrow table as a Parquet file under the active storage
+    profile (see parquet_profile.py).
+    Args:
+        arrow_table (pa.Table): The table to serialize.
+        table (str, optional): The star-schema table, e.g. "set"; picks the
+            profile's sort keys and dictionary columns.
+    Returns:
+        bytes: The Parquet file content.
+    """
+    return write_parquet(arrow_table, table)
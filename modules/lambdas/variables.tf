@@ -70,4 +70,25 @@ variable "athena_queries_bucket" {
 variable "lance_db_bucket_name" {
   description = "The S3 bucket name for LanceDB storage"
   type        = string
-}
\ No newline at end of file
+}
+
+# Parquet layout written by the ingestion Lambdas: per_workout, daily or monthly.
+variable "parquet_layout" {
+  description = "One Parquet file per workout (per_workout) or per table and period (daily, monthly)"
+  type        = string
+  default     = "per_workout"
+}
+
+# Parquet storage profile (codec, dictionaries, sort order, row groups): athena or legacy.
+variable "parquet_profile" {
+  description = "Storage profile the Parquet writers apply, see silka_common/parquet_profile.py"
+  type        = string
+  default     = "athena"
+}
+
+# Run the Parquet compaction after every fetch_workouts command.
+variable "compact_after_fetch" {
+  description = "Whether hevy_api_caller compacts the Parquet tables after fetching new workouts"
+  type        = string
+  default     = "false"
+}
@@ -0,0 +1,154 @@
+"""
+Compares the schema-driven Arrow builder with the pandas enforce_types path
+it replaced: checks that both produce the same column types and times them
+per workout.
+
+Run with modules/lambdas on PYTHONPATH (see `make bench-arrow-builder`).
+"""
+
+import argparse
+import io
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from silka_common.arrow_schemas import build_arrow_table
+from silka_common.table_locations import STAR_SCHEMA_TABLES
+from silka_common.normalize import normalize_workout_star_schema
+from silka_common.workouts import write_parquet_bytes
+from synthetic import synthetic_workout
+
+# The dtype map of the removed enforce_types, kept as the baseline.
+LEGACY_DTYPES = {
+    "workout": {
+        "id": "string",
+        "name": "string",
+        "index": "Int64",
+        "end_time": "Int64",
+        "created_at": "string",
+        "routine_id": "string",
+        "start_time": "Int64",
+        "updated_at": "string",
+        "nth_workout": "Int64",
+        "comment_count": "Int64",
+        "estimated_volume_kg": "float64",
+    },
+    "exercise": {
+        "id": "string",
+        "title": "string",
+        "index": "Int64",
+        "workout_id": "string",
+        "created_at": "string",
+        "updated_at": "string",
+        "exercise_type": "string",
+        "equipment_category": "string",
+        "exercise_template_id": "string",
+        "priority": "Int64",
+        "muscle_group": "string",
+    },
+    "set": {
+        "id": "string",
+        "rpe": "float64",
+        "reps": "Int64",
+        "index": "Int64",
+        "indicator": "string",
+        "weight_kg": "float64",
+        "distance_meters": "float64",
+        "duration_seconds": "Int64",
+        "exercise_id": "string",
+        "workout_id": "string",
+    },
+}
+
+
+def legacy_build_arrow_table(rows: list[dict], table: str) -> pa.Table:
+    df = pd.DataFrame(rows)
+    for col, dtype in LEGACY_DTYPES[table].items():
+        if col in df.columns:
+            if dtype == "string":
+                df[col] = df[col].astype(str).replace({"nan": None, "None": None})
+            elif dtype == "Int64":
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+            elif dtype == "float64":
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def time_builder(builder, normalized: list[tuple]) -> float:
+    start = time.perf_counter()
+    for tables in normalized:
+        for table, rows in zip(STAR_SCHEMA_TABLES, tables):
+            builder(rows, table)
+    return time.perf_counter() - start
+
+
+def parquet_column_types(arrow_table: pa.Table) -> dict:
+    """
+    Maps each column to its Parquet physical and logical type, which is what
+    Athena reads (the in-memory Arrow type may differ between pandas versions,
+    e.g. string vs large_string, and still encode to the same column).
+    """
+    schema = pq.ParquetFile(io.BytesIO(write_parquet_bytes(arrow_table))).schema
+    return {
+        column.name: (column.physical_type, str(column.logical_type))
+        for column in schema
+    }
+
+
+def check_types(normalized: list[tuple]) -> list[str]:
+    """
+    Lists the columns whose Parquet type differs between the two builders.
+    Columns the legacy path wrote as null (all values missing) are skipped:
+    it inferred no type for them.
+    """
+    mismatches = []
+    for tables in normalized:
+        for table, rows in zip(STAR_SCHEMA_TABLES, tables):
+            legacy_table = legacy_build_arrow_table(rows, table)
+            legacy = parquet_column_types(legacy_table)
+            current = parquet_column_types(build_arrow_table(rows, table))
+            for name, column_type in current.items():
+                if (
+                    name not in legacy
+                    or legacy_table.schema.field(name).type == pa.null()
+                ):
+                    continue
+                if legacy[name] != column_type:
+                    mismatches.append(
+                        f"{table}.{name}: {legacy[name]} != {column_type}"
+                    )
+    return sorted(set(mismatches))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workouts", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    normalized = [
+        normalize_workout_star_schema(synthetic_workout(i))
+        for i in range(args.workouts)
+    ]
+
+    mismatches = check_types(normalized[:200])
+    if mismatches:
+        raise SystemExit("Column types differ:\n" + "\n".join(mismatches))
+    print("Column types identical to the pandas path.")
+
+    legacy = min(
+        time_builder(legacy_build_arrow_table, normalized) for _ in range(args.repeat)
+    )
+    current = min(
+        time_builder(build_arrow_table, normalized) for _ in range(args.repeat)
+    )
+    per_workout = 1e6 / args.workouts
+    print(f"pandas enforce_types: {legacy * per_workout:8.1f} us/workout")
+    print(f"arrow builder:        {current * per_workout:8.1f} us/workout")
+    print(f"speed-up:             {legacy / current:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
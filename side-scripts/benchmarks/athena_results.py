@@ -0,0 +1,162 @@
+"""
+Checks that the two readers of silka_common/athena_results.py return the
+same rows for the same result: the result CSV on S3 and paging
+get_query_results. Nulls, empty strings, quotes, commas and line breaks
+inside values must come back identical from both, whatever the Python
+version (csv.reader tells a null from "" only from 3.12 on). Also times
+the CSV parse per row.
+
+Both sides are generated from one synthetic result, the CSV the way Athena
+writes it (every non-null value quoted, nulls empty) and the API pages the
+way get_query_results returns them (no VarCharValue for a null), so no AWS
+access is needed:
+
+    python athena_results.py --rows 20000
+
+Exits 1 if the readers disagree. Run with modules/lambdas on PYTHONPATH
+(see `make check-athena-results`).
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+
+from silka_common.athena_results import (
+    PAGE_SIZE,
+    iter_csv_rows,
+    read_results_api,
+    read_results_s3,
+)
+
+COLUMNS = [
+    ("title", "varchar"),
+    ("notes", "varchar"),
+    ("reps", "integer"),
+    ("weight_kg", "double"),
+    ("is_warmup", "boolean"),
+    ("start_time", "timestamp"),
+]
+
+# Awkward string values, None being a null.
+STRINGS = [None, "", "Bench Press", 'said "light"', "a,b", "two\nlines", " "]
+
+
+def synthetic_rows(count: int, seed: int = 7) -> list[list]:
+    """
+    Returns:
+        list[list]: Rows of string values (None for nulls), as Athena has them
+            before conversion.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        rows.append(
+            [
+                rng.choice(STRINGS),
+                rng.choice(STRINGS),
+                rng.choice([None, str(rng.randint(1, 20))]),
+                rng.choice([None, str(rng.uniform(0, 200))]),
+                rng.choice([None, "true", "false"]),
+                rng.choice([None, "2024-03-01 10:00:00.000"]),
+            ]
+        )
+    return rows
+
+
+def athena_csv(rows: list[list]) -> bytes:
+    def field(value):
+        return "" if value is None else '"' + value.replace('"', '""') + '"'
+
+    lines = [",".join(field(name) for name, _ in COLUMNS)]
+    lines += [",".join(field(value) for value in row) for row in rows]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def column_info() -> dict:
+    return {"ColumnInfo": [{"Name": name, "Type": kind} for name, kind in COLUMNS]}
+
+
+class FakeAthena:
+    """
+    Answers get_query_results from the synthetic rows, header row first.
+    """
+
+    def __init__(self, rows: list[list]):
+        header = [name for name, _ in COLUMNS]
+        self.rows = [header] + rows
+
+    def get_query_results(self, QueryExecutionId, MaxResults, NextToken=None):
+        start = int(NextToken or 0)
+        page = {
+            "ResultSet": {
+                "Rows": [
+                    {
+                        "Data": [
+                            {} if value is None else {"VarCharValue": value}
+                            for value in row
+                        ]
+                    }
+                    for row in self.rows[start : start + MaxResults]
+                ],
+                "ResultSetMetadata": column_info(),
+            }
+        }
+        if start + MaxResults < len(self.rows):
+            page["NextToken"] = str(start + MaxResults)
+        return page
+
+
+class FakeS3:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--show", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows)
+    body = athena_csv(rows)
+    athena = FakeAthena(rows)
+    execution = {
+        "QueryExecutionId": "check",
+        "ResultConfiguration": {"OutputLocation": "s3://results/check.csv"},
+    }
+    from_s3 = read_results_s3(athena, FakeS3(body), execution)
+    from_api = read_results_api(athena, "check")
+
+    mismatches = [
+        (position, s3_row, api_row)
+        for position, (s3_row, api_row) in enumerate(zip(from_s3.rows, from_api.rows))
+        if s3_row != api_row
+    ]
+    if len(from_s3.rows) != len(from_api.rows):
+        print(f"s3 read {len(from_s3.rows)} rows, the API {len(from_api.rows)}")
+    nulls = sum(row[:2].count(None) for row in from_api.rows)
+    empty = sum(row[:2].count("") for row in from_api.rows)
+    print(
+        f"{len(mismatches)}/{len(rows)} rows differ between s3 and the API "
+        f"({nulls} null and {empty} empty strings, "
+        f"{-(-(len(rows) + 1) // PAGE_SIZE)} API pages)"
+    )
+    for position, s3_row, api_row in mismatches[: args.show]:
+        print(f"  row {position}:\n    s3  {s3_row!r}\n    api {api_row!r}")
+
+    start = time.perf_counter()
+    parsed = sum(1 for _ in iter_csv_rows(io.BytesIO(body)))
+    elapsed = time.perf_counter() - start
+    print(f"CSV parse: {elapsed / parsed * 1e6:.2f} us/row over {parsed} rows")
+
+    if mismatches or len(from_s3.rows) != len(from_api.rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
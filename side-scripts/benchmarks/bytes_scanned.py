@@ -0,0 +1,188 @@
+"""
+Measures the bytes Athena scans for every dbt mart, to compare Parquet
+storage profiles (see silka_common/parquet_profile.py).
+
+Athena bills and prunes by the bytes it reads, so the profile change is
+judged on the marts the dashboards query:
+
+    python bytes_scanned.py measure --label before
+    PARQUET_PROFILE=athena make reprocess-parquet
+    python bytes_scanned.py measure --label after
+    python bytes_scanned.py compare before after
+
+measure runs SELECT * on every mart view in the Athena database and saves
+DataScannedInBytes per mart to bytes_scanned_<label>.json. Without AWS
+access, offline writes a synthetic history in monthly files under every
+profile and compares the file sizes per table:
+
+    python bytes_scanned.py offline --workouts 1000
+
+Run from side-scripts/benchmarks with modules/lambdas on PYTHONPATH (see
+`make bench-bytes-scanned`).
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+
+MARTS_DIR = (
+    Path(__file__).resolve().parents[2]
+    / "dbt"
+    / "personal_gym_tracker"
+    / "models"
+    / "marts"
+)
+
+
+def mart_names() -> list[str]:
+    """
+    Returns:
+        list[str]: The dbt mart models, one view each.
+    """
+    return sorted(path.stem for path in MARTS_DIR.glob("*.sql"))
+
+
+def run_query(athena, query: str, database: str, output: str | None) -> dict:
+    """
+    Runs a query and waits for it.
+    Returns:
+        dict: The QueryExecution of the finished query.
+    """
+    kwargs = {
+        "QueryString": query,
+        "QueryExecutionContext": {"Database": database},
+        # Reused results scan nothing and would hide the difference.
+        "ResultReuseConfiguration": {
+            "ResultReuseByAgeConfiguration": {"Enabled": False}
+        },
+    }
+    if output:
+        kwargs["ResultConfiguration"] = {"OutputLocation": output}
+    execution_id = athena.start_query_execution(**kwargs)["QueryExecutionId"]
+    while True:
+        execution = athena.get_query_execution(QueryExecutionId=execution_id)[
+            "QueryExecution"
+        ]
+        state = execution["Status"]["State"]
+        if state in ("SUCCEEDED", "FAILED", "CANCELLED"):
+            break
+        time.sleep(0.5)
+    if state != "SUCCEEDED":
+        reason = execution["Status"].get("StateChangeReason", "")
+        raise RuntimeError(f"{query} {state}: {reason}")
+    return execution
+
+
+def measure(database: str, output: str | None) -> dict:
+    """
+    Scans every mart once.
+    Args:
+        database (str): The Athena database the dbt views live in.
+        output (str | None): The query result location, the workgroup's if None.
+    Returns:
+        dict: mart -> bytes scanned and engine milliseconds.
+    """
+    from silka_common.aws_clients import get_client
+
+    athena = get_client("athena")
+    results = {}
+    for mart in mart_names():
+        execution = run_query(athena, f'SELECT * FROM "{mart}"', database, output)
+        statistics = execution["Statistics"]
+        results[mart] = {
+            "bytes": statistics["DataScannedInBytes"],
+            "engine_ms": statistics["EngineExecutionTimeInMillis"],
+        }
+        print(f"{mart:28} {results[mart]['bytes'] / 2**20:10.2f} MiB")
+    return results
+
+
+def compare(before: dict, after: dict) -> None:
+    """
+    Prints the bytes scanned per mart of two measurements.
+    """
+    print(f"{'mart':28} {'before MiB':>11} {'after MiB':>11} {'change':>8}")
+    totals = [0, 0]
+    for mart in sorted(set(before) & set(after)):
+        old, new = before[mart]["bytes"], after[mart]["bytes"]
+        totals[0] += old
+        totals[1] += new
+        change = f"{(new - old) / old:+8.1%}" if old else f"{'n/a':>8}"
+        print(f"{mart:28} {old / 2**20:11.2f} {new / 2**20:11.2f} {change}")
+    old, new = totals
+    change = f"{(new - old) / old:+8.1%}" if old else f"{'n/a':>8}"
+    print(f"{'total':28} {old / 2**20:11.2f} {new / 2**20:11.2f} {change}")
+
+
+def offline(workouts: int) -> None:
+    """
+    Writes a synthetic history in monthly files under every profile and
+    prints the bytes per table.
+    """
+    from silka_common.normalize import normalize_workouts_columnar
+    from silka_common.parquet_profile import PROFILES, write_parquet
+    from silka_common.table_locations import STAR_SCHEMA_TABLES
+    from silka_common.workouts import workout_date_parts
+    from synthetic import synthetic_workout
+
+    by_month = defaultdict(list)
+    for index in range(workouts):
+        workout = synthetic_workout(index)
+        by_month[workout_date_parts(workout)[:2]].append(workout)
+    months = [
+        normalize_workouts_columnar(month).to_arrow() for month in by_month.values()
+    ]
+
+    sizes = {
+        name: {
+            table: sum(
+                len(write_parquet(month[table], table, profile)) for month in months
+            )
+            for table in STAR_SCHEMA_TABLES
+        }
+        for name, profile in PROFILES.items()
+    }
+    names = list(PROFILES)
+    print(f"{len(months)} monthly files per table, {workouts} workouts")
+    print(f"{'table':10}" + "".join(f" {name + ' KiB':>12}" for name in names))
+    for table in STAR_SCHEMA_TABLES:
+        print(
+            f"{table:10}"
+            + "".join(f" {sizes[name][table] / 1024:12.1f}" for name in names)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    measuring = commands.add_parser("measure")
+    measuring.add_argument("--label", required=True)
+    measuring.add_argument("--database", default=os.environ.get("ATHENA_DATABASE"))
+    measuring.add_argument("--output", default=os.environ.get("ATHENA_OUTPUT"))
+    comparing = commands.add_parser("compare")
+    comparing.add_argument("before")
+    comparing.add_argument("after")
+    synthetic = commands.add_parser("offline")
+    synthetic.add_argument("--workouts", type=int, default=1_000)
+    args = parser.parse_args()
+
+    if args.command == "measure":
+        results = measure(args.database, args.output)
+        Path(f"bytes_scanned_{args.label}.json").write_text(
+            json.dumps(results, indent=2)
+        )
+    elif args.command == "compare":
+        before, after = (
+            json.loads(Path(f"bytes_scanned_{label}.json").read_text())
+            for label in (args.before, args.after)
+        )
+        compare(before, after)
+    else:
+        offline(args.workouts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Import-time profile of the Lambda entry points.
+
+Each entry point (and, for hevy_api_caller, each command with the modules
+listed in its COMMAND_MODULES) is imported in a fresh interpreter with
+`python -X importtime`, which is what a cold start pays before the handler
+runs. The median over --repeat runs is compared against
+cold_start_budgets.json: an entry fails when it exceeds its max_ms or
+imports one of its forbidden packages. Entries with "max_ms": null are only
+recorded until a budget is set.
+
+    python cold_start.py            # check the budgets, exit 1 on regression
+    python cold_start.py --update   # rewrite max_ms from this machine
+
+Run from side-scripts/benchmarks (see `make bench-cold-start`).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+LAMBDAS_DIR = Path(__file__).resolve().parents[2] / "modules" / "lambdas"
+BUDGETS_FILE = Path(__file__).with_name("cold_start_budgets.json")
+
+# --update sets each budget to the measured median times this, plus a fixed
+# allowance for machine noise.
+BUDGET_HEADROOM = 1.5
+BUDGET_ALLOWANCE_MS = 25
+
+IMPORT_SNIPPET = """
+import importlib
+module = importlib.import_module({entry!r})
+for name in getattr(module, "COMMAND_MODULES", {{}}).get({command!r}, ()):
+    importlib.import_module(name)
+"""
+
+
+def parse_importtime(stderr: str) -> tuple[float, Counter]:
+    """
+    Parses the -X importtime report.
+    Args:
+        stderr (str): The interpreter's stderr.
+    Returns:
+        tuple[float, Counter]: The total import time in ms and the self time
+            in ms of each top-level package.
+    """
+    total_us = 0
+    packages = Counter()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        total_us += int(self_us)
+        packages[package] += int(self_us) / 1000
+    return total_us / 1000, packages
+
+
+def measure(entry: str, command: str) -> tuple[float, Counter]:
+    """
+    Imports an entry point in a fresh interpreter and times it.
+    Args:
+        entry (str): The Lambda module, e.g. "hevy_api_caller".
+        command (str): The command whose COMMAND_MODULES are imported too.
+    Returns:
+        tuple[float, Counter]: As parse_importtime().
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([str(LAMBDAS_DIR / entry), str(LAMBDAS_DIR)])
+    # Some modules create clients at import time; they need a region.
+    env.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            IMPORT_SNIPPET.format(entry=entry, command=command),
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--update", action="store_true")
+    args = parser.parse_args()
+
+    budgets = json.loads(BUDGETS_FILE.read_text())
+    failures = []
+    for entry, commands in budgets.items():
+        for command, budget in commands.items():
+            label = f"{entry}:{command}"
+            try:
+                runs = [measure(entry, command) for _ in range(args.repeat)]
+            except RuntimeError as e:
+                failures.append(f"{label} failed to import: {e}")
+                print(f"{label:40} import failed: {e}")
+                continue
+            median_ms = statistics.median(total for total, _ in runs)
+            packages = runs[0][1]
+            heaviest = ", ".join(
+                f"{name} {ms:.0f}ms" for name, ms in packages.most_common(3)
+            )
+            if args.update:
+                budget["max_ms"] = round(
+                    median_ms * BUDGET_HEADROOM + BUDGET_ALLOWANCE_MS
+                )
+
+            status = "ok"
+            forbidden = sorted(set(budget.get("forbidden", [])) & set(packages))
+            if forbidden:
+                status = "FORBIDDEN " + ", ".join(forbidden)
+            elif budget["max_ms"] is not None and median_ms > budget["max_ms"]:
+                status = "OVER BUDGET"
+            if status != "ok":
+                failures.append(f"{label}: {status}")
+            limit = "-" if budget["max_ms"] is None else f"{budget['max_ms']}ms"
+            print(f"{label:40} {median_ms:7.0f}ms / {limit:>7}  {status:12} {heaviest}")
+
+    if args.update:
+        BUDGETS_FILE.write_text(json.dumps(budgets, indent=2) + "\n")
+        print(f"Budgets written to {BUDGETS_FILE.name}.")
+    if failures:
+        raise SystemExit("Cold-start regressions:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
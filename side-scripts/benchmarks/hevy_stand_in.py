@@ -0,0 +1,151 @@
+"""
+Local stand-in for the Hevy API endpoints the ingestion uses.
+
+Serves GET /workout_count and GET /workouts_batch/<index> from synthetic
+workouts (see synthetic.py), generated lazily so any history size fits, with
+keep-alive, gzip and ETag / If-None-Match like a real HTTP API. POSTs to
+/discord are accepted and kept, so a Lambda's webhook can point here.
+GET /_stats reports the API requests served, the bytes sent and the webhook
+messages.
+
+    python hevy_stand_in.py --workouts 1000 [--latency-ms 80]
+
+The first line printed is the base URL to use as HEVY_API_URL.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic import synthetic_workout
+
+# Workouts per workouts_batch page, as served by Hevy.
+PAGE_SIZE = 10
+
+
+class StandIn:
+    """
+    The state behind the handler: the history size and the counters.
+    """
+
+    def __init__(self, workouts: int, latency_ms: float = 0.0):
+        self.workouts = workouts
+        self.latency = latency_ms / 1000
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.messages = []
+        self.lock = threading.Lock()
+
+    @lru_cache(maxsize=4096)
+    def page(self, start_index: int) -> bytes:
+        end = min(self.workouts, start_index + PAGE_SIZE)
+        return json.dumps(
+            [synthetic_workout(i) for i in range(max(0, start_index), end)]
+        ).encode()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "not_modified": self.not_modified,
+                "bytes_sent": self.bytes_sent,
+                "messages": list(self.messages),
+            }
+
+
+def make_handler(stand_in: StandIn):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/_stats":
+                self._send(200, json.dumps(stand_in.stats()).encode())
+                return
+            if self.path == "/workout_count":
+                body = json.dumps({"workout_count": stand_in.workouts}).encode()
+            elif self.path.startswith("/workouts_batch/"):
+                body = stand_in.page(int(self.path.rsplit("/", 1)[1]))
+            else:
+                self._send(404, b"{}")
+                return
+
+            if stand_in.latency:
+                time.sleep(stand_in.latency)
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            with stand_in.lock:
+                stand_in.requests += 1
+            if self.headers.get("If-None-Match") == etag:
+                with stand_in.lock:
+                    stand_in.not_modified += 1
+                self._send(304, b"", {"ETag": etag})
+                return
+            headers = {"ETag": etag}
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=5)
+                headers["Content-Encoding"] = "gzip"
+            with stand_in.lock:
+                stand_in.bytes_sent += len(body)
+            self._send(200, body, headers)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            with stand_in.lock:
+                stand_in.messages.append(payload.get("content"))
+            self._send(204, b"")
+
+        def _send(self, status: int, body: bytes, headers: dict | None = None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def serve(workouts: int, latency_ms: float = 0.0, port: int = 0):
+    """
+    Starts the stand-in on a background thread.
+    Args:
+        workouts (int): The number of workouts in the history.
+        latency_ms (float): Delay added to every API response.
+        port (int): The port, a free one if 0.
+    Returns:
+        tuple[ThreadingHTTPServer, StandIn]: The server and its state.
+    """
+    stand_in = StandIn(workouts, latency_ms)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(stand_in))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stand_in
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workouts", type=int, default=1_000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    server, _ = serve(args.workouts, args.latency_ms, args.port)
+    print(f"http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
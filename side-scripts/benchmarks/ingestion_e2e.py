@@ -0,0 +1,233 @@
+"""
+End-to-end ingestion benchmark, offline: the Hevy API is the local stand-in
+(hevy_stand_in.py) and S3, DynamoDB and SSM are mocked with moto.
+
+For every history size two scenarios run, each in a fresh interpreter so
+the peak RSS is its own:
+
+- backfill: fetch_all_workouts.lambda_handler over the whole history,
+- fanout: the same history split into shards run by in-process workers
+  (the "fanout" mode with the local invoker; opt in with --scenarios),
+- recent: hevy_api_caller.fetch_recent_workouts picking up the last page.
+
+Reported per run: workouts/s, bytes and objects written to S3, Hevy API
+calls per workout and the peak RSS. moto keeps the bucket in memory and is
+much slower than S3, so the absolute figures are a floor; compare runs of
+this script with each other, not with production.
+
+    python ingestion_e2e.py --sizes 100,1000,10000 [--layout monthly]
+
+Run from side-scripts/benchmarks (see `make bench-ingestion`).
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+LAMBDAS_DIR = Path(__file__).resolve().parents[2] / "modules" / "lambdas"
+
+# fetch_recent_workouts reads one workouts_batch page.
+RECENT_WORKOUTS = 10
+
+BUCKET_NAME = "silka-benchmark"
+TABLE_NAME = "silka-benchmark-workouts"
+
+
+def create_resources() -> None:
+    """
+    Creates the mocked bucket and workouts table.
+    """
+    import boto3
+
+    boto3.client("s3").create_bucket(
+        Bucket=BUCKET_NAME,
+        CreateBucketConfiguration={"LocationConstraint": "eu-central-1"},
+    )
+    boto3.client("dynamodb").create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{"AttributeName": "index", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "index", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def bucket_usage() -> tuple[int, int]:
+    """
+    Returns:
+        tuple[int, int]: The bytes and the number of objects in the bucket.
+    """
+    import boto3
+
+    size = count = 0
+    paginator = boto3.client("s3").get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET_NAME):
+        for obj in page.get("Contents", []):
+            size += obj["Size"]
+            count += 1
+    return size, count
+
+
+def run_scenario(scenario: str, workouts: int) -> dict:
+    """
+    Runs one scenario against moto; called in the child interpreter.
+    Args:
+        scenario (str): "backfill", "fanout" or "recent".
+        workouts (int): The history size served by the stand-in.
+    Returns:
+        dict: workouts, seconds, bytes, objects and max_rss_mb.
+    """
+    from moto import mock_aws
+
+    sys.path[:0] = [
+        str(LAMBDAS_DIR / "fetch_all_workouts"),
+        str(LAMBDAS_DIR / "hevy_api_caller"),
+    ]
+    with mock_aws():
+        create_resources()
+        if scenario in ("backfill", "fanout"):
+            import fetch_all_workouts
+
+            event = {}
+            if scenario == "fanout":
+                event = {"mode": "fanout", "invoker": "local"}
+            started = time.perf_counter()
+            result = fetch_all_workouts.lambda_handler(event, None)
+            elapsed = time.perf_counter() - started
+            ingested = result["written"]
+        else:
+            import boto3
+            from silka_common.metadata import LATEST_WORKOUT_INDEX_PARAMETER
+
+            boto3.client("ssm").put_parameter(
+                Name=LATEST_WORKOUT_INDEX_PARAMETER,
+                Value=str(workouts - RECENT_WORKOUTS - 1),
+                Type="String",
+            )
+            import hevy_api_caller
+
+            started = time.perf_counter()
+            hevy_api_caller.fetch_recent_workouts()
+            elapsed = time.perf_counter() - started
+            ingested = min(RECENT_WORKOUTS, workouts)
+        size, count = bucket_usage()
+
+    return {
+        "workouts": ingested,
+        "seconds": elapsed,
+        "bytes": size,
+        "objects": count,
+        # ru_maxrss is in KiB on Linux.
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def measure(scenario: str, workouts: int, layout: str, latency_ms: float) -> dict:
+    """
+    Starts a stand-in and runs a scenario against it in a fresh interpreter.
+    Args:
+        scenario (str): "backfill", "fanout" or "recent".
+        workouts (int): The history size.
+        layout (str): The PARQUET_LAYOUT to ingest with.
+        latency_ms (float): Latency the stand-in adds to every API call.
+    Returns:
+        dict: As run_scenario(), plus api_calls and the webhook messages.
+    """
+    here = Path(__file__).resolve().parent
+    stand_in = subprocess.Popen(
+        [
+            sys.executable,
+            str(here / "hevy_stand_in.py"),
+            "--workouts",
+            str(workouts),
+            "--latency-ms",
+            str(latency_ms),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        base_url = stand_in.stdout.readline().strip()
+        env = dict(
+            os.environ,
+            HEVY_API_URL=base_url,
+            HEVY_TOKEN="benchmark",
+            # The client's rate limit would dominate; measure our side.
+            HEVY_RATE_LIMIT=os.environ.get("HEVY_RATE_LIMIT", "0"),
+            DISCORD_WEBHOOK=f"{base_url}/discord",
+            BUCKET_NAME=BUCKET_NAME,
+            DYNAMODB_TABLE_NAME=TABLE_NAME,
+            PARQUET_LAYOUT=layout,
+            AWS_DEFAULT_REGION="eu-central-1",
+            AWS_ACCESS_KEY_ID="testing",
+            AWS_SECRET_ACCESS_KEY="testing",
+        )
+        env.pop("ATHENA_DATABASE", None)
+        result = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--child",
+                scenario,
+                "--sizes",
+                str(workouts),
+            ],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        measured = json.loads(result.stdout.strip().splitlines()[-1])
+        with urllib.request.urlopen(f"{base_url}/_stats") as response:
+            stats = json.loads(response.read())
+    finally:
+        stand_in.terminate()
+        stand_in.wait()
+
+    measured["api_calls"] = stats["requests"]
+    measured["messages"] = stats["messages"]
+    return measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="100,1000")
+    parser.add_argument("--layout", default="per_workout")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--scenarios", default="backfill,recent")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, sizes[0])))
+        return
+
+    print(
+        f"{'scenario':9} {'history':>8} {'workouts':>8} {'wk/s':>8} "
+        f"{'MiB written':>11} {'objects':>8} {'calls/wk':>8} {'RSS MiB':>8}"
+    )
+    for workouts in sizes:
+        for scenario in args.scenarios.split(","):
+            run = measure(scenario, workouts, args.layout, args.latency_ms)
+            if scenario == "recent" and run["messages"][-1:] != [
+                "All missing workouts loaded."
+            ]:
+                raise SystemExit(f"fetch_recent_workouts failed: {run['messages']}")
+            print(
+                f"{scenario:9} {workouts:8} {run['workouts']:8} "
+                f"{run['workouts'] / run['seconds']:8.1f} "
+                f"{run['bytes'] / 2**20:11.2f} {run['objects']:8} "
+                f"{run['api_calls'] / max(1, run['workouts']):8.2f} "
+                f"{run['max_rss_mb']:8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark of the batch columnar normalizer against the per-workout
+normalize_workout_star_schema(), both on their own and followed by the
+Arrow build. Also checks that both produce the same tables.
+
+Run with modules/lambdas on PYTHONPATH (see `make bench-normalizer`).
+"""
+
+import argparse
+import time
+
+import pyarrow as pa
+
+from silka_common.arrow_schemas import build_arrow_table
+from silka_common.normalize import (
+    normalize_workout_star_schema,
+    normalize_workouts_columnar,
+)
+from silka_common.table_locations import STAR_SCHEMA_TABLES
+from synthetic import synthetic_workout
+
+
+def per_workout_rows(workouts: list[dict]) -> list[tuple]:
+    return [normalize_workout_star_schema(workout) for workout in workouts]
+
+
+def per_workout_tables(workouts: list[dict]) -> dict[str, pa.Table]:
+    rows = {table: [] for table in STAR_SCHEMA_TABLES}
+    for normalized in per_workout_rows(workouts):
+        for table, table_rows in zip(STAR_SCHEMA_TABLES, normalized):
+            rows[table].extend(table_rows)
+    return {table: build_arrow_table(rows[table], table) for table in rows}
+
+
+def batch_tables(workouts: list[dict]) -> dict[str, pa.Table]:
+    return normalize_workouts_columnar(workouts).to_arrow()
+
+
+def best_of(repeat: int, func, workouts: list[dict]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(workouts)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workouts", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workouts = [synthetic_workout(i) for i in range(args.workouts)]
+
+    expected, actual = per_workout_tables(workouts), batch_tables(workouts)
+    for table in STAR_SCHEMA_TABLES:
+        if not expected[table].equals(actual[table]):
+            raise SystemExit(f"The {table} tables differ.")
+    print(f"Identical tables for {args.workouts} workouts.")
+
+    per_workout = 1e6 / args.workouts
+    cases = [
+        ("normalize, per workout", per_workout_rows),
+        ("normalize, columnar", normalize_workouts_columnar),
+        ("normalize + arrow, per workout", per_workout_tables),
+        ("normalize + arrow, columnar", batch_tables),
+    ]
+    for label, func in cases:
+        elapsed = best_of(args.repeat, func, workouts)
+        print(f"{label:32} {elapsed * per_workout:8.1f} us/workout")
+
+
+if __name__ == "__main__":
+    main()
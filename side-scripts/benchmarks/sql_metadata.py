@@ -0,0 +1,198 @@
+"""
+Compares the sqlglot metadata extractor (silka_common/sql_metadata.py) with
+the regex extractor it replaced: how often they disagree on tables_used and
+columns_used, and the time per query uncached and from the LRU.
+
+The corpus is the sql_query column of the workout_queries LanceDB table
+when --lancedb (or BUCKET_NAME) points at it, else a built-in set of agent
+style queries:
+
+    python sql_metadata.py --lancedb s3://<bucket>/lancedb
+    python sql_metadata.py --repeat 20
+
+Run from side-scripts/benchmarks with modules/lambdas on PYTHONPATH (see
+`make bench-sql-metadata`).
+"""
+
+import argparse
+import os
+import re
+import time
+
+from silka_common.sql_metadata import _extract, extract_sql_metadata
+
+# Agent queries of the kinds stored in workout_queries.
+BUILTIN_CORPUS = [
+    "SELECT w.title, SUM(s.weight_kg * s.reps) AS total_volume FROM workouts w "
+    "JOIN sets s ON s.workout_id = w.id GROUP BY w.title "
+    "ORDER BY SUM(s.weight_kg * s.reps) DESC",
+    "SELECT DATE(FROM_UNIXTIME(CAST(w.start_time AS DOUBLE))) AS workout_date, "
+    "s.weight_kg, s.reps FROM workouts w JOIN performed_exercises e "
+    "ON e.workout_id = w.id JOIN sets s ON s.exercise_id = e.id "
+    "WHERE LOWER(e.title) LIKE LOWER('%leg press%') AND w.year = 2024",
+    "WITH weekly AS (SELECT week(from_unixtime(start_time)) AS wk, "
+    "COUNT(*) AS sessions FROM workouts WHERE year = 2024 "
+    "GROUP BY week(from_unixtime(start_time))) "
+    "SELECT wk, sessions FROM weekly ORDER BY wk",
+    "SELECT e.title, MAX(s.weight_kg) AS best FROM performed_exercises e "
+    "JOIN sets s ON s.exercise_id = e.id JOIN exercise_catalog c "
+    "ON c.id = e.exercise_template_id WHERE LOWER(c.muscle_group) "
+    "LIKE LOWER('%chest%') GROUP BY e.title",
+    "SELECT t.title, t.volume FROM (SELECT w.title, SUM(s.weight_kg * s.reps) "
+    "AS volume FROM workouts w JOIN sets s ON s.workout_id = w.id "
+    "GROUP BY w.title) t WHERE t.volume > 1000",
+    "SELECT format_datetime(from_unixtime(start_time), 'HH:mm') AS start, "
+    "title FROM workouts WHERE month = 3 ORDER BY start_time DESC LIMIT 10",
+    "SELECT e.title, ROW_NUMBER() OVER (PARTITION BY e.workout_id "
+    "ORDER BY e.index) AS position FROM performed_exercises e",
+]
+
+
+def legacy_extract(sql_query: str) -> dict:
+    """
+    The removed extract_sql_metadata_regex, kept as the baseline.
+    """
+    tables = set()
+    columns = set()
+
+    # Extract table names from FROM and JOIN clauses (excluding aliases)
+    from_pattern = r"FROM\s+([a-zA-Z_][a-zA-Z0-9_]*)"
+    join_pattern = r"JOIN\s+([a-zA-Z_][a-zA-Z0-9_]*)"
+
+    from_matches = re.findall(from_pattern, sql_query, re.IGNORECASE)
+    join_matches = re.findall(join_pattern, sql_query, re.IGNORECASE)
+
+    tables.update(from_matches)
+    tables.update(join_matches)
+
+    # Build alias mapping to exclude them
+    alias_pattern = r"FROM\s+([a-zA-Z_][a-zA-Z0-9_]*)\s+([a-zA-Z_][a-zA-Z0-9_]*)|JOIN\s+([a-zA-Z_][a-zA-Z0-9_]*)\s+([a-zA-Z_][a-zA-Z0-9_]*)"
+    alias_matches = re.findall(alias_pattern, sql_query, re.IGNORECASE)
+
+    # Create set of known aliases
+    aliases = set()
+    for match in alias_matches:
+        if match[1]:  # FROM table alias
+            aliases.add(match[1])
+        if match[3]:  # JOIN table alias
+            aliases.add(match[3])
+
+    # Extract column names from table.column patterns (excluding aliases)
+    column_pattern = r"\b([a-zA-Z_][a-zA-Z0-9_]*)\s*\.\s*([a-zA-Z_][a-zA-Z0-9_]*)"
+    table_column_matches = re.findall(column_pattern, sql_query)
+
+    for table_alias, column in table_column_matches:
+        if table_alias not in ("DATE", "FROM_UNIXTIME", "CAST", "LOWER", "SUM"):
+            # Only add the column, never add aliases to columns
+            columns.add(column)
+            # Only add table name if it's not an alias
+            if table_alias not in aliases:
+                tables.add(table_alias)
+
+    # Extract standalone column names from SELECT (excluding AS aliases and table.column patterns)
+    select_pattern = r"SELECT\s+(.*?)\s+FROM"
+    select_match = re.search(select_pattern, sql_query, re.IGNORECASE | re.DOTALL)
+    if select_match:
+        select_clause = select_match.group(1)
+
+        # Remove AS aliases from select clause
+        select_clause = re.sub(
+            r"\s+AS\s+[a-zA-Z_][a-zA-Z0-9_]*", "", select_clause, flags=re.IGNORECASE
+        )
+
+        # Remove table.column patterns to avoid picking up table aliases
+        select_clause = re.sub(
+            r"\b[a-zA-Z_][a-zA-Z0-9_]*\s*\.\s*[a-zA-Z_][a-zA-Z0-9_]*", "", select_clause
+        )
+
+        # Extract simple column names (standalone, not prefixed)
+        simple_columns = re.findall(r"\b([a-zA-Z_][a-zA-Z0-9_]*)\b", select_clause)
+        for col in simple_columns:
+            if (
+                col.upper()
+                not in (
+                    "DATE",
+                    "FROM_UNIXTIME",
+                    "CAST",
+                    "AS",
+                    "DOUBLE",
+                    "SUM",
+                    "LOWER",
+                    "TOTAL_VOLUME",
+                )
+                and col not in aliases  # Exclude known aliases
+            ):
+                columns.add(col)
+
+    return {
+        "tables_used": list(tables),
+        "columns_used": list(columns),
+        "query_type": ["SELECT"],
+    }
+
+
+def load_corpus(lancedb_path: str | None) -> list[str]:
+    """
+    Returns:
+        list[str]: The stored agent queries, or BUILTIN_CORPUS.
+    """
+    if not lancedb_path:
+        return BUILTIN_CORPUS
+    import lancedb
+
+    table = lancedb.connect(lancedb_path).open_table("workout_queries")
+    queries = [str(query) for query in table.to_pandas()["sql_query"] if query]
+    print(f"{len(queries)} queries from {lancedb_path}")
+    return queries
+
+
+def per_query_us(func, queries: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            func(query)
+    return (time.perf_counter() - start) / (repeat * len(queries)) * 1e6
+
+
+def uncached(query: str) -> dict:
+    _extract.cache_clear()
+    return extract_sql_metadata(query)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    bucket = os.environ.get("BUCKET_NAME")
+    parser.add_argument(
+        "--lancedb", default=f"s3://{bucket}/lancedb" if bucket else None
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--show", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = load_corpus(args.lancedb)
+    differences = []
+    for query in queries:
+        old, new = legacy_extract(query), extract_sql_metadata(query)
+        for field in ("tables_used", "columns_used"):
+            removed = sorted(set(old[field]) - set(new[field]))
+            added = sorted(set(new[field]) - set(old[field]))
+            if removed or added:
+                differences.append((query, field, removed, added))
+    disagreeing = len({query for query, *_ in differences})
+    print(f"{disagreeing}/{len(queries)} queries with different metadata")
+    for query, field, removed, added in differences[: args.show]:
+        print(
+            f"  {query[:70]}...\n    {field}: regex only {removed}, parser only {added}"
+        )
+
+    cases = [
+        ("regex", legacy_extract),
+        ("sqlglot, uncached", uncached),
+        ("sqlglot, LRU", extract_sql_metadata),
+    ]
+    for label, func in cases:
+        print(f"{label:20} {per_query_us(func, queries, args.repeat):10.1f} us/query")
+
+
+if __name__ == "__main__":
+    main()
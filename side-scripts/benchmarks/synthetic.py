@@ -0,0 +1,104 @@
+"""
+Synthetic Hevy workouts for the benchmarks, shaped like the payloads of
+GET /v1/workouts (including the fields the normalizer discards).
+"""
+
+import random
+
+EXERCISES = [
+    ("Squat (Barbell)", "barbell", "quadriceps"),
+    ("Bench Press (Barbell)", "barbell", "chest"),
+    ("Deadlift (Barbell)", "barbell", "hamstrings"),
+    ("Pull Up", "none", "lats"),
+    ("Lateral Raise (Dumbbell)", "dumbbell", "shoulders"),
+    ("Running", "none", "cardio"),
+]
+
+FIRST_START_TIME = 1_577_880_000  # 2020-01-01
+
+
+def synthetic_workout(index: int, seed: int = 0) -> dict:
+    """
+    Builds a deterministic synthetic workout.
+    Args:
+        index (int): The workout index; also drives the start time (one per day).
+        seed (int): Seed mixed into the random generator.
+    Returns:
+        dict: The workout.
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    start_time = FIRST_START_TIME + index * 86_400 + rng.randint(0, 36_000)
+    exercises = []
+    for position in range(rng.randint(3, 7)):
+        title, equipment, muscle = rng.choice(EXERCISES)
+        exercise_id = f"{index:06d}-{position}"
+        sets = []
+        for set_index in range(rng.randint(2, 5)):
+            sets.append(
+                {
+                    "id": f"{exercise_id}-{set_index}",
+                    "index": set_index,
+                    "indicator": "normal",
+                    "reps": rng.randint(3, 12),
+                    "weight_kg": round(rng.uniform(10, 180), 1),
+                    "rpe": rng.choice([None, 7, 7.5, 8, 9]),
+                    "distance_meters": None,
+                    "duration_seconds": None,
+                    "prs": [],
+                    "personalRecords": [],
+                    "custom_metric": None,
+                    "completed_at": None,
+                }
+            )
+        exercises.append(
+            {
+                "id": exercise_id,
+                "title": title,
+                "de_title": title,
+                "es_title": title,
+                "index": position,
+                "priority": 0,
+                "notes": "",
+                "url": "",
+                "exercise_type": "weight_reps",
+                "equipment_category": equipment,
+                "exercise_template_id": f"T{rng.randint(1, 400)}",
+                "muscle_group": muscle,
+                "other_muscles": [],
+                "rest_seconds": 90,
+                "superset_id": None,
+                "media_type": "video",
+                "thumbnail_url": "",
+                "sets": sets,
+            }
+        )
+    return {
+        "id": f"workout-{seed}-{index:06d}",
+        "short_id": f"s{index}",
+        "index": index,
+        "name": f"Workout {index}",
+        "description": "",
+        "start_time": start_time,
+        "end_time": start_time + rng.randint(1_800, 5_400),
+        "created_at": "2024-01-01T00:00:00.000Z",
+        "updated_at": "2024-01-01T00:00:00.000Z",
+        "routine_id": rng.choice([None, "routine-1", "routine-2"]),
+        "nth_workout": index + 1,
+        "comment_count": 0,
+        "like_count": 0,
+        "estimated_volume_kg": round(rng.uniform(1_000, 20_000), 1),
+        "user_id": "user",
+        "username": "user",
+        "profile_image": "",
+        "verified": False,
+        "is_private": False,
+        "is_liked_by_user": False,
+        "apple_watch": False,
+        "wearos_watch": False,
+        "media": [],
+        "image_urls": [],
+        "comments": [],
+        "like_images": [],
+        "preview_workout_likes": [],
+        "exercises": exercises,
+    }
@@ -27,6 +27,29 @@ json = [
     {
         "name": "fetch_workouts",
         "description": "Fetching missing workouts to the S3 bucket.",
+        "options": [
+            {
+                "name": "otp",
+                "description": "6-digit one time password for authentication",
+                "type": 4,
+                "required": True,
+            },
+            {
+                "name": "if_running",
+                "description": "what to do if a fetch is already running",
+                "type": 3,
+                "required": False,
+                "choices": [
+                    {"name": "wait", "value": "wait"},
+                    {"name": "coalesce", "value": "coalesce"},
+                    {"name": "exit", "value": "exit"},
+                ],
+            },
+        ],
+    },
+    {
+        "name": "compact",
+        "description": "Merge small Parquet files into one file per month.",
         "options": [
             {
                 "name": "otp",
@@ -36,6 +59,24 @@ json = [
             }
         ],
     },
+    {
+        "name": "sync_workouts",
+        "description": "Rewrite the recent workouts edited since the last sync.",
+        "options": [
+            {
+                "name": "otp",
+                "description": "6-digit one time password for authentication",
+                "type": 4,
+                "required": True,
+            },
+            {
+                "name": "lookback",
+                "description": "how many recent workouts to re-read, or 'all'",
+                "type": 3,
+                "required": False,
+            },
+        ],
+    },
     {
         "name": "print_latest_workout",
         "description": "Print the latest workout",